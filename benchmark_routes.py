@@ -0,0 +1,89 @@
+import csv
+import random
+import time
+from pathlib import Path
+
+from PIL import Image
+
+import tsp_solver
+from map_processor import MapProcessor
+
+
+def build_test_warehouse(width=600, height=400):
+    """Синтетический склад с разметкой стеллажей для замеров"""
+    processor = MapProcessor()
+    processor.width, processor.height = width, height
+    processor.original_image = Image.new("RGB", (width, height), "white")
+    processor.scale = 0.05
+    processor.robot_radius_meters = 0.1
+    processor._update_robot_radius_pixels()
+
+    processor.walls = [
+        (0, 0, width - 1, 0), (0, height - 1, width - 1, height - 1),
+        (0, 0, 0, height - 1), (width - 1, 0, width - 1, height - 1),
+    ]
+    for row in range((height - 60) // 115):
+        for col in range((width - 60) // 65):
+            x = 40 + col * 65
+            y = 40 + row * 115
+            processor.shelves.append((x, y, x + 20, y + 80))
+    processor._rebuild_grid()
+    return processor
+
+
+def random_picks(processor, count, rng):
+    """Случайные точки доступа у стеллажей"""
+    picks = set()
+    while len(picks) < count:
+        x1, y1, x2, y2 = rng.choice(processor.shelves)
+        x = rng.choice([x1, x2])
+        y = rng.randint(y1, y2)
+        access = processor.find_nearest_walkable(x, y)
+        if access:
+            picks.add(access)
+    return sorted(picks)
+
+
+def benchmark_route_solver(sizes=(50, 100, 200, 300), budgets=(0.05, 0.2, 1.0, 3.0), seed=42,
+                           output="output/benchmarks/route_solver.csv"):
+    """Кривые качество/время anytime-решателя в сравнении с жадным алгоритмом"""
+    rng = random.Random(seed)
+    processor = build_test_warehouse()
+    start, end = (10, 10), (processor.width - 11, processor.height - 11)
+    rows = []
+
+    for size in sizes:
+        points = random_picks(processor, size, rng)
+        nodes = [start] + points + [end]
+
+        t0 = time.perf_counter()
+        table = processor.compute_distance_table(nodes)
+        matrix_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        greedy = tsp_solver.nearest_neighbor_path(table, 0, size + 1)
+        greedy_cost = tsp_solver.path_cost(table, greedy) * processor.scale
+        greedy_time = time.perf_counter() - t0
+        print(f"{size} точек: матрица {matrix_time:.2f}с, жадный {greedy_cost:.1f}м за {greedy_time * 1000:.1f}мс")
+        rows.append([size, "greedy", 0, round(greedy_time, 4), round(greedy_cost, 2), 0.0])
+
+        for budget in budgets:
+            t0 = time.perf_counter()
+            _, cost = tsp_solver.solve_path_anytime(table, 0, size + 1, budget, seed=seed)
+            elapsed = time.perf_counter() - t0
+            cost *= processor.scale
+            gain = (1 - cost / greedy_cost) * 100 if greedy_cost > 0 else 0.0
+            print(f"  anytime {budget:>5.2f}с: {cost:.1f}м (-{gain:.1f}%) за {elapsed:.2f}с")
+            rows.append([size, "anytime", budget, round(elapsed, 4), round(cost, 2), round(gain, 2)])
+
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Точек", "Решатель", "Бюджет, с", "Время, с", "Длина, м", "Выигрыш, %"])
+        writer.writerows(rows)
+    print(f"Результаты сохранены: {output}")
+    return rows
+
+
+if __name__ == "__main__":
+    benchmark_route_solver()
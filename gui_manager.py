@@ -1,15 +1,19 @@
 import json
 import math
+import queue
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tkinter import filedialog, messagebox, simpledialog, ttk
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageTk
+from PIL import Image, ImageTk
 
-from map_processor import MapProcessor
+from map_processor import MapProcessor, compress_path, expand_path
 from route_optimizer import RouteOptimizer
+from route_renderer import RouteImageCache, RouteRenderer
+from tile_renderer import TileRenderer
 
 
 class WarehouseGUI:
@@ -19,8 +23,20 @@ class WarehouseGUI:
         self.route_optimizer = RouteOptimizer()
 
         self.canvas = None
-        self.photo_image = None
         self.map_image = None
+        # Тайлы карты: отрисовщик с пирамидой масштабов и тайлы на холсте
+        # (tx, ty) -> (элемент, PhotoImage, окончательное качество)
+        self.tile_renderer = None
+        self.tile_source = None
+        self.tile_items = {}
+        # Фоновая качественная отрисовка: поколение растет при смене масштаба, результаты
+        # прежних поколений отбрасываются
+        self.tile_generation = 0
+        self.refine_job = None
+        self.refine_batches = 0
+        self.refining = set()
+        self.tile_results = queue.Queue()
+        self.tile_executor = ThreadPoolExecutor(max_workers=1)
         self.scale_points = []
         self.start_point = None
         self.end_point = None
@@ -35,17 +51,17 @@ class WarehouseGUI:
         # Для рисования стеллажей
         self.temp_rect_start = None
 
+        # Для масштабирования карты
+        self.zoom_factor = 1.0
+        self.min_zoom = 0.1
+        self.max_zoom = 5.0
+
         self.setup_ui()
 
         self.optimized_samples = None
 
         self.auto_load_last_config()
 
-        # Для масштабирования карты
-        self.zoom_factor = 1.0
-        self.min_zoom = 0.1
-        self.max_zoom = 5.0
-
     def setup_ui(self):
         # Панель управления - первая строка
         control_frame1 = tk.Frame(self.root)
@@ -79,9 +95,14 @@ class WarehouseGUI:
         self.generate_limited_btn = tk.Button(control_frame3, text="Генерировать с ограничениями", 
                                             command=self.generate_routes_with_limits, bg="lightblue")
         self.generate_limited_btn.pack(side=tk.LEFT, padx=2)
+        tk.Button(control_frame3, text="Генерировать рейсами", command=self.generate_wave_routes).pack(side=tk.LEFT, padx=2)
         
         tk.Button(control_frame3, text="Сохранить товары", command=self.save_products).pack(side=tk.LEFT, padx=2)
         tk.Button(control_frame3, text="Просмотр маршрутов", command=self.view_routes).pack(side=tk.LEFT, padx=2)
+        # Без отметки при генерации сохраняются только данные, изображения рисуются по запросу
+        self.render_images_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(control_frame3, text="Рисовать изображения",
+                       variable=self.render_images_var).pack(side=tk.LEFT, padx=2)
 
         # Информационная панель
         info_frame = tk.Frame(self.root)
@@ -102,14 +123,15 @@ class WarehouseGUI:
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         # Скроллбары
-        v_scrollbar = tk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        v_scrollbar = tk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.scroll_y)
         v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        h_scrollbar = tk.Scrollbar(self.root, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        h_scrollbar = tk.Scrollbar(self.root, orient=tk.HORIZONTAL, command=self.scroll_x)
         h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
 
         self.canvas.config(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
         self.canvas.bind("<Button-1>", self.on_canvas_click)
         self.canvas.bind("<Motion>", self.on_mouse_move)
+        self.canvas.bind("<Configure>", lambda event: self.show_tiles())
         # Привязка событий колеса мыши
         self.canvas.bind("<MouseWheel>", self.on_mousewheel)  # Windows
         self.canvas.bind("<Button-4>", self.on_mousewheel)    # Linux scroll up
@@ -148,23 +170,54 @@ class WarehouseGUI:
                 self.zoom_factor = max(self.min_zoom, self.zoom_factor / 1.2)
             
             if self.zoom_factor != old_zoom:
-                # Получаем позицию курсора на канвасе
-                canvas_x = self.canvas.canvasx(event.x)
-                canvas_y = self.canvas.canvasy(event.y)
-                
-                self.display_map()
-                
-                # Центрируем вид на точке курсора
-                self.canvas.scan_mark(int(event.x), int(event.y))
-                self.canvas.scan_dragto(int(event.x), int(event.y), gain=1)
+                # Точка карты под курсором остается на месте
+                map_x = self.canvas.canvasx(event.x) / old_zoom
+                map_y = self.canvas.canvasy(event.y) / old_zoom
+
+                # Векторные слои и временные элементы масштабируются вместе с картой
+                ratio = self.zoom_factor / old_zoom
+                self.tile_generation += 1
+                self.refining.clear()
+                self.canvas.delete("tile")
+                self.tile_items = {}
+                self.canvas.scale("all", 0, 0, ratio, ratio)
+
+                self.scroll_to(map_x * self.zoom_factor - event.x, map_y * self.zoom_factor - event.y)
         
         # Shift + колесо = горизонтальная прокрутка
         elif event.state & 0x1:  # Shift pressed
-            self.canvas.xview_scroll(-delta * 3, "units")
+            self.scroll_x("scroll", -delta * 3, "units")
         
         # Обычная прокрутка по вертикали
         else:
-            self.canvas.yview_scroll(-delta * 3, "units")
+            self.scroll_y("scroll", -delta * 3, "units")
+
+    def scroll_x(self, *args):
+        self.canvas.xview(*args)
+        self.show_tiles()
+
+    def scroll_y(self, *args):
+        self.canvas.yview(*args)
+        self.show_tiles()
+
+    def scroll_to(self, left: float, top: float):
+        """Прокрутка так, чтобы точка холста (left, top) оказалась в левом верхнем углу"""
+        if self.tile_renderer is None:
+            return
+        width, height = self.tile_renderer.display_size(self.zoom_factor)
+        self.canvas.config(scrollregion=(0, 0, width, height))
+        self.canvas.xview_moveto(max(0.0, left) / width)
+        self.canvas.yview_moveto(max(0.0, top) / height)
+        self.show_tiles()
+
+    def to_map(self, event):
+        """Координаты события на карте (с учетом прокрутки и масштаба)"""
+        return (self.canvas.canvasx(event.x) / self.zoom_factor,
+                self.canvas.canvasy(event.y) / self.zoom_factor)
+
+    def to_canvas(self, x: float, y: float):
+        """Координаты точки карты на холсте"""
+        return x * self.zoom_factor, y * self.zoom_factor
 
     def draw_walls_mode(self):
         """Режим рисования стен"""
@@ -191,16 +244,17 @@ class WarehouseGUI:
                 x1, y1 = self.current_wall_chain[i]
                 x2, y2 = self.current_wall_chain[i + 1]
                 self.map_processor.add_wall_line(int(x1), int(y1), int(x2), int(y2))
+                self.draw_wall((int(x1), int(y1), int(x2), int(y2)))
         
         self.current_wall_chain = []
         self.temp_line_start = None
-        self.display_map()
     
     def clear_markup(self):
         """Очистка разметки"""
         if messagebox.askyesno("Подтверждение", "Очистить всю разметку (стены и стеллажи)?"):
             self.map_processor.clear_markup()
-            self.display_map()
+            self.canvas.delete("wall")
+            self.canvas.delete("shelf")
             self.info_label.config(text="Разметка очищена")
     
     def save_markup(self):
@@ -311,7 +365,6 @@ class WarehouseGUI:
             self.info_label.config(
                 text=f"Радиус робота: {radius:.2f} м ({self.map_processor.robot_radius_pixels} пикселей)"
             )
-            self.display_map()
 
     def set_scale_mode(self):
         self.mode = "scale"
@@ -338,8 +391,8 @@ class WarehouseGUI:
         total_count = len(self.route_optimizer.products)
         
         # Подсчет товаров с количеством > 0
-        with_amount = sum(1 for p in self.route_optimizer.products.values() if p.amount > 0)
-        total_amount = sum(p.amount for p in self.route_optimizer.products.values())
+        with_amount = int((self.route_optimizer.table.amount > 0).sum())
+        total_amount = int(self.route_optimizer.table.amount.sum())
 
         info_frame = tk.Frame(selector)
         info_frame.pack(padx=10, pady=5)
@@ -402,7 +455,7 @@ class WarehouseGUI:
         
         info_text = f"Размещено товаров: {placed_count}/{total_count}, доступно: {access_count}"
         if self.route_optimizer.has_amount_data():
-            with_amount = sum(1 for p in self.route_optimizer.products.values() if p.amount > 0)
+            with_amount = int((self.route_optimizer.table.amount > 0).sum())
             info_text += f", с количеством: {with_amount}"
             
         self.info_label.config(text=info_text)
@@ -412,7 +465,6 @@ class WarehouseGUI:
         self.start_point = None
         self.end_point = None
         self.canvas.delete("route_point")
-        self.display_map()
         self.info_label.config(
             text="Кликните в ПРОХОДЕ (белая область) для установки точки СТАРТА"
         )
@@ -426,6 +478,7 @@ class WarehouseGUI:
             try:
                 self.current_products_path = filepath
                 self.route_optimizer.load_products(filepath)
+                self.refresh_access_candidates()
                 self.display_map()
                 self.update_status()  # Важно обновить статус после загрузки
                 
@@ -435,8 +488,8 @@ class WarehouseGUI:
                 
                 info_text = f"Загружено товаров: {count}, размещено: {placed}, с доступом: {access_count}"
                 if self.route_optimizer.has_amount_data():
-                    with_amount = sum(1 for p in self.route_optimizer.products.values() if p.amount > 0)
-                    total_amount = sum(p.amount for p in self.route_optimizer.products.values())
+                    with_amount = int((self.route_optimizer.table.amount > 0).sum())
+                    total_amount = int(self.route_optimizer.table.amount.sum())
                     info_text += f", с количеством: {with_amount}, общее количество: {total_amount}"
                     
                 self.info_label.config(text=info_text)
@@ -444,6 +497,15 @@ class WarehouseGUI:
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Не удалось загрузить товары: {e}")
 
+    def refresh_access_candidates(self):
+        """Поиск дополнительных точек доступа, если в файле товаров их нет"""
+        if self.map_processor.grid is None:
+            return
+        if any(len(options) > 1 for options in self.route_optimizer.access_candidates.values()):
+            return
+        search_radius = max(50, self.map_processor.robot_radius_pixels * 3)
+        self.route_optimizer.update_access_candidates(self.map_processor, max_radius=search_radius)
+
     def save_products(self):
         filepath = filedialog.asksaveasfilename(
             title="Сохранить товары",
@@ -458,12 +520,12 @@ class WarehouseGUI:
                 messagebox.showerror("Ошибка", f"Не удалось сохранить: {e}")
 
     def on_canvas_click(self, event):
-        x = self.canvas.canvasx(event.x)
-        y = self.canvas.canvasy(event.y)
+        x, y = self.to_map(event)
 
         if self.mode == "scale":
             self.scale_points.append((x, y))
-            self.canvas.create_oval(x - 3, y - 3, x + 3, y + 3, fill="red", tags="scale")
+            cx, cy = self.to_canvas(x, y)
+            self.canvas.create_oval(cx - 3, cy - 3, cx + 3, cy + 3, fill="red", tags="scale")
 
             if len(self.scale_points) == 2:
                 pixel_dist = math.sqrt(
@@ -486,23 +548,24 @@ class WarehouseGUI:
 
         elif self.mode == "draw_walls":
             ix, iy = int(x), int(y)
+            cx, cy = self.to_canvas(ix, iy)
             
             if not self.temp_line_start:
                 # Начинаем новую линию
                 self.temp_line_start = (ix, iy)
                 self.current_wall_chain.append((ix, iy))
-                self.canvas.create_oval(ix - 2, iy - 2, ix + 2, iy + 2, fill="red", tags="temp_wall")
+                self.canvas.create_oval(cx - 2, cy - 2, cx + 2, cy + 2, fill="red", tags="temp_wall")
             else:
                 # Заканчиваем линию
                 self.current_wall_chain.append((ix, iy))
                 
                 # Рисуем линию
                 self.canvas.create_line(
-                    self.temp_line_start[0], self.temp_line_start[1], 
-                    ix, iy, 
+                    *self.to_canvas(*self.temp_line_start),
+                    cx, cy,
                     fill="red", width=2, tags="temp_wall"
                 )
-                self.canvas.create_oval(ix - 2, iy - 2, ix + 2, iy + 2, fill="red", tags="temp_wall")
+                self.canvas.create_oval(cx - 2, cy - 2, cx + 2, cy + 2, fill="red", tags="temp_wall")
                 
                 # Проверяем замыкание (клик рядом с первой точкой)
                 if len(self.current_wall_chain) > 2:
@@ -511,7 +574,7 @@ class WarehouseGUI:
                     if dist < 10:  # Замыкаем если близко к первой точке
                         self.current_wall_chain.append(first_point)
                         self.canvas.create_line(
-                            ix, iy, first_point[0], first_point[1],
+                            cx, cy, *self.to_canvas(*first_point),
                             fill="red", width=2, tags="temp_wall"
                         )
                         self.save_wall_chain()
@@ -527,7 +590,8 @@ class WarehouseGUI:
             if not self.temp_rect_start:
                 # Начинаем прямоугольник
                 self.temp_rect_start = (ix, iy)
-                self.canvas.create_oval(ix - 2, iy - 2, ix + 2, iy + 2, fill="blue", tags="temp_shelf")
+                cx, cy = self.to_canvas(ix, iy)
+                self.canvas.create_oval(cx - 2, cy - 2, cx + 2, cy + 2, fill="blue", tags="temp_shelf")
                 self.info_label.config(text="Кликните вторую точку для завершения прямоугольника")
             else:
                 # Заканчиваем прямоугольник
@@ -535,7 +599,7 @@ class WarehouseGUI:
                 x2, y2 = ix, iy
                 
                 self.map_processor.add_shelf_rect(x1, y1, x2, y2)
-                self.display_map()
+                self.draw_shelf((min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
                 
                 self.temp_rect_start = None
                 self.canvas.delete("temp_shelf")
@@ -544,8 +608,9 @@ class WarehouseGUI:
         elif self.mode == "remove_shelf":
             ix, iy = int(x), int(y)
             
+            shelf = self.map_processor.shelf_at(ix, iy)
             if self.map_processor.remove_shelf_at(ix, iy):
-                self.display_map()
+                self.remove_shelf_items(shelf)
                 self.info_label.config(text="Стеллаж удален. Кликните на другой стеллаж для удаления")
             else:
                 self.info_label.config(text="Стеллаж не найден. Кликните точно на синий прямоугольник")
@@ -559,8 +624,9 @@ class WarehouseGUI:
             if self.map_processor.is_shelf(ix, iy):
                 access = self.map_processor.find_nearest_walkable(ix, iy, max_radius=search_radius)
                 if access:
-                    self.route_optimizer.place_product(self.selected_product_id, ix, iy, access)
-                    self.display_map()
+                    candidates = self.map_processor.find_access_candidates(ix, iy, max_radius=search_radius)
+                    self.route_optimizer.place_product(self.selected_product_id, ix, iy, access, candidates)
+                    self.draw_product(self.selected_product_id)
                     self.info_label.config(text=f"Товар размещен на стеллаже с точкой доступа")
                     self.show_product_selector()
                 else:
@@ -576,24 +642,19 @@ class WarehouseGUI:
                     
                     messagebox.showwarning("Диагностика доступа", error_msg)
             else:
+                # Привязка к ближайшей точке стеллажа по индексу стеллажей
                 found = False
-                for r in range(1, search_radius):
-                    for dx in range(-r, r + 1):
-                        for dy in range(-r, r + 1):
-                            sx, sy = ix + dx, iy + dy
-                            if self.map_processor.is_shelf(sx, sy):
-                                access = self.map_processor.find_nearest_walkable(sx, sy, max_radius=search_radius)
-                                if access:
-                                    self.route_optimizer.place_product(self.selected_product_id, sx, sy, access)
-                                    self.display_map()
-                                    self.info_label.config(text=f"Товар размещен на ближайшем стеллаже с точкой доступа")
-                                    self.show_product_selector()
-                                    found = True
-                                    break
-                        if found:
-                            break
-                    if found:
-                        break
+                snapped = self.map_processor.nearest_shelf_point(ix, iy, max_radius=search_radius)
+                if snapped:
+                    sx, sy = snapped
+                    access = self.map_processor.find_nearest_walkable(sx, sy, max_radius=search_radius)
+                    if access:
+                        candidates = self.map_processor.find_access_candidates(sx, sy, max_radius=search_radius)
+                        self.route_optimizer.place_product(self.selected_product_id, sx, sy, access, candidates)
+                        self.draw_product(self.selected_product_id)
+                        self.info_label.config(text=f"Товар размещен на ближайшем стеллаже с точкой доступа")
+                        self.show_product_selector()
+                        found = True
 
                 if not found:
                     messagebox.showwarning("Внимание", "Кликните ближе к стеллажу (синий прямоугольник)")
@@ -604,7 +665,7 @@ class WarehouseGUI:
             if not self.start_point:
                 if self.map_processor.is_walkable(ix, iy, check_radius=False):
                     self.start_point = (ix, iy)
-                    self.display_map()
+                    self.draw_route_points()
                     self.info_label.config(
                         text="Кликните в ПРОХОДЕ для установки точки ФИНИША"
                     )
@@ -612,7 +673,7 @@ class WarehouseGUI:
                     nearest = self.map_processor.find_nearest_walkable(ix, iy, max_radius=10)
                     if nearest:
                         self.start_point = nearest
-                        self.display_map()
+                        self.draw_route_points()
                         self.info_label.config(
                             text="Кликните в ПРОХОДЕ для установки точки ФИНИША"
                         )
@@ -625,7 +686,7 @@ class WarehouseGUI:
             elif not self.end_point:
                 if self.map_processor.is_walkable(ix, iy, check_radius=False):
                     self.end_point = (ix, iy)
-                    self.display_map()
+                    self.draw_route_points()
                     self.info_label.config(
                         text=f"Старт: {self.start_point}, Финиш: {self.end_point}"
                     )
@@ -635,7 +696,7 @@ class WarehouseGUI:
                     nearest = self.map_processor.find_nearest_walkable(ix, iy, max_radius=10)
                     if nearest:
                         self.end_point = nearest
-                        self.display_map()
+                        self.draw_route_points()
                         self.info_label.config(
                             text=f"Старт: {self.start_point}, Финиш: {self.end_point}"
                         )
@@ -648,8 +709,7 @@ class WarehouseGUI:
                         )
 
     def on_mouse_move(self, event):
-        x = self.canvas.canvasx(event.x)
-        y = self.canvas.canvasy(event.y)
+        x, y = self.to_map(event)
         ix, iy = int(x), int(y)
 
         if 0 <= ix < self.map_processor.width and 0 <= iy < self.map_processor.height:
@@ -670,62 +730,225 @@ class WarehouseGUI:
                     )
                     self.info_label.config(text=f"({ix}, {iy}) - {status}, {walkable}")
             elif self.mode == "remove_shelf":
-                if self.map_processor.is_shelf(ix, iy):
-                    self.info_label.config(text=f"({ix}, {iy}) - стеллаж (кликните для удаления)")
+                shelf = self.map_processor.shelf_at(ix, iy)
+                if shelf:
+                    on_shelf = len(self.route_optimizer.products_on_shelf(shelf))
+                    self.info_label.config(
+                        text=f"({ix}, {iy}) - стеллаж, товаров на нем: {on_shelf} (кликните для удаления)"
+                    )
                 else:
                     self.info_label.config(text=f"({ix}, {iy}) - не стеллаж")
 
-    def display_map(self):
-        if self.map_processor.original_image is None:
-            return
+    # Новые тайлы сразу показываются быстрым предпросмотром, качественные рисуются в фоне
+    # после паузы в прокрутке и масштабировании
+    PREVIEW_RESAMPLE = Image.Resampling.NEAREST
+    FINAL_RESAMPLE = Image.Resampling.LANCZOS
+    REFINE_DELAY_MS = 150
+    POLL_MS = 30
+    # Слои холста снизу вверх: растровая подложка и векторные элементы поверх нее
+    LAYERS = ("tile", "wall", "shelf", "product", "route_point", "route_preview")
 
-        # Получаем изображение с разметкой
-        img = self.map_processor.get_markup_image()
-        if img is None:
+    def display_map(self):
+        """Полная перерисовка карты
+
+        Холст состоит из слоев (LAYERS). Нижний - тайлы исходной карты без разметки: пирамида
+        масштабов строится один раз на изображение, тайлы выводятся только для видимой области.
+        Стены, стеллажи, товары, старт/финиш и просмотр маршрута - элементы холста с тегом слоя
+        в координатах карты, умноженных на масштаб; при изменении одного объекта обновляются
+        только его элементы (draw_wall, draw_shelf, draw_product, draw_route_points).
+        """
+        image = self.map_processor.original_image
+        if image is None:
             return
 
-        draw = ImageDraw.Draw(img)
+        if self.tile_renderer is None or self.tile_source is not image:
+            self.tile_renderer = TileRenderer(image)
+            self.tile_source = image
+            self.tile_generation += 1
+            self.refining.clear()
+        self.map_image = image
 
-        # Отрисовка размещенных товаров
-        for product_id, (x, y) in self.route_optimizer.placed_products.items():
-            if product_id in self.route_optimizer.access_points:
-                draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill="yellow", outline="orange")
-                access_x, access_y = self.route_optimizer.access_points[product_id]
-                draw.ellipse([access_x - 2, access_y - 2, access_x + 2, access_y + 2], fill="lightgreen", outline="green")
-                draw.line([x, y, access_x, access_y], fill="lightblue", width=1)
-            else:
-                draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill="orange", outline="red")
-            
-            draw.text((x + 5, y - 5), product_id, fill="blue")
-
-        # Отрисовка точек старта и финиша
-        if self.start_point:
-            x, y = self.start_point
-            draw.ellipse(
-                [x - 5, y - 5, x + 5, y + 5], fill="green", outline="darkgreen", width=2
-            )
-            draw.text((x + 7, y - 5), "START", fill="green")
-
-        if self.end_point:
-            x, y = self.end_point
-            draw.ellipse(
-                [x - 5, y - 5, x + 5, y + 5], fill="red", outline="darkred", width=2
-            )
-            draw.text((x + 7, y - 5), "FINISH", fill="red")
-
-        self.map_image = img
-
-        # Применяем масштабирование если нужно
+        self.canvas.delete("all")
+        self.tile_items = {}
+        self.show_tiles()
+        for wall in self.map_processor.walls:
+            self.draw_wall(wall, stack=False)
+        for shelf in self.map_processor.shelves:
+            self.draw_shelf(shelf, stack=False)
+        for product_id in self.route_optimizer.placed_products:
+            self.draw_product(product_id, stack=False)
+        self.draw_route_points(stack=False)
+
+    def add_layer_items(self, tag: str, layer: str, stack: bool = True):
+        """Элементы tag созданы в координатах карты: масштабирование и место в стопке слоев
+
+        Tk создает новые элементы поверх всех, поэтому они опускаются под ближайший
+        непустой вышележащий слой (stack=False - при полной перерисовке слои и так по порядку).
+        """
         if self.zoom_factor != 1.0:
-            new_width = int(img.width * self.zoom_factor)
-            new_height = int(img.height * self.zoom_factor)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            self.canvas.scale(tag, 0, 0, self.zoom_factor, self.zoom_factor)
+        if not stack:
+            return
+        for upper in self.LAYERS[self.LAYERS.index(layer) + 1:]:
+            try:
+                self.canvas.tag_lower(tag, upper)
+                return
+            except tk.TclError:
+                continue
 
-        self.photo_image = ImageTk.PhotoImage(img)
+    def draw_wall(self, wall, stack: bool = True):
+        x1, y1, x2, y2 = wall
+        tag = "wall:%d,%d,%d,%d" % wall
+        self.canvas.create_line(x1, y1, x2, y2, fill="red", width=3, tags=("wall", tag))
+        self.add_layer_items(tag, "wall", stack)
+
+    def draw_shelf(self, shelf, stack: bool = True):
+        x1, y1, x2, y2 = shelf
+        tag = "shelf:%d,%d,%d,%d" % shelf
+        self.canvas.create_rectangle(x1, y1, x2, y2, outline="blue", width=2, tags=("shelf", tag))
+        self.add_layer_items(tag, "shelf", stack)
+
+    def remove_shelf_items(self, shelf):
+        """Удаление элемента стеллажа (повторно добавленный одинаковый стеллаж остается)"""
+        self.canvas.delete("shelf:%d,%d,%d,%d" % shelf)
+        if shelf in self.map_processor.shelf_index:
+            self.draw_shelf(shelf)
+
+    def draw_product(self, product_id: str, stack: bool = True):
+        """(Пере)создание элементов товара: отметка, точки доступа с линиями и подпись"""
+        tag = f"product:{product_id}"
+        self.canvas.delete(tag)
+        if product_id not in self.route_optimizer.placed_products:
+            return
+        tags = ("product", tag)
+        x, y = self.route_optimizer.placed_products[product_id]
+        if product_id in self.route_optimizer.access_points:
+            access_x, access_y = self.route_optimizer.access_points[product_id]
+            self.canvas.create_line(x, y, access_x, access_y, fill="lightblue", tags=tags)
+            alternatives = self.route_optimizer.access_candidates.get(product_id, [])[1:]
+            for alt_x, alt_y in alternatives:
+                self.canvas.create_line(x, y, alt_x, alt_y, fill="lightblue", tags=tags)
+            self.canvas.create_oval(access_x - 2, access_y - 2, access_x + 2, access_y + 2,
+                                    fill="lightgreen", outline="green", tags=tags)
+            for alt_x, alt_y in alternatives:
+                self.canvas.create_oval(alt_x - 2, alt_y - 2, alt_x + 2, alt_y + 2, outline="green", tags=tags)
+            self.canvas.create_oval(x - 3, y - 3, x + 3, y + 3, fill="yellow", outline="orange", tags=tags)
+        else:
+            self.canvas.create_oval(x - 3, y - 3, x + 3, y + 3, fill="orange", outline="red", tags=tags)
+        self.canvas.create_text(x + 5, y - 5, text=product_id, fill="blue", anchor=tk.NW, tags=tags)
+        self.add_layer_items(tag, "product", stack)
 
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo_image)
-        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+    def draw_route_points(self, stack: bool = True):
+        """Отметки старта и финиша"""
+        self.canvas.delete("route_point")
+        for point, label, fill, outline in ((self.start_point, "START", "green", "darkgreen"),
+                                            (self.end_point, "FINISH", "red", "darkred")):
+            if point:
+                x, y = point
+                self.canvas.create_oval(x - 5, y - 5, x + 5, y + 5, fill=fill, outline=outline, width=2,
+                                        tags="route_point")
+                self.canvas.create_text(x + 7, y - 5, text=label, fill=fill, anchor=tk.NW, tags="route_point")
+        self.add_layer_items("route_point", "route_point", stack)
+
+    def show_route_preview(self, route_id: Optional[int]):
+        """Путь маршрута поверх карты (None - убрать)"""
+        self.canvas.delete("route_preview")
+        if route_id is None:
+            return
+        path_data = self.route_optimizer.get_run_store().load_path(route_id)
+        if not path_data or len(path_data["corners"]) < 2:
+            return
+        coords = [coord for point in path_data["corners"] for coord in point]
+        self.canvas.create_line(*coords, fill="red", width=2, tags="route_preview")
+        self.add_layer_items("route_preview", "route_preview")
+
+    def show_tiles(self):
+        """Вывод на холст тайлов, попадающих в видимую область (ушедшие из нее удаляются)"""
+        renderer = self.tile_renderer
+        if renderer is None:
+            return
+        width, height = renderer.display_size(self.zoom_factor)
+        self.canvas.config(scrollregion=(0, 0, width, height))
+
+        x1, y1 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        x2, y2 = x1 + self.canvas.winfo_width(), y1 + self.canvas.winfo_height()
+        visible = set(renderer.tiles_in_view(self.zoom_factor, x1, y1, x2, y2))
+
+        for key in [key for key in self.tile_items if key not in visible]:
+            self.canvas.delete(self.tile_items.pop(key)[0])
+        preview = False
+        for tx, ty in visible - set(self.tile_items):
+            tile = renderer.cached(self.zoom_factor, tx, ty, self.FINAL_RESAMPLE)
+            final = tile is not None
+            if not final:
+                tile = renderer.render(self.zoom_factor, tx, ty, self.PREVIEW_RESAMPLE)
+                preview = True
+            photo = ImageTk.PhotoImage(tile)
+            item = self.canvas.create_image(tx * renderer.TILE, ty * renderer.TILE, anchor=tk.NW,
+                                            image=photo, tags="tile")
+            self.tile_items[(tx, ty)] = (item, photo, final)
+        # Тайлы - под всеми векторными слоями и временными отметками
+        self.canvas.tag_lower("tile")
+        if preview:
+            self.schedule_refine()
+
+    def schedule_refine(self):
+        """Отложенная качественная отрисовка видимых тайлов
+
+        Таймер перезапускается при каждом вызове, поэтому при быстрой прокрутке колесом
+        работа начинается только после паузы во вводе.
+        """
+        if self.refine_job is not None:
+            self.root.after_cancel(self.refine_job)
+        self.refine_job = self.root.after(self.REFINE_DELAY_MS, self.refine_tiles)
+
+    def refine_tiles(self):
+        self.refine_job = None
+        keys = [key for key, (_, _, final) in self.tile_items.items()
+                if not final and key not in self.refining]
+        if not keys:
+            return
+        self.refining.update(keys)
+        self.tile_executor.submit(self._render_final_tiles, self.tile_renderer, self.zoom_factor,
+                                  self.tile_generation, keys)
+        self.refine_batches += 1
+        if self.refine_batches == 1:
+            self.root.after(self.POLL_MS, self.poll_tiles)
+
+    def _render_final_tiles(self, renderer: TileRenderer, zoom: float, generation: int, keys):
+        """Фоновый поток: качественные тайлы (без Tk - PhotoImage создается в главном потоке)"""
+        try:
+            for tx, ty in keys:
+                if generation != self.tile_generation:
+                    # Масштаб уже изменен - остаток пакета не нужен
+                    return
+                self.tile_results.put((generation, renderer, zoom, tx, ty,
+                                       renderer.render(zoom, tx, ty, self.FINAL_RESAMPLE)))
+        finally:
+            self.tile_results.put(None)
+
+    def poll_tiles(self):
+        """Главный поток: готовые качественные тайлы - в кэш и на место предпросмотра"""
+        while True:
+            try:
+                result = self.tile_results.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                self.refine_batches -= 1
+                continue
+            generation, renderer, zoom, tx, ty, tile = result
+            if generation != self.tile_generation or renderer is not self.tile_renderer:
+                continue
+            self.refining.discard((tx, ty))
+            renderer.store(zoom, tx, ty, self.FINAL_RESAMPLE, tile)
+            entry = self.tile_items.get((tx, ty))
+            if entry and not entry[2]:
+                photo = ImageTk.PhotoImage(tile)
+                self.canvas.itemconfig(entry[0], image=photo)
+                self.tile_items[(tx, ty)] = (entry[0], photo, True)
+        if self.refine_batches > 0:
+            self.root.after(self.POLL_MS, self.poll_tiles)
 
     def generate_routes(self):
         """Обычная генерация маршрутов (оригинальный функционал)"""
@@ -788,8 +1011,8 @@ class WarehouseGUI:
             return
 
         # Проверяем товары с доступом и количеством
-        with_amount_and_access = sum(1 for p in self.route_optimizer.products.values() 
-                                if p.amount > 0 and p.id in self.route_optimizer.access_points)
+        table = self.route_optimizer.table
+        with_amount_and_access = int((table.access_mask() & (table.amount > 0)).sum())
         
         if with_amount_and_access < 5:
             messagebox.showwarning("Предупреждение", 
@@ -805,12 +1028,10 @@ class WarehouseGUI:
             # 1. Генерируем выборки с ограничениями
             samples = self.route_optimizer.generate_samples_with_limits(num_samples)
             
-            # 2. Оптимизируем порядок выборок
-            optimized_samples = self.route_optimizer.optimize_samples_order(samples)
-            
-            # 3. Анализируем группировку по ночам
-            night_groups = self.route_optimizer.group_samples_by_nights(optimized_samples)
-            stats = self.route_optimizer.analyze_night_efficiency(night_groups)
+            # 2-3. Разбиваем выборки на ночи и оптимизируем порядок внутри каждой
+            night_groups, report = self.route_optimizer.plan_nights(samples)
+            optimized_samples = [sample for night in night_groups for sample in night]
+            stats = report["global"]
             
             # 4. Показываем статистику оптимизации
             usage_stats = self.route_optimizer.get_usage_statistics(optimized_samples)
@@ -834,8 +1055,68 @@ class WarehouseGUI:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка генерации с ограничениями: {e}")
 
-    def _process_routes(self, samples, generation_type):
-        """Общий метод для обработки сгенерированных выборок"""
+    def generate_wave_routes(self):
+        """Волновая сборка: объединение нескольких выборок в один рейс робота"""
+        if not self.scale_set:
+            messagebox.showwarning("Предупреждение", "Сначала установите масштаб карты!")
+            return
+
+        if not self.start_point or not self.end_point:
+            messagebox.showwarning("Предупреждение", "Установите точки старта и финиша")
+            return
+
+        access_count = len(self.route_optimizer.access_points)
+        if access_count < 5:
+            messagebox.showwarning("Предупреждение", f"Разместите минимум 5 товаров с точками доступа. Сейчас: {access_count}")
+            return
+
+        num_samples = simpledialog.askinteger("Волновая сборка", "Количество выборок:", initialvalue=30)
+        if not num_samples:
+            return
+        max_samples = simpledialog.askinteger("Волновая сборка", "Максимум выборок в рейсе:",
+                                              initialvalue=3, minvalue=1)
+        if not max_samples:
+            return
+        capacity = simpledialog.askinteger("Волновая сборка", "Вместимость робота (единиц товара):",
+                                           initialvalue=15, minvalue=1)
+        if not capacity:
+            return
+
+        try:
+            if self.route_optimizer.has_amount_data():
+                samples = self.route_optimizer.generate_samples_with_limits(num_samples)
+            else:
+                samples = self.route_optimizer.generate_samples(num_samples)
+
+            self.info_label.config(text="Расчет таблицы расстояний между точками доступа...")
+            self.root.update()
+            self.route_optimizer.build_distance_table(self.map_processor, self.start_point, self.end_point,
+                                                      (pid for sample in samples for pid in sample))
+
+            trips, report = self.route_optimizer.plan_waves(samples, max_samples, capacity)
+            print(f"Волновая сборка: {report['samples']} выборок -> {report['trips']} рейсов, "
+                  f"экономия {report['saved_distance']:.1f} м ({report['saved_percent']:.1f}%)")
+
+            self._process_routes([trip["products"] for trip in trips], "волновой сборки",
+                                 trips=trips, source_samples=samples)
+
+            messagebox.showinfo(
+                "Волновая сборка",
+                f"Выборок: {report['samples']}, рейсов: {report['trips']}\n"
+                f"Раздельно: {report['separate_distance']:.1f} м\n"
+                f"Рейсами: {report['merged_distance']:.1f} м\n"
+                f"Экономия: {report['saved_distance']:.1f} м ({report['saved_percent']:.1f}%)",
+            )
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка волновой сборки: {e}")
+
+    def _process_routes(self, samples, generation_type, trips: Optional[List[Dict]] = None,
+                        source_samples: Optional[List[List[str]]] = None):
+        """Общий метод для обработки сгенерированных выборок
+        
+        Для волновой сборки samples - товары рейсов, trips - состав рейсов из plan_waves,
+        source_samples - исходные выборки.
+        """
         progress = tk.Toplevel(self.root)
         progress.title("Генерация маршрутов")
         progress_label = tk.Label(progress, text="Инициализация...")
@@ -845,8 +1126,13 @@ class WarehouseGUI:
 
         successful_routes = 0
         failed_routes = 0
+        render_jobs = []
+        self.route_optimizer.start_run(generation_type)
 
-        samples_to_process = self.optimized_samples if self.optimized_samples else samples
+        if trips:
+            samples_to_process = samples
+        else:
+            samples_to_process = self.optimized_samples if self.optimized_samples else samples
 
         for i, sample in enumerate(samples_to_process):
             progress_label.config(text=f"Обработка маршрута {i+1}/{len(samples)}")
@@ -860,9 +1146,18 @@ class WarehouseGUI:
                 progress.update()
                 continue
 
-            path, distance, order = self.map_processor.find_optimal_route_simple(
-                self.start_point, coords, self.end_point
-            )
+            candidates = self.route_optimizer.get_access_candidates(sample)
+            access_used = None
+            legs = []
+            if any(len(options) > 1 for options in candidates):
+                path, distance, order, access_used = self.map_processor.find_clustered_route(
+                    self.start_point, candidates, self.end_point, time_budget=0.5, legs=legs
+                )
+            else:
+                path, distance, order = self.map_processor.find_optimal_route_simple(
+                    self.start_point, coords, self.end_point,
+                    strategy="anytime" if trips and len(coords) > 7 else "auto", time_budget=0.5, legs=legs
+                )
 
             if path and len(path) > 0:
                 if order:
@@ -870,9 +1165,25 @@ class WarehouseGUI:
                 else:
                     ordered_sample = sample
 
-                self.save_route_image(i + 1, path, ordered_sample, distance)
-                self.route_optimizer.save_route_info(i + 1, ordered_sample, distance, path)
-                self.save_route_segments(i + 1, ordered_sample, path)
+                extra = None
+                if trips:
+                    trip_samples = [source_samples[idx] for idx in trips[i]["samples"]]
+                    extra = {
+                        "trip_samples": [idx + 1 for idx in trips[i]["samples"]],
+                        "separate_distance": trips[i]["separate_distance"],
+                    }
+                    extra.update(self.route_optimizer.trip_drops(trip_samples, ordered_sample))
+                if access_used:
+                    extra = extra or {}
+                    extra["access_used"] = [list(point) for point in access_used]
+
+                if self.map_image and self.render_images_var.get():
+                    render_jobs.append({
+                        "route_id": i + 1, "corners": compress_path(path), "products": ordered_sample,
+                        "distance": distance, "access_used": access_used,
+                    })
+                self.route_optimizer.save_route_info(i + 1, ordered_sample, distance, path, extra)
+                self.save_route_segments(i + 1, ordered_sample, path, access_used, legs)
                 successful_routes += 1
             else:
                 failed_routes += 1
@@ -880,6 +1191,10 @@ class WarehouseGUI:
             progress_bar["value"] = i + 1
             progress.update()
 
+        self.route_optimizer.get_run_store().flush()
+
+        if render_jobs:
+            self._render_route_images(render_jobs, progress, progress_label, progress_bar)
         progress.destroy()
 
         if successful_routes > 0:
@@ -891,8 +1206,8 @@ class WarehouseGUI:
             )
         else:
             access_count = len(self.route_optimizer.access_points)
-            with_amount = sum(1 for p in self.route_optimizer.products.values() 
-                            if p.amount > 0 and p.id in self.route_optimizer.access_points)
+            table = self.route_optimizer.table
+            with_amount = int((table.access_mask() & (table.amount > 0)).sum())
             messagebox.showwarning(
                 "Внимание",
                 f"Не удалось построить ни одного маршрута.\n"
@@ -904,85 +1219,62 @@ class WarehouseGUI:
                 f"Товаров с доступом: {access_count}, с количеством и доступом: {with_amount}",
             )
     
-    def save_route_segments(self, route_id: int, products: List[str], path: List[tuple]):
-        """Сохранение детальной информации о сегментах маршрута из существующего пути"""
+    def save_route_segments(self, route_id: int, products: List[str], path: List[tuple],
+                            access_used: Optional[List[tuple]] = None, legs: Optional[List[int]] = None):
+        """Сохранение сегментов маршрута по границам участков, полученным при построении пути
+        
+        legs - индексы старта, точек доступа в порядке обхода и финиша в пути (заполняются
+        функциями поиска маршрута MapProcessor). access_used - точки доступа, выбранные
+        при построении маршрута (по умолчанию основные).
+        """
         if not products or not path:
             return
         
-        Path("output/routes").mkdir(parents=True, exist_ok=True)
-        
         # Получаем все ключевые точки маршрута
         waypoints = [self.start_point]
-        for product_id in products:
-            if product_id in self.route_optimizer.access_points:
-                waypoints.append(self.route_optimizer.access_points[product_id])
+        if access_used:
+            waypoints.extend(tuple(point) for point in access_used)
+        else:
+            for product_id in products:
+                if product_id in self.route_optimizer.access_points:
+                    waypoints.append(self.route_optimizer.access_points[product_id])
         waypoints.append(self.end_point)
         
-        # Находим индексы ключевых точек в пути ПОСЛЕДОВАТЕЛЬНО
-        waypoint_indices = [0]  # Начинаем со старта (индекс 0)
-        
-        for i in range(1, len(waypoints)):
-            target_waypoint = waypoints[i]
-            start_search_from = waypoint_indices[-1]  # Ищем от последней найденной точки
-            
-            closest_index = start_search_from
-            min_distance = float('inf')
-            
-            # Ищем ближайшую точку начиная с последней найденной
-            for j in range(start_search_from, len(path)):
-                path_point = path[j]
-                distance = ((path_point[0] - target_waypoint[0])**2 + (path_point[1] - target_waypoint[1])**2)**0.5
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_index = j
-                # Если расстояние начинает увеличиваться, значит мы прошли минимум
-                elif distance > min_distance + 5:  # Добавляем небольшой порог
+        if legs and len(legs) == len(waypoints):
+            waypoint_indices = list(legs)
+        else:
+            # Путь склеен из участков, поэтому точки маршрута лежат на нем: ищем их по порядку
+            waypoint_indices = [0]
+            for target in waypoints[1:-1]:
+                start_idx = waypoint_indices[-1]
+                found = next((j for j in range(start_idx, len(path)) if tuple(path[j]) == tuple(target)), None)
+                if found is None:
+                    # Без точки на пути сегменты были бы нулевой длины: распределяем путь равномерно
+                    segments_count = len(waypoints) - 1
+                    print(f"Маршрут {route_id}: точка {target} не найдена на пути, "
+                          f"используется равномерное распределение ({segments_count} сегментов)")
+                    waypoint_indices = [round(k * (len(path) - 1) / segments_count) for k in range(segments_count)]
                     break
-            
-            waypoint_indices.append(closest_index)
-        
-        # Убеждаемся что последняя точка - это конец пути
-        waypoint_indices[-1] = len(path) - 1
+                waypoint_indices.append(found)
+            waypoint_indices.append(len(path) - 1)
         
-        # Разбиваем путь на сегменты между ключевыми точками
+        # Шаги пути единичные: длина сегмента в пикселях равна разности индексов
         segments = []
-        total_distance_pixels = 0
-        
         for i in range(len(waypoint_indices) - 1):
             start_idx = waypoint_indices[i]
             end_idx = waypoint_indices[i + 1]
-            
-            # Извлекаем участок пути между двумя ключевыми точками
-            segment_path = path[start_idx:end_idx + 1]
-            
-            # Вычисляем длину сегмента
-            segment_distance_pixels = 0
-            if len(segment_path) > 1:
-                for j in range(len(segment_path) - 1):
-                    p1 = segment_path[j]
-                    p2 = segment_path[j + 1]
-                    segment_distance_pixels += ((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2)**0.5
-            
-            total_distance_pixels += segment_distance_pixels
-            
-            # Переводим в метры
-            segment_distance_meters = segment_distance_pixels * self.map_processor.scale
-            
-            segment_info = {
+            segments.append({
                 "segment": i + 1,
                 "from": f"{'Старт' if i == 0 else f'Товар{i}'}", 
                 "to": f"{'Финиш' if i == len(waypoint_indices) - 2 else f'Товар{i+1}'}",
-                "distance": round(segment_distance_meters, 2),
-                "path_points": len(segment_path),
+                "distance": round((end_idx - start_idx) * self.map_processor.scale, 2),
+                "path_points": end_idx - start_idx + 1,
                 "start_index": start_idx,
                 "end_index": end_idx
-            }
-            segments.append(segment_info)
+            })
         
         # Общая дистанция в метрах
-        total_distance_meters = total_distance_pixels * self.map_processor.scale
-        
-        print(f"Маршрут {route_id}: {len(segments)} сегментов, общая длина = {total_distance_meters:.2f}м")
+        total_distance_meters = (waypoint_indices[-1] - waypoint_indices[0]) * self.map_processor.scale
         
         path_data = {
             "route_id": route_id,
@@ -990,215 +1282,158 @@ class WarehouseGUI:
             "segments": segments,
             "total_calculated_distance": round(total_distance_meters, 2),
             "waypoints": waypoints,
-            "waypoint_indices": waypoint_indices
+            "waypoint_indices": waypoint_indices,
+            "corners": compress_path(path)
         }
         
-        filepath = f"output/routes/route_{route_id}_path.json"
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(path_data, f, ensure_ascii=False, indent=2)
-
-    def save_route_image(self, route_id: int, path: List[tuple], products: List[str], distance: float):
-        if not self.map_image:
-            return
-
-        Path("output/routes").mkdir(parents=True, exist_ok=True)
-
-        map_width, map_height = self.map_image.size
-        info_width = 100
-        final_width = map_width + info_width
-        final_height = max(map_height, 800)
-
-        final_img = Image.new("RGB", (final_width, final_height), "white")
-
-        # Создаем чистую карту для маршрута
-        clean_map = self.map_processor.get_markup_image()
-        draw_clean = ImageDraw.Draw(clean_map)
+        self.route_optimizer.get_run_store().save_path(path_data)
+
+    def insert_late_products(self, route_id: int, product_ids: List[str], reoptimize: bool = False,
+                             redraw_image: bool = True) -> bool:
+        """Добавление товаров в уже построенный маршрут без полного пересчета"""
+        store = self.route_optimizer.get_run_store()
+        info = store.load_route(route_id)
+        if info is None:
+            return False
+        path_data = store.load_path(route_id) or {}
         
-        # Рисуем товары на чистой карте
-        for product_id, (x, y) in self.route_optimizer.placed_products.items():
-            if product_id in self.route_optimizer.access_points:
-                draw_clean.ellipse([x - 3, y - 3, x + 3, y + 3], fill="yellow", outline="orange")
-                access_x, access_y = self.route_optimizer.access_points[product_id]
-                draw_clean.ellipse([access_x - 2, access_y - 2, access_x + 2, access_y + 2], fill="lightgreen", outline="green")
-                draw_clean.line([x, y, access_x, access_y], fill="lightblue", width=1)
-            else:
-                draw_clean.ellipse([x - 3, y - 3, x + 3, y + 3], fill="orange", outline="red")
-            draw_clean.text((x + 5, y - 5), product_id, fill="blue")
-
-        # Рисование маршрута
-        draw_route = ImageDraw.Draw(clean_map)
-
-        if len(path) > 1:
-            for i in range(len(path) - 1):
-                draw_route.line([path[i], path[i + 1]], fill="red", width=2)
-
-        # Выделение товаров в маршруте
-        for idx, product_id in enumerate(products, 1):
-            if product_id in self.route_optimizer.access_points:
-                ax, ay = self.route_optimizer.access_points[product_id]
-                draw_route.ellipse(
-                    [ax - 7, ay - 7, ax + 7, ay + 7],
-                    fill="yellow",
-                    outline="orange",
-                    width=2,
-                )
-                draw_route.text((ax - 4, ay - 6), str(idx), fill="black")
-                
-                if product_id in self.route_optimizer.placed_products:
-                    x, y = self.route_optimizer.placed_products[product_id]
-                    draw_route.line([ax, ay, x, y], fill="orange", width=1)
-                    draw_route.ellipse([x - 4, y - 4, x + 4, y + 4], fill="yellow", outline="red")
-
-        # Отметка старта и финиша
-        if self.start_point:
-            x, y = self.start_point
-            draw_route.ellipse([x - 6, y - 6, x + 6, y + 6], fill="green", outline="darkgreen", width=2)
-            draw_route.text((x + 8, y - 8), "START", fill="green")
-
-        if self.end_point:
-            x, y = self.end_point
-            draw_route.ellipse([x - 6, y - 6, x + 6, y + 6], fill="red", outline="darkred", width=2)
-            draw_route.text((x + 8, y - 8), "FINISH", fill="red")
-
-        # Уменьшаем и размещаем карту
-        route_scale_factor = 0.8
-        route_img_resized = clean_map.resize(
-            (int(map_width * route_scale_factor), int(map_height * route_scale_factor)), 
-            Image.Resampling.LANCZOS
+        products = info["products"]
+        new_ids = [pid for pid in dict.fromkeys(product_ids)
+                   if pid not in products and pid in self.route_optimizer.access_points]
+        if not new_ids:
+            return False
+        
+        # Точки доступа, выбранные при построении маршрута
+        waypoints = [tuple(point) for point in path_data.get("waypoints", [])]
+        if len(waypoints) == len(products) + 2:
+            points = waypoints[1:-1]
+        else:
+            points = self.route_optimizer.get_access_coordinates(products)
+        new_points = self.route_optimizer.get_access_coordinates(new_ids)
+        
+        path = expand_path(path_data["corners"]) if "corners" in path_data else None
+        leg_distances = None
+        segments = path_data.get("segments", [])
+        if segments and self.map_processor.scale > 0:
+            leg_distances = [seg["distance"] / self.map_processor.scale for seg in segments]
+        
+        legs = []
+        new_path, distance, order = self.map_processor.insert_into_route(
+            self.start_point, points, self.end_point, new_points,
+            path=path, leg_bounds=path_data.get("waypoint_indices"),
+            leg_distances=leg_distances, reoptimize=reoptimize, legs=legs
         )
+        if not new_path:
+            return False
         
-        bordered_map = Image.new("RGB", 
-                                (route_img_resized.width + 4, route_img_resized.height + 4), 
-                                "black")
-        bordered_map.paste(route_img_resized, (2, 2))
-
-        # Информационная панель
-        draw = ImageDraw.Draw(final_img)
+        all_ids = products + new_ids
+        all_points = list(points) + list(new_points)
+        ordered = [all_ids[i] for i in order]
+        access_used = [all_points[i] for i in order]
+        # Состав рейса сохраняем, отметки сбора выборок после вставки неактуальны
+        extra = {key: value for key, value in info.items()
+                 if key not in ("route_id", "products", "distance_meters", "path_length",
+                                "product_details", "picks", "drops")}
+        extra["late_products"] = info.get("late_products", []) + new_ids
+        if "access_used" in info:
+            extra["access_used"] = [list(point) for point in access_used]
+        self.route_optimizer.save_route_info(route_id, ordered, distance, new_path, extra)
+        self.save_route_segments(route_id, ordered, new_path, access_used, legs)
+        store.flush()
+        if redraw_image:
+            self.save_route_image(route_id, new_path, ordered, distance, access_used)
+        return True
+
+    def make_route_renderer(self) -> Optional[RouteRenderer]:
+        """Отрисовщик изображений маршрутов с текущей картой, разметкой и товарами"""
+        markup = self.map_processor.get_markup_image()
+        if markup is None:
+            return None
+        return RouteRenderer(
+            markup,
+            self.route_optimizer.placed_products,
+            self.route_optimizer.access_points,
+            {product_id: product.name for product_id, product in self.route_optimizer.products.items()},
+            self.start_point,
+            self.end_point,
+        )
 
-        try:
-            font_title = ImageFont.truetype("arial.ttf", 20)
-            font_normal = ImageFont.truetype("arial.ttf", 16)
-            font_small = ImageFont.truetype("arial.ttf", 14)
-        except:
-            font_title = ImageFont.load_default()
-            font_normal = ImageFont.load_default()
-            font_small = ImageFont.load_default()
-
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # Информация о выборке
-        y_pos = 10
-        # Вычисляем номер ночной сессии (1-5)
-        night_session = ((route_id - 1) // 15) + 1
-        draw.text((10, y_pos), f"Ночная сессия испытаний №{night_session}", fill="darkblue", font=font_normal)
-        y_pos += 18
-        draw.text((10, y_pos), f"Испытание #{route_id}", fill="black", font=font_title)
-        y_pos += 25
-        draw.text((10, y_pos), f"Расстояние: {distance:.2f} м", fill="black", font=font_normal)
-        y_pos += 18
-        draw.text((10, y_pos), f"Товаров: {len(products)}", fill="black", font=font_normal)
-        y_pos += 18
-        draw.text((10, y_pos), f"Создано: {timestamp}", fill="gray", font=font_small)
-
-        # Размещение карты
-        map_margin = 20
-        route_y_pos = 120
-        final_img.paste(bordered_map, (map_margin, route_y_pos))
-
-        # Список товаров справа от карты
-        map_right_edge = map_margin + bordered_map.width
-        gap_between = 30
-        info_x = map_right_edge + gap_between
-
-        products_y_start = 10
-        y_pos = products_y_start
-        draw.text((info_x, y_pos), "ТОВАРЫ ДЛЯ СБОРА:", fill="black", font=font_title)
-        y_pos += 30
-
-        def wrap_text(text, max_length=30):
-            if len(text) <= max_length:
-                return [text]
-            words = text.split()
-            lines = []
-            current_line = ""
-            for word in words:
-                if len(current_line + " " + word) <= max_length:
-                    current_line += " " + word if current_line else word
-                else:
-                    if current_line:
-                        lines.append(current_line)
-                    current_line = word
-            if current_line:
-                lines.append(current_line)
-            return lines
-
-        for idx, product_id in enumerate(products, 1):
-            if product_id in self.route_optimizer.products:
-                product = self.route_optimizer.products[product_id]
+    def route_renderer_state(self) -> Tuple:
+        """Состояние, из которого строится отрисовщик маршрутов (make_route_renderer): карта,
+        разметка, таблица товаров с ее версией, старт и финиш"""
+        table = self.route_optimizer.table
+        return (id(self.map_processor.original_image), tuple(map(tuple, self.map_processor.walls)),
+                tuple(map(tuple, self.map_processor.shelves)), id(table), table.version,
+                self.start_point, self.end_point)
+
+    def _render_route_images(self, jobs: List[Dict], progress, progress_label, progress_bar):
+        """Изображения - пулом процессов на общем статическом слое, окно прогресса остается живым"""
+        renderer = self.make_route_renderer()
+        if not renderer:
+            return
+        progress_bar.config(maximum=len(jobs), value=0)
+        for done, _ in enumerate(renderer.render_all(jobs), 1):
+            progress_label.config(text=f"Отрисовка изображений {done}/{len(jobs)}")
+            progress_bar["value"] = done
+            progress.update()
 
-                estimated_height_needed = y_pos + 150
-                if estimated_height_needed > final_height:
-                    new_height = estimated_height_needed + 100
-                    new_img = Image.new("RGB", (final_width, new_height), "white")
-                    
-                    draw_area = final_img.crop((0, 0, final_width, final_height))
-                    new_img.paste(draw_area, (0, 0))
-                    
-                    final_img = new_img
-                    final_height = new_height
-                    draw = ImageDraw.Draw(final_img)
-                    
-                    final_img.paste(bordered_map, (map_margin, route_y_pos))
+    def route_render_job(self, route_id: int) -> Optional[Dict]:
+        """Аргументы отрисовки сохраненного маршрута (RouteRenderer.save) из хранилища запуска"""
+        store = self.route_optimizer.get_run_store()
+        info = store.load_route(route_id)
+        path_data = store.load_path(route_id)
+        if info is None or path_data is None:
+            return None
+        access_used = info.get("access_used")
+        return {
+            "route_id": route_id,
+            "corners": [tuple(point) for point in path_data["corners"]],
+            "products": info["products"],
+            "distance": info["distance_meters"],
+            "access_used": [tuple(point) for point in access_used] if access_used else None,
+        }
 
-                draw.text((info_x, y_pos), f"{idx}. ID {product.id}", fill="black", font=font_normal)
-                y_pos += 20
-                
-                wrapped_name = wrap_text(product.name, 30)
-                for line in wrapped_name:
-                    draw.text((info_x + 20, y_pos), line, fill="gray", font=font_normal)
-                    y_pos += 15
-                
-                y_pos += 5
-
-                photo_path = f"data/photos/{product.id}.jpg"
-                if not Path(photo_path).exists():
-                    photo_path = f"data/photos/{product.id}.png"
-
-                if Path(photo_path).exists():
-                    try:
-                        product_img = Image.open(photo_path)
-                        product_img.thumbnail((70, 70), Image.Resampling.LANCZOS)
-                        final_img.paste(product_img, (info_x + 20, y_pos))
-                        y_pos += 75
-                    except:
-                        y_pos += 5
-                else:
-                    draw.rectangle(
-                        [(info_x + 20, y_pos), (info_x + 90, y_pos + 70)],
-                        outline="gray",
-                        width=1,
-                    )
-                    draw.text((info_x + 40, y_pos + 30), "Нет\nфото", fill="gray")
-                    y_pos += 75
+    def render_all_route_images(self):
+        """Отрисовка изображений всех маршрутов запуска в output/routes/route_N.png"""
+        if not self.map_image:
+            messagebox.showerror("Ошибка", "Сначала загрузите карту")
+            return
+        jobs = [job for job in (self.route_render_job(route_id)
+                                for route_id, _, _ in self.route_optimizer.get_run_store().summaries()) if job]
+        if not jobs:
+            messagebox.showinfo("Информация", "Нет сохраненных маршрутов")
+            return
 
-                y_pos += 15
+        progress = tk.Toplevel(self.root)
+        progress.title("Отрисовка маршрутов")
+        progress_label = tk.Label(progress, text="Подготовка слоя карты...")
+        progress_label.pack(padx=20, pady=10)
+        progress_bar = ttk.Progressbar(progress, length=300, mode="determinate", maximum=len(jobs))
+        progress_bar.pack(padx=20, pady=10)
+        progress.update()
+        self._render_route_images(jobs, progress, progress_label, progress_bar)
+        progress.destroy()
+        messagebox.showinfo("Успех", f"Нарисовано изображений: {len(jobs)}\nСохранено в: output/routes/")
 
-        filepath = f"output/routes/route_{route_id}.png"
-        final_img.save(filepath)
+    def save_route_image(self, route_id: int, path: List[tuple], products: List[str], distance: float,
+                         access_used: Optional[List[tuple]] = None):
+        if not self.map_image:
+            return
+        renderer = self.make_route_renderer()
+        if renderer:
+            renderer.save(route_id, compress_path(path), products, distance, access_used)
 
     def view_routes(self):
         """Просмотр сохраненных маршрутов"""
-        import glob
-
-        route_files = glob.glob("output/routes/route_*_info.json")
-        if not route_files:
+        store = self.route_optimizer.get_run_store()
+        summaries = store.summaries()
+        if not summaries:
             messagebox.showinfo("Информация", "Нет сохраненных маршрутов")
             return
 
         viewer = tk.Toplevel(self.root)
         viewer.title("Просмотр маршрутов")
-        viewer.geometry("600x400")
+        viewer.geometry("800x600")
 
         list_frame = tk.Frame(viewer)
         list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -1211,25 +1446,44 @@ class WarehouseGUI:
         info_frame = tk.Frame(viewer)
         info_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        thumb_label = tk.Label(info_frame)
+        thumb_label.pack()
         info_text = tk.Text(info_frame, width=40, height=20, wrap=tk.WORD)
         info_text.pack(fill=tk.BOTH, expand=True)
 
-        routes_data = []
-
-        for filepath in sorted(route_files):
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                routes_data.append(data)
-                listbox.insert(
-                    tk.END,
-                    f"Маршрут {data['route_id']}: {data['distance_meters']:.1f} м, "
-                    f"{len(data['products'])} товаров",
-                )
+        # Изображения рисуются по запросу и кэшируются на диске; слой карты пересоздается,
+        # если карта, разметка, товары или старт/финиш изменились при открытом окне
+        image_cache = {}
+
+        def route_images(route_id: int):
+            if not self.map_image:
+                return None
+            job = self.route_render_job(route_id)
+            if job is None:
+                return None
+            state = self.route_renderer_state()
+            if image_cache.get("state") != state:
+                renderer = self.make_route_renderer()
+                if renderer is None:
+                    return None
+                image_cache.update(state=state, images=RouteImageCache(renderer))
+            return image_cache["images"].get(**job)
+
+        # Список строится по сводке одним запросом, подробности маршрута - по выбору
+        route_ids = []
+        for route_id, distance, num_products in summaries:
+            route_ids.append(route_id)
+            listbox.insert(tk.END, f"Маршрут {route_id}: {distance:.1f} м, {num_products} товаров")
 
         def on_select(event):
             selection = listbox.curselection()
             if selection:
-                route = routes_data[selection[0]]
+                route = store.load_route(route_ids[selection[0]])
+                self.show_route_preview(route["route_id"])
+                images = route_images(route["route_id"])
+                if images:
+                    thumb_label.image = ImageTk.PhotoImage(Image.open(images[1]))
+                    thumb_label.config(image=thumb_label.image)
                 info_text.delete(1.0, tk.END)
                 info_text.insert(tk.END, f"МАРШРУТ №{route['route_id']}\n")
                 info_text.insert(tk.END, "=" * 30 + "\n\n")
@@ -1254,9 +1508,9 @@ class WarehouseGUI:
         def open_image():
             selection = listbox.curselection()
             if selection:
-                route_id = routes_data[selection[0]]["route_id"]
-                image_path = Path(f"output/routes/route_{route_id}.png").absolute()
-                if image_path.exists():
+                images = route_images(route_ids[selection[0]])
+                image_path = images[0].absolute() if images else None
+                if image_path and image_path.exists():
                     import os
                     if os.name == "nt":
                         os.startfile(str(image_path))
@@ -1265,37 +1519,56 @@ class WarehouseGUI:
                 else:
                     messagebox.showwarning("Внимание", "Изображение маршрута не найдено")
 
+        def add_products():
+            selection = listbox.curselection()
+            if not selection:
+                return
+            index = selection[0]
+            route_id = route_ids[index]
+            answer = simpledialog.askstring("Добавить товары", "ID товаров через запятую:", parent=viewer)
+            if not answer:
+                return
+            product_ids = [pid.strip() for pid in answer.split(",") if pid.strip()]
+            reoptimize = messagebox.askyesno("Добавить товары", "Переоптимизировать порядок обхода?", parent=viewer)
+            if self.insert_late_products(route_id, product_ids, reoptimize=reoptimize):
+                data = store.load_route(route_id)
+                listbox.delete(index)
+                listbox.insert(
+                    index,
+                    f"Маршрут {data['route_id']}: {data['distance_meters']:.1f} м, "
+                    f"{len(data['products'])} товаров",
+                )
+                listbox.selection_set(index)
+                on_select(None)
+            else:
+                messagebox.showwarning("Внимание", "Не удалось добавить товары в маршрут", parent=viewer)
+
         listbox.bind("<<ListboxSelect>>", on_select)
 
         tk.Button(list_frame, text="Открыть изображение", command=open_image).pack(pady=5)
-        tk.Button(viewer, text="Закрыть", command=viewer.destroy).pack(side=tk.BOTTOM, pady=10)
+        tk.Button(list_frame, text="Добавить товары", command=add_products).pack(pady=5)
+        tk.Button(list_frame, text="Нарисовать все", command=self.render_all_route_images).pack(pady=5)
+        def close():
+            self.show_route_preview(None)
+            viewer.destroy()
+
+        viewer.protocol("WM_DELETE_WINDOW", close)
+        tk.Button(viewer, text="Закрыть", command=close).pack(side=tk.BOTTOM, pady=10)
 
     def optimize_samples_order(self):
         """Оптимизация порядка выборок для минимизации перестановок товаров"""
-        import glob
-        import json
-        
-        # Загружаем существующие маршруты
-        route_files = glob.glob("output/routes/route_*_info.json")
-        if not route_files:
+        # Загружаем выборки существующих маршрутов
+        routes_data = [products for _, products in self.route_optimizer.get_run_store().iter_products()]
+        if not routes_data:
             messagebox.showwarning("Внимание", "Нет сгенерированных маршрутов для оптимизации")
             return
         
-        # Извлекаем выборки из файлов
-        routes_data = []
-        for file in sorted(route_files, key=lambda x: int(x.split('_')[1])):
-            with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                routes_data.append(data['products'])
-        
-        # Оптимизируем порядок
-        optimized_samples = self.route_optimizer.optimize_samples_order(routes_data)
+        # Разбиваем на ночи и оптимизируем порядок внутри каждой
+        night_groups, report = self.route_optimizer.plan_nights(routes_data)
+        optimized_samples = [sample for night in night_groups for sample in night]
         
-        # Группируем по ночам
-        night_groups = self.route_optimizer.group_samples_by_nights(optimized_samples)
-        
-        # Анализируем эффективность
-        stats = self.route_optimizer.analyze_night_efficiency(night_groups)
+        # Эффективность глобального плана
+        stats = report["global"]
         
         # Сохраняем оптимизированные выборки
         self.optimized_samples = optimized_samples  
@@ -1433,6 +1706,8 @@ class WarehouseGUI:
                 self.map_processor.load_markup(config['markup_path'])
                 self.current_markup_path = config['markup_path']
                 
+            self.refresh_access_candidates()
+                
             # Восстанавливаем точки старт/финиш
             start_point = config.get('start_point')
             end_point = config.get('end_point')
@@ -1451,7 +1726,7 @@ class WarehouseGUI:
             
             info_text = f"Конфигурация загружена: {count} товаров, {placed} размещено, {access_count} с доступом"
             if self.route_optimizer.has_amount_data():
-                with_amount = sum(1 for p in self.route_optimizer.products.values() if p.amount > 0)
+                with_amount = int((self.route_optimizer.table.amount > 0).sum())
                 info_text += f", {with_amount} с количеством"
                 
             self.info_label.config(text=info_text)
@@ -1,10 +1,109 @@
 import heapq
 import json
+import time
+from collections import deque
 from typing import List, Optional, Tuple
 
 import numpy as np
 from PIL import Image, ImageDraw
 
+import tsp_solver
+from spatial_index import RectGrid
+
+# Стратегии find_optimal_route_simple
+ROUTE_STRATEGIES = ("auto", "greedy", "anytime")
+
+
+def compress_path(path: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Сжатие пути по сетке: остаются только концы и точки смены направления"""
+    if len(path) <= 2:
+        return [tuple(p) for p in path]
+    
+    corners = [tuple(path[0])]
+    for i in range(1, len(path) - 1):
+        prev_step = (path[i][0] - path[i - 1][0], path[i][1] - path[i - 1][1])
+        next_step = (path[i + 1][0] - path[i][0], path[i + 1][1] - path[i][1])
+        if prev_step != next_step:
+            corners.append(tuple(path[i]))
+    corners.append(tuple(path[-1]))
+    return corners
+
+
+def expand_path(corners: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Восстановление пути по сетке из точек смены направления"""
+    if not corners:
+        return []
+    
+    path = [tuple(corners[0])]
+    for x2, y2 in corners[1:]:
+        x, y = path[-1]
+        dx = (x2 > x) - (x2 < x)
+        dy = (y2 > y) - (y2 < y)
+        while (x, y) != (x2, y2):
+            x += dx
+            y += dy
+            path.append((x, y))
+    return path
+
+
+def _dilate(grid: np.ndarray, r: int) -> np.ndarray:
+    """Квадратное расширение препятствий (значение 1) на r клеток через таблицу сумм"""
+    h, w = grid.shape
+    padded = np.zeros((h + 2 * r + 1, w + 2 * r + 1), dtype=np.int64)
+    padded[r + 1:r + 1 + h, r + 1:r + 1 + w] = grid == 1
+    sums = padded.cumsum(axis=0).cumsum(axis=1)
+    k = 2 * r + 1
+    window = sums[k:k + h, k:k + w] - sums[:h, k:k + w] - sums[k:k + h, :w] + sums[:h, :w]
+    expanded = grid.copy()
+    expanded[window > 0] = 1
+    return expanded
+
+
+def _orientation(ax: float, ay: float, bx: float, by: float, cx: float, cy: float) -> int:
+    value = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    return (value > 0) - (value < 0)
+
+
+def _segments_intersect(a: Tuple, b: Tuple) -> bool:
+    """Пересечение (или касание) отрезков (x1, y1, x2, y2)"""
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    o1 = _orientation(ax1, ay1, ax2, ay2, bx1, by1)
+    o2 = _orientation(ax1, ay1, ax2, ay2, bx2, by2)
+    o3 = _orientation(bx1, by1, bx2, by2, ax1, ay1)
+    o4 = _orientation(bx1, by1, bx2, by2, ax2, ay2)
+    if o1 != o2 and o3 != o4:
+        return True
+
+    def on_segment(px, py, qx, qy, rx, ry):
+        return min(px, qx) <= rx <= max(px, qx) and min(py, qy) <= ry <= max(py, qy)
+
+    return ((o1 == 0 and on_segment(ax1, ay1, ax2, ay2, bx1, by1))
+            or (o2 == 0 and on_segment(ax1, ay1, ax2, ay2, bx2, by2))
+            or (o3 == 0 and on_segment(bx1, by1, bx2, by2, ax1, ay1))
+            or (o4 == 0 and on_segment(bx1, by1, bx2, by2, ax2, ay2)))
+
+
+def _segment_hits_rect(segment: Tuple, rect: Tuple) -> bool:
+    """Пересечение отрезка с прямоугольником (x1, y1, x2, y2) - отсечение Лианга-Барски"""
+    x1, y1, x2, y2 = segment
+    rx1, ry1, rx2, ry2 = rect
+    dx, dy = x2 - x1, y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x1 - rx1), (dx, rx2 - x1), (-dy, y1 - ry1), (dy, ry2 - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
 
 class MapProcessor:
     def __init__(self):
@@ -17,6 +116,11 @@ class MapProcessor:
         self.original_image = None  # Исходное изображение
         self.walls = []  # Список стен [(x1,y1,x2,y2), ...]
         self.shelves = []  # Список стеллажей [(x1,y1,x2,y2), ...]
+        # Пространственные индексы разметки: ключ - кортеж стены/стеллажа
+        self.wall_index = RectGrid()
+        self.shelf_index = RectGrid()
+        self._distance_cache = {}  # Кэш расстояний по сетке {(точка1, точка2): пиксели}
+        self._free_cells = None  # Плоская карта проходимости с рамкой для BFS
         
     def load_map(self, filepath: str) -> np.ndarray:
         """Загрузка изображения карты (PNG/JPG/BMP)"""
@@ -29,13 +133,18 @@ class MapProcessor:
         
         self._update_robot_radius_pixels()
         self.grid = self._expand_obstacles(self.original_grid)
+        self._invalidate_distance_cache()
         
         return self.grid
     
     def add_wall_line(self, x1: int, y1: int, x2: int, y2: int):
         """Добавление стены-линии"""
         self.walls.append((x1, y1, x2, y2))
-        self._rebuild_grid()
+        self.wall_index.insert((x1, y1, x2, y2), (x1, y1, x2, y2))
+        if self.grid is None:
+            return
+        self._draw_line_on_grid(x1, y1, x2, y2, 1)
+        self._update_grid_region(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
     
     def add_shelf_rect(self, x1: int, y1: int, x2: int, y2: int):
         """Добавление стеллажа-прямоугольника"""
@@ -43,16 +152,33 @@ class MapProcessor:
         x1, x2 = min(x1, x2), max(x1, x2)
         y1, y2 = min(y1, y2), max(y1, y2)
         self.shelves.append((x1, y1, x2, y2))
-        self._rebuild_grid()
+        self.shelf_index.insert((x1, y1, x2, y2), (x1, y1, x2, y2))
+        if self.grid is None:
+            return
+        rect = self._clip_rect(x1, y1, x2, y2)
+        if rect is None:
+            return
+        self._fill_rect(*rect, 1)
+        self._update_grid_region(*rect)
+    
+    def shelf_at(self, x: int, y: int) -> Optional[Tuple[int, int, int, int]]:
+        """Стеллаж, содержащий точку (None - точка не на стеллаже)"""
+        found = self.shelf_index.at_point(x, y)
+        return min(found) if found else None
     
     def remove_shelf_at(self, x: int, y: int) -> bool:
         """Удаление стеллажа в указанной точке"""
-        for i, (x1, y1, x2, y2) in enumerate(self.shelves):
-            if x1 <= x <= x2 and y1 <= y <= y2:
+        shelf = self.shelf_at(x, y)
+        if shelf is None:
+            return False
+        for i, item in enumerate(self.shelves):
+            if tuple(item) == shelf:
                 del self.shelves[i]
-                self._rebuild_grid()
-                return True
-        return False
+                break
+        self.shelf_index.remove(shelf)
+        if self.grid is not None:
+            self._repaint_region(*shelf)
+        return True
     
     def clear_markup(self):
         """Очистка разметки"""
@@ -60,8 +186,82 @@ class MapProcessor:
         self.shelves.clear()
         self._rebuild_grid()
     
+    def shelves_in_box(self, x1: int, y1: int, x2: int, y2: int) -> List[Tuple[int, int, int, int]]:
+        """Стеллажи, пересекающие прямоугольник"""
+        return sorted(self.shelf_index.in_box(x1, y1, x2, y2))
+    
+    def walls_in_box(self, x1: int, y1: int, x2: int, y2: int) -> List[Tuple[int, int, int, int]]:
+        """Стены, габариты которых пересекают прямоугольник"""
+        return sorted(self.wall_index.in_box(x1, y1, x2, y2))
+    
+    def segment_obstacles(self, x1: float, y1: float, x2: float, y2: float) -> Tuple[List, List]:
+        """Стены и стеллажи, которые пересекает отрезок (для проверки прямой видимости)"""
+        walls = [wall for wall in self.wall_index.along_segment(x1, y1, x2, y2)
+                 if _segments_intersect((x1, y1, x2, y2), wall)]
+        shelves = [shelf for shelf in self.shelf_index.along_segment(x1, y1, x2, y2)
+                   if _segment_hits_rect((x1, y1, x2, y2), shelf)]
+        return sorted(walls), sorted(shelves)
+    
+    def nearest_shelf_point(self, x: int, y: int, max_radius: int = 50) -> Optional[Tuple[int, int]]:
+        """Ближайшая к точке точка стеллажа не дальше max_radius (для привязки размещения товара)"""
+        best, best_d2 = None, max_radius * max_radius
+        for x1, y1, x2, y2 in self.shelf_index.in_box(x - max_radius, y - max_radius, x + max_radius, y + max_radius):
+            sx, sy = min(max(x, x1), x2), min(max(y, y1), y2)
+            d2 = (sx - x) ** 2 + (sy - y) ** 2
+            if d2 < best_d2 or (d2 == best_d2 and best is None):
+                best, best_d2 = (sx, sy), d2
+        return best
+    
+    def _reindex_markup(self):
+        self.wall_index.clear()
+        self.shelf_index.clear()
+        for wall in self.walls:
+            self.wall_index.insert(tuple(wall), tuple(wall))
+        for shelf in self.shelves:
+            self.shelf_index.insert(tuple(shelf), tuple(shelf))
+    
+    def _clip_rect(self, x1: int, y1: int, x2: int, y2: int) -> Optional[Tuple[int, int, int, int]]:
+        """Прямоугольник, обрезанный по границам карты (None - целиком за картой)"""
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(self.width - 1, x2), min(self.height - 1, y2)
+        if x1 > x2 or y1 > y2:
+            return None
+        return x1, y1, x2, y2
+    
+    def _fill_rect(self, x1: int, y1: int, x2: int, y2: int, value: int):
+        """Заливка прямоугольника исходной сетки (координаты уже обрезаны по карте)"""
+        self.original_grid[y1:y2+1, x1:x2+1] = value
+    
+    def _repaint_region(self, x1: int, y1: int, x2: int, y2: int):
+        """Перерисовка сетки препятствий в прямоугольнике по индексам после удаления объекта"""
+        rect = self._clip_rect(x1, y1, x2, y2)
+        if rect is None:
+            return
+        x1, y1, x2, y2 = rect
+        self._fill_rect(x1, y1, x2, y2, 0)
+        for wx1, wy1, wx2, wy2 in self.wall_index.in_box(x1, y1, x2, y2):
+            self._draw_line_on_grid(wx1, wy1, wx2, wy2, 1)
+        for sx1, sy1, sx2, sy2 in self.shelf_index.in_box(x1, y1, x2, y2):
+            self._fill_rect(max(x1, sx1), max(y1, sy1), min(x2, sx2), min(y2, sy2), 1)
+        self._update_grid_region(x1, y1, x2, y2)
+    
+    def _update_grid_region(self, x1: int, y1: int, x2: int, y2: int):
+        """Пересчет расширенной сетки вокруг измененного прямоугольника исходной сетки"""
+        if self.grid is not self.original_grid:
+            r = self.robot_radius_pixels
+            # Затронутая часть расширенной сетки и исходные клетки, от которых она зависит
+            ex1, ey1 = max(0, x1 - r), max(0, y1 - r)
+            ex2, ey2 = min(self.width - 1, x2 + r), min(self.height - 1, y2 + r)
+            if ex1 <= ex2 and ey1 <= ey2:
+                sx1, sy1 = max(0, ex1 - r), max(0, ey1 - r)
+                sx2, sy2 = min(self.width - 1, ex2 + r), min(self.height - 1, ey2 + r)
+                dilated = _dilate(self.original_grid[sy1:sy2+1, sx1:sx2+1], r)
+                self.grid[ey1:ey2+1, ex1:ex2+1] = dilated[ey1 - sy1:ey2 - sy1 + 1, ex1 - sx1:ex2 - sx1 + 1]
+        self._invalidate_distance_cache()
+    
     def _rebuild_grid(self):
         """Пересоздание сетки на основе разметки"""
+        self._reindex_markup()
         self.original_grid = np.zeros((self.height, self.width), dtype=int)
         
         # Рисуем стены
@@ -69,11 +269,14 @@ class MapProcessor:
             self._draw_line_on_grid(x1, y1, x2, y2, 1)
         
         # Рисуем стеллажи
-        for x1, y1, x2, y2 in self.shelves:
-            self.original_grid[y1:y2+1, x1:x2+1] = 1
+        for shelf in self.shelves:
+            rect = self._clip_rect(*shelf)
+            if rect is not None:
+                self._fill_rect(*rect, 1)
         
         # Пересчитываем с учетом радиуса робота
         self.grid = self._expand_obstacles(self.original_grid)
+        self._invalidate_distance_cache()
     
     def _draw_line_on_grid(self, x1: int, y1: int, x2: int, y2: int, value: int):
         """Рисование линии на сетке (алгоритм Брезенхема)"""
@@ -150,18 +353,7 @@ class MapProcessor:
         if self.robot_radius_pixels <= 1:
             return grid
         
-        expanded = grid.copy()
-        r = self.robot_radius_pixels
-        
-        obstacles = np.where(grid == 1)
-        for y, x in zip(obstacles[0], obstacles[1]):
-            y_min = max(0, y - r)
-            y_max = min(self.height, y + r + 1)
-            x_min = max(0, x - r)
-            x_max = min(self.width, x + r + 1)
-            expanded[y_min:y_max, x_min:x_max] = 1
-        
-        return expanded
+        return _dilate(grid, self.robot_radius_pixels)
     
     def set_scale(self, pixel_distance: float, real_distance: float):
         """Установка масштаба карты"""
@@ -175,6 +367,7 @@ class MapProcessor:
         self._update_robot_radius_pixels()
         if hasattr(self, 'original_grid'):
             self.grid = self._expand_obstacles(self.original_grid)
+            self._invalidate_distance_cache()
     
     def _update_robot_radius_pixels(self):
         """Пересчет радиуса робота из метров в пиксели"""
@@ -230,6 +423,38 @@ class MapProcessor:
         
         return None
     
+    def find_access_candidates(self, x: int, y: int, max_radius: int = 50) -> List[Tuple[int, int]]:
+        """Варианты точек доступа к месту на стеллаже: ближайшая проходимая точка
+        и первые проходимые точки по обе стороны стеллажа (по одной на проход)"""
+        candidates = []
+        nearest = self.find_nearest_walkable(x, y, max_radius=max_radius)
+        if nearest:
+            candidates.append(nearest)
+        
+        # Проходы идут вдоль длинной стороны стеллажа, ищем поперек нее
+        directions = ((1, 0), (-1, 0), (0, 1), (0, -1))
+        shelf = self.shelf_at(x, y)
+        if shelf is not None:
+            x1, y1, x2, y2 = shelf
+            directions = directions[:2] if y2 - y1 >= x2 - x1 else directions[2:]
+        
+        for dx, dy in directions:
+            for step in range(1, max_radius):
+                nx, ny = x + dx * step, y + dy * step
+                if not (0 <= nx < self.width and 0 <= ny < self.height):
+                    break
+                if self.is_walkable(nx, ny, check_radius=False):
+                    candidates.append((nx, ny))
+                    break
+        
+        # Точки ближе двух радиусов робота друг к другу считаем одним проходом
+        min_gap = 2 * self.robot_radius_pixels + 2
+        unique = []
+        for cx, cy in candidates:
+            if all(abs(cx - ux) + abs(cy - uy) > min_gap for ux, uy in unique):
+                unique.append((cx, cy))
+        return unique
+    
     # Остальные методы (A*, оптимизация маршрутов и т.д.) остаются без изменений
     def save_map_metadata(self, map_filepath: str):
         """Сохранение метаданных карты"""
@@ -329,47 +554,386 @@ class MapProcessor:
         
         return None
     
+    def _invalidate_distance_cache(self):
+        """Сброс кэша расстояний после изменения сетки"""
+        self._distance_cache = {}
+        self._free_cells = None
+    
+    def _get_free_cells(self) -> np.ndarray:
+        """Плоский массив проходимости с рамкой из препятствий (без проверок границ в BFS)"""
+        if self._free_cells is None:
+            free = np.zeros((self.height + 2, self.width + 2), dtype=bool)
+            free[1:-1, 1:-1] = self.grid != 1
+            self._free_cells = free.ravel()
+        return self._free_cells
+    
+    def _bfs(self, source: Tuple[int, int], targets: List[Tuple[int, int]]) -> np.ndarray:
+        """Поиск в ширину от точки до всех целей (останавливается, когда все цели найдены)
+        
+        Обход по уровням на NumPy: фронт - массив индексов клеток, соседи всего фронта
+        отбираются одной операцией. Возвращает плоский массив расстояний (-1 - не достигнута).
+        """
+        free = self._get_free_cells()
+        row = self.width + 2
+        dist = np.full(free.size, -1, dtype=np.int32)
+        
+        s = (source[1] + 1) * row + source[0] + 1
+        if not free[s]:
+            return dist
+        
+        pending = np.array([(y + 1) * row + x + 1 for x, y in targets
+                            if 0 <= x < self.width and 0 <= y < self.height], dtype=np.int64)
+        dist[s] = 0
+        # Буфер для удаления повторов без сортировки (инициализация не нужна)
+        owner = np.empty(free.size, dtype=np.int64)
+        frontier = np.array([s], dtype=np.int64)
+        offsets = np.array([1, -1, row, -row], dtype=np.int64)
+        level = 0
+        
+        while frontier.size:
+            # Проверка целей - раз в несколько уровней, она дороже шага по узкому фронту
+            if level % 8 == 0 and (dist[pending] >= 0).all():
+                break
+            level += 1
+            neighbors = (frontier[:, None] + offsets).ravel()
+            neighbors = neighbors[free[neighbors]]
+            neighbors = neighbors[dist[neighbors] < 0]
+            # Клетка достижима из нескольких клеток фронта: остается одно вхождение
+            # (последняя запись owner), иначе повторы множатся от уровня к уровню
+            index = np.arange(neighbors.size)
+            owner[neighbors] = index
+            neighbors = neighbors[owner[neighbors] == index]
+            dist[neighbors] = level
+            frontier = neighbors
+        
+        return dist
+    
+    def grid_distances(self, source: Tuple[int, int], targets: List[Tuple[int, int]]) -> List[float]:
+        """Кратчайшие расстояния по сетке (в пикселях) от точки до списка целей"""
+        source = (int(source[0]), int(source[1]))
+        targets = [(int(x), int(y)) for x, y in targets]
+        
+        missing = [t for t in targets if (source, t) not in self._distance_cache]
+        if missing:
+            dist = self._bfs(source, missing)
+            row = self.width + 2
+            for t in missing:
+                if not (0 <= t[0] < self.width and 0 <= t[1] < self.height):
+                    d = float('inf')
+                else:
+                    d = dist[(t[1] + 1) * row + t[0] + 1]
+                    d = float(d) if d >= 0 else float('inf')
+                self._distance_cache[(source, t)] = d
+                self._distance_cache[(t, source)] = d
+        
+        return [self._distance_cache[(source, t)] for t in targets]
+    
+    def compute_distance_table(self, points: List[Tuple[int, int]]) -> np.ndarray:
+        """Матрица кратчайших расстояний (в пикселях) между всеми точками списка
+        
+        Вместо A* для каждой пары используется один BFS от каждой точки,
+        результаты кэшируются до изменения разметки.
+        """
+        n = len(points)
+        table = np.zeros((n, n), dtype=float)
+        for i in range(n):
+            if i + 1 < n:
+                table[i, i + 1:] = self.grid_distances(points[i], points[i + 1:])
+        return table + table.T
+    
+    def _bfs_path(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
+        """Кратчайший путь поиском в ширину (запасной вариант, если A* не уложился в лимит)"""
+        if not self.is_walkable(*start, check_radius=False) or not self.is_walkable(*goal, check_radius=False):
+            return None
+        
+        dist = self._bfs(goal, [start])
+        row = self.width + 2
+        cell = (start[1] + 1) * row + start[0] + 1
+        if dist[cell] < 0:
+            return None
+        
+        # Спускаемся по убыванию расстояния от старта к цели
+        path = [start]
+        while dist[cell] > 0:
+            for offset in (1, -1, row, -row):
+                if dist[cell + offset] == dist[cell] - 1:
+                    cell += offset
+                    break
+            path.append((cell % row - 1, cell // row - 1))
+        return path
+    
+    def _assemble_path(self, waypoints: List[Tuple[int, int]],
+                       legs: Optional[List[int]] = None) -> Optional[List[Tuple[int, int]]]:
+        """Склейка полного пути из участков между последовательными точками
+        
+        Если передан список legs, в него записываются индексы точек маршрута в пути
+        (границы участков). Шаги пути единичные, поэтому длина участка k в пикселях -
+        legs[k + 1] - legs[k].
+        """
+        full_path = []
+        bounds = []
+        for i in range(len(waypoints) - 1):
+            leg = self.a_star(waypoints[i], waypoints[i + 1])
+            if leg is None:
+                leg = self._bfs_path(waypoints[i], waypoints[i + 1])
+            if leg is None:
+                return None
+            bounds.append(len(full_path))
+            full_path.extend(leg[:-1])
+        bounds.append(len(full_path))
+        full_path.append(waypoints[-1])
+        if legs is not None:
+            legs[:] = bounds
+        return full_path
+    
+    def find_anytime_route(self, start: Tuple[int, int], 
+                           points: List[Tuple[int, int]], 
+                           end: Tuple[int, int],
+                           time_budget: float = 2.0,
+                           seed: Optional[int] = None,
+                           legs: Optional[List[int]] = None) -> Tuple[List[Tuple[int, int]], float, List[int]]:
+        """Маршрут для длинных списков сбора: метаэвристика с ограничением по времени
+        
+        time_budget - ограничение времени вызова в секундах, включая расчет матрицы
+        расстояний: на улучшение порядка (2-opt, Or-opt, ILS) остается бюджет за вычетом
+        матрицы, при исчерпанном бюджете берется жадный порядок. Сверх бюджета - только
+        сборка пути по найденному порядку. legs - см. _assemble_path.
+        """
+        begin = time.perf_counter()
+        n = len(points)
+        
+        nodes = [start] + list(points) + [end]
+        table = self.compute_distance_table(nodes)
+        if np.isinf(table).any():
+            return [], float('inf'), []
+        
+        remaining = time_budget - (time.perf_counter() - begin)
+        order, _ = tsp_solver.solve_path_anytime(table, 0, n + 1, remaining, seed=seed)
+        order = [idx - 1 for idx in order[1:-1]]
+        
+        full_path = self._assemble_path([start] + [points[i] for i in order] + [end], legs)
+        if full_path is None:
+            return [], float('inf'), []
+        
+        return full_path, (len(full_path) - 1) * self.scale, order
+    
+    def find_clustered_route(self, start: Tuple[int, int], 
+                             candidates: List[List[Tuple[int, int]]], 
+                             end: Tuple[int, int],
+                             time_budget: float = 1.0,
+                             legs: Optional[List[int]] = None) -> Tuple[List[Tuple[int, int]], float, List[int], List[Tuple[int, int]]]:
+        """Маршрут с выбором одной из нескольких точек доступа для каждого товара
+        
+        Возвращает путь, расстояние в метрах, порядок товаров и выбранные точки доступа
+        в порядке обхода. legs - см. _assemble_path.
+        """
+        nodes = [start]
+        clusters = []
+        for options in candidates:
+            clusters.append(list(range(len(nodes), len(nodes) + len(options))))
+            nodes.extend(options)
+        nodes.append(end)
+        end_idx = len(nodes) - 1
+        
+        table = self.compute_distance_table(nodes)
+        
+        # Отбрасываем варианты, недостижимые со старта или до финиша
+        reachable = []
+        for cluster in clusters:
+            options = [v for v in cluster if table[0, v] < float('inf') and table[v, end_idx] < float('inf')]
+            if not options:
+                return [], float('inf'), [], []
+            reachable.append(options)
+        
+        order, _ = tsp_solver.solve_clustered_path(table, 0, end_idx, reachable, time_budget=time_budget)
+        node_product = {v: j for j, cluster in enumerate(reachable) for v in cluster}
+        product_order = [node_product[v] for v in order[1:-1]]
+        chosen = [nodes[v] for v in order[1:-1]]
+        
+        full_path = self._assemble_path([start] + chosen + [end], legs)
+        if full_path is None:
+            return [], float('inf'), [], []
+        
+        return full_path, (len(full_path) - 1) * self.scale, product_order, chosen
+    
+    def insert_into_route(self, start: Tuple[int, int], 
+                          points: List[Tuple[int, int]], 
+                          end: Tuple[int, int],
+                          new_points: List[Tuple[int, int]],
+                          path: Optional[List[Tuple[int, int]]] = None,
+                          leg_bounds: Optional[List[int]] = None,
+                          leg_distances: Optional[List[float]] = None,
+                          reoptimize: bool = False,
+                          legs: Optional[List[int]] = None) -> Tuple[List[Tuple[int, int]], float, List[int]]:
+        """Вставка новых точек в уже построенный маршрут (points - в порядке обхода)
+        
+        Каждая точка вставляется на место с наименьшим приростом длины. Длины участков
+        берутся из leg_distances (пиксели), если переданы. Если переданы path и leg_bounds
+        (индексы точек маршрута в пути), перестраиваются только затронутые участки пути.
+        Возвращает новый путь, расстояние в метрах и порядок: индексы 0..n-1 - прежние точки,
+        n.. - новые. legs - список для новых границ участков (см. _assemble_path).
+        """
+        all_points = list(points) + list(new_points)
+        # Маршрут как список индексов: -1 - старт, -2 - финиш
+        route = [-1] + list(range(len(points))) + [-2]
+        
+        def coords(node):
+            return start if node == -1 else end if node == -2 else all_points[node]
+        
+        if leg_distances is not None and len(leg_distances) == len(route) - 1:
+            leg_lengths = [float(d) for d in leg_distances]
+        else:
+            leg_lengths = [self.grid_distances(coords(route[k]), [coords(route[k + 1])])[0]
+                    for k in range(len(route) - 1)]
+        
+        pieces = None
+        if (path and leg_bounds and len(leg_bounds) == len(route)
+                and all(tuple(path[b]) == tuple(coords(r)) for b, r in zip(leg_bounds, route))):
+            pieces = [path[leg_bounds[k]:leg_bounds[k + 1] + 1] for k in range(len(route) - 1)]
+        
+        for offset, point in enumerate(new_points):
+            node = len(points) + offset
+            to_route = self.grid_distances(point, [coords(r) for r in route])
+            if any(d == float('inf') for d in to_route):
+                return [], float('inf'), []
+            
+            deltas = [to_route[k] + to_route[k + 1] - leg_lengths[k] for k in range(len(leg_lengths))]
+            k = min(range(len(deltas)), key=deltas.__getitem__)
+            route.insert(k + 1, node)
+            leg_lengths[k:k + 1] = [to_route[k], to_route[k + 1]]
+            if pieces is not None:
+                first = self._assemble_path([coords(route[k]), point])
+                second = self._assemble_path([point, coords(route[k + 2])])
+                if first is None or second is None:
+                    return [], float('inf'), []
+                pieces[k:k + 1] = [first, second]
+        
+        if reoptimize and len(route) > 3:
+            table = self.compute_distance_table([coords(r) for r in route])
+            order = tsp_solver.or_opt_path(table, tsp_solver.two_opt_path(table, list(range(len(route)))))
+            if tsp_solver.path_cost(table, order) < sum(leg_lengths) - tsp_solver.EPS:
+                route = [route[i] for i in order]
+                pieces = None
+        
+        if pieces is not None:
+            full_path = []
+            bounds = []
+            for piece in pieces:
+                bounds.append(len(full_path))
+                full_path.extend(piece[:-1])
+            bounds.append(len(full_path))
+            full_path.append(end)
+            if legs is not None:
+                legs[:] = bounds
+        else:
+            full_path = self._assemble_path([coords(r) for r in route], legs)
+            if full_path is None:
+                return [], float('inf'), []
+        
+        return full_path, (len(full_path) - 1) * self.scale, route[1:-1]
+    
+    def find_multi_robot_routes(self, start: Tuple[int, int], 
+                                points: List[Tuple[int, int]], 
+                                end: Tuple[int, int],
+                                num_robots: int,
+                                capacity: int,
+                                objective: str = "makespan",
+                                solver: str = "auto",
+                                time_budget: float = 2.0) -> List[Tuple[List[Tuple[int, int]], float, List[int]]]:
+        """Разбиение точек сбора между несколькими роботами с общими стартом и финишем
+        
+        objective: "makespan" - минимизация самого длинного маршрута, "total" - суммарной длины.
+        solver: "exact" - точное решение (до tsp_solver.VRP_EXACT_LIMIT точек), "heuristic" - эвристика с бюджетом времени,
+        "auto" - выбор по количеству точек.
+        Возвращает по маршруту на робота: (путь, расстояние в метрах, индексы точек в порядке обхода).
+        """
+        n = len(points)
+        if num_robots < 1 or capacity < 1:
+            raise ValueError("Количество роботов и вместимость должны быть положительными")
+        if num_robots * capacity < n:
+            raise ValueError(
+                f"Недостаточно вместимости: {num_robots} роботов по {capacity} точек, "
+                f"требуется {n}"
+            )
+        if solver == "exact" and n > tsp_solver.VRP_EXACT_LIMIT:
+            raise ValueError(
+                f"Точное решение доступно до {tsp_solver.VRP_EXACT_LIMIT} точек, "
+                f"получено {n}: используйте solver=\"heuristic\" или \"auto\""
+            )
+        
+        nodes = [start] + list(points) + [end]
+        table = self.compute_distance_table(nodes)
+        if np.isinf(table).any():
+            raise ValueError("Часть точек недостижима со старта или до финиша")
+        
+        if solver == "exact" or (solver == "auto" and n <= tsp_solver.VRP_EXACT_LIMIT):
+            routes, _ = tsp_solver.solve_vrp_exact(table, 0, n + 1, num_robots, capacity, objective)
+        else:
+            routes, _ = tsp_solver.solve_vrp_heuristic(
+                table, 0, n + 1, num_robots, capacity, objective, time_budget
+            )
+        
+        result = []
+        for route in routes:
+            order = [idx - 1 for idx in route]
+            if not order:
+                result.append(([], 0.0, []))
+                continue
+            full_path = self._assemble_path([start] + [points[i] for i in order] + [end])
+            if full_path is None:
+                result.append(([], float('inf'), order))
+            else:
+                result.append((full_path, (len(full_path) - 1) * self.scale, order))
+        return result
+    
     def compute_distance_matrix(self, points: List[Tuple[int, int]], 
                                start: Tuple[int, int], 
                                end: Tuple[int, int]) -> dict:
         """Предварительный расчет матрицы расстояний между всеми точками"""
         n = len(points)
+        table = self.compute_distance_table([start] + list(points) + [end])
         distances = {}
         
-        for i, point in enumerate(points):
-            path = self.a_star(start, point)
-            dist = len(path) - 1 if path else float('inf')
-            distances[('start', i)] = dist
-        
         for i in range(n):
-            for j in range(i + 1, n):
-                path = self.a_star(points[i], points[j])
-                dist = len(path) - 1 if path else float('inf')
-                distances[(i, j)] = dist
-                distances[(j, i)] = dist
-        
-        for i, point in enumerate(points):
-            path = self.a_star(point, end)
-            dist = len(path) - 1 if path else float('inf')
-            distances[(i, 'end')] = dist
+            distances[('start', i)] = table[0, i + 1]
+            distances[(i, 'end')] = table[i + 1, n + 1]
+            for j in range(n):
+                if i != j:
+                    distances[(i, j)] = table[i + 1, j + 1]
         
         return distances
     
     def find_optimal_route_simple(self, start: Tuple[int, int], 
                                  points: List[Tuple[int, int]], 
-                                 end: Tuple[int, int]) -> Tuple[List[Tuple[int, int]], float, List[int]]:
-        """Упрощенный поиск оптимального маршрута"""
+                                 end: Tuple[int, int],
+                                 strategy: str = "auto",
+                                 time_budget: float = 2.0,
+                                 legs: Optional[List[int]] = None) -> Tuple[List[Tuple[int, int]], float, List[int]]:
+        """Упрощенный поиск оптимального маршрута
+        
+        strategy: "auto" - перебор до 7 точек, иначе жадный алгоритм;
+        "greedy" - жадный алгоритм; "anytime" - метаэвристика с бюджетом time_budget секунд.
+        legs - список для индексов точек маршрута в пути (см. _assemble_path).
+        """
         from itertools import permutations
         
+        if strategy not in ROUTE_STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия маршрута: {strategy} (допустимо: {', '.join(ROUTE_STRATEGIES)})")
+        
         n = len(points)
         if n == 0:
             path = self.a_star(start, end)
             if path:
+                if legs is not None:
+                    legs[:] = [0, len(path) - 1]
                 return path, (len(path) - 1) * self.scale, []
             return [], float('inf'), []
         
-        if n > 7:
-            return self.find_greedy_route(start, points, end)
+        if strategy == "anytime":
+            return self.find_anytime_route(start, points, end, time_budget=time_budget, legs=legs)
+        
+        if strategy == "greedy" or n > 7:
+            return self.find_greedy_route(start, points, end, legs=legs)
         
         distances = self.compute_distance_matrix(points, start, end)
         
@@ -413,10 +977,12 @@ class MapProcessor:
             return [], float('inf'), []
         
         full_path = []
+        bounds = [0]
         
         path = self.a_star(start, points[best_order[0]])
         if path:
             full_path.extend(path[:-1])
+            bounds.append(len(full_path))
         else:
             return [], float('inf'), []
         
@@ -424,26 +990,32 @@ class MapProcessor:
             path = self.a_star(points[best_order[i]], points[best_order[i + 1]])
             if path:
                 full_path.extend(path[:-1])
+                bounds.append(len(full_path))
             else:
                 return [], float('inf'), []
         
         path = self.a_star(points[best_order[-1]], end)
         if path:
             full_path.extend(path)
+            bounds.append(len(full_path) - 1)
         else:
             return [], float('inf'), []
         
+        if legs is not None:
+            legs[:] = bounds
         return full_path, best_distance * self.scale, best_order
     
     def find_greedy_route(self, start: Tuple[int, int], 
                          points: List[Tuple[int, int]], 
-                         end: Tuple[int, int]) -> Tuple[List[Tuple[int, int]], float, List[int]]:
-        """Жадный алгоритм для большого количества точек"""
+                         end: Tuple[int, int],
+                         legs: Optional[List[int]] = None) -> Tuple[List[Tuple[int, int]], float, List[int]]:
+        """Жадный алгоритм для большого количества точек (legs - см. _assemble_path)"""
         n = len(points)
         unvisited = set(range(n))
         current_pos = start
         order = []
         full_path = []
+        bounds = [0]
         total_distance = 0
         
         while unvisited:
@@ -469,6 +1041,7 @@ class MapProcessor:
                 else:
                     full_path.extend(best_path[:-1])
                 total_distance += best_dist
+            bounds.append(len(full_path))
             
             order.append(best_next)
             unvisited.remove(best_next)
@@ -481,4 +1054,7 @@ class MapProcessor:
         else:
             return [], float('inf'), []
         
+        bounds.append(len(full_path) - 1)
+        if legs is not None:
+            legs[:] = bounds
         return full_path, total_distance * self.scale, order
\ No newline at end of file
@@ -0,0 +1,244 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from spatial_index import PointGrid
+
+
+@dataclass
+class Product:
+    id: str
+    name: str
+    x: int = -1
+    y: int = -1
+    access_x: int = -1
+    access_y: int = -1
+    amount: int = 0  # Новое поле для количества
+
+
+class ProductTable:
+    """Колоночная таблица товаров
+
+    Товар - строка с плотным индексом: ids/names - списки, координаты (xy), точки доступа
+    (access) и количества (amount) - массивы NumPy; index - отображение ID -> строка.
+    Отрицательные координаты означают "не размещен" / "нет точки доступа", как в Product.
+    Массивы растут с запасом, поэтому добавление по одному товару амортизированно дешевое.
+    version увеличивается при каждом изменении (по нему представления кэшируют списки).
+    Сетки grid и access_grid (строка -> точка) индексируют размещенные товары и точки доступа
+    для пространственных запросов и обновляются при каждом изменении строки.
+    """
+
+    def __init__(self):
+        self.version = getattr(self, "version", 0) + 1
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self._xy = np.full((0, 2), -1, dtype=np.int32)
+        self._access = np.full((0, 2), -1, dtype=np.int32)
+        self._amount = np.zeros(0, dtype=np.int64)
+        self.grid = PointGrid()
+        self.access_grid = PointGrid()
+
+    @classmethod
+    def from_columns(cls, ids: List[str], names: List[str], xy: np.ndarray, access: np.ndarray,
+                     amount: np.ndarray) -> "ProductTable":
+        """Таблица из готовых столбцов (повторяющийся ID - место первой строки, значения последней,
+        как при загрузке в словарь)"""
+        table = cls()
+        index = {pid: row for row, pid in enumerate(ids)}
+        if len(index) < len(ids):
+            rows = np.array([index[pid] for pid in dict.fromkeys(ids)], dtype=np.int64)
+            ids = [ids[row] for row in rows]
+            names = [names[row] for row in rows]
+            xy, access, amount = xy[rows], access[rows], amount[rows]
+            index = {pid: row for row, pid in enumerate(ids)}
+        table.ids = list(ids)
+        table.names = list(names)
+        table.index = index
+        table._xy = np.asarray(xy, dtype=np.int32).reshape(-1, 2).copy()
+        table._access = np.asarray(access, dtype=np.int32).reshape(-1, 2).copy()
+        table._amount = np.asarray(amount, dtype=np.int64).copy()
+        placed = table.placed_mask()
+        rows = np.flatnonzero(placed).tolist()
+        table.grid.insert_many(zip(rows, map(tuple, table.xy[rows].tolist())))
+        rows = np.flatnonzero(placed & (table.access >= 0).all(axis=1)).tolist()
+        table.access_grid.insert_many(zip(rows, map(tuple, table.access[rows].tolist())))
+        return table
+
+    def _index_rows(self, rows: Iterable[int]):
+        """Обновление сеток для строк по текущим значениям столбцов"""
+        for row in rows:
+            x, y = self._xy[row].tolist()
+            access_x, access_y = self._access[row].tolist()
+            placed = x >= 0 and y >= 0
+            if placed:
+                self.grid.insert(row, x, y)
+            else:
+                self.grid.remove(row)
+            if placed and access_x >= 0 and access_y >= 0:
+                self.access_grid.insert(row, access_x, access_y)
+            else:
+                self.access_grid.remove(row)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def xy(self) -> np.ndarray:
+        return self._xy[:len(self.ids)]
+
+    @property
+    def access(self) -> np.ndarray:
+        return self._access[:len(self.ids)]
+
+    @property
+    def amount(self) -> np.ndarray:
+        return self._amount[:len(self.ids)]
+
+    def placed_mask(self) -> np.ndarray:
+        return (self.xy >= 0).all(axis=1)
+
+    def access_mask(self) -> np.ndarray:
+        return self.placed_mask() & (self.access >= 0).all(axis=1)
+
+    def clear(self):
+        self.__init__()
+
+    def _reserve(self, size: int):
+        if size <= len(self._amount):
+            return
+        capacity = max(size, 2 * len(self._amount), 16)
+        for name, fill in (("_xy", -1), ("_access", -1)):
+            grown = np.full((capacity, 2), fill, dtype=np.int32)
+            grown[:len(self.ids)] = getattr(self, name)[:len(self.ids)]
+            setattr(self, name, grown)
+        amount = np.zeros(capacity, dtype=np.int64)
+        amount[:len(self.ids)] = self._amount[:len(self.ids)]
+        self._amount = amount
+
+    def add(self, product: Product) -> int:
+        """Добавление (замена) товара, возвращает номер строки"""
+        row = self.index.get(product.id)
+        if row is None:
+            row = len(self.ids)
+            self._reserve(row + 1)
+            self.ids.append(product.id)
+            self.names.append(product.name)
+            self.index[product.id] = row
+        else:
+            self.names[row] = product.name
+        self._xy[row] = (product.x, product.y)
+        self._access[row] = (product.access_x, product.access_y)
+        self._amount[row] = product.amount
+        self._index_rows([row])
+        self.version += 1
+        return row
+
+    def row(self, product_id: str) -> Optional[int]:
+        return self.index.get(product_id)
+
+    def product(self, row: int) -> Product:
+        """Снимок строки в виде Product (изменения объекта в таблицу не попадают)"""
+        x, y = self._xy[row].tolist()
+        access_x, access_y = self._access[row].tolist()
+        return Product(self.ids[row], self.names[row], x, y, access_x, access_y, int(self._amount[row]))
+
+    def place(self, row: int, x: int, y: int, access_point: Optional[Tuple[int, int]] = None):
+        self._xy[row] = (x, y)
+        if access_point:
+            self._access[row] = access_point
+        self._index_rows([row])
+        self.version += 1
+
+    def nearest_in_square(self, x: int, y: int, tolerance: int) -> Optional[int]:
+        """Строка ближайшего размещенного товара в квадрате со стороной 2 * tolerance вокруг точки"""
+        rows = self.grid.in_rect(x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+        if not rows:
+            return None
+        points = self.grid.points
+        return min(rows, key=lambda row: ((points[row][0] - x) ** 2 + (points[row][1] - y) ** 2, row))
+
+
+class ProductsView(Mapping):
+    """Словарь ID -> Product поверх таблицы (совместимость с прежним RouteOptimizer.products)"""
+
+    def __init__(self, table: ProductTable):
+        self.table = table
+
+    def __getitem__(self, product_id: str) -> Product:
+        row = self.table.index.get(product_id)
+        if row is None:
+            raise KeyError(product_id)
+        return self.table.product(row)
+
+    def __setitem__(self, product_id: str, product: Product):
+        if product.id != product_id:
+            raise ValueError(f"ID товара {product.id} не совпадает с ключом {product_id}")
+        self.table.add(product)
+
+    def __contains__(self, product_id) -> bool:
+        return product_id in self.table.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.table.ids))
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def clear(self):
+        self.table.clear()
+
+
+class PointsView(Mapping):
+    """Словарь ID -> (x, y) размещенных товаров (column="xy") или их точек доступа (column="access")"""
+
+    def __init__(self, table: ProductTable, column: str):
+        self.table = table
+        self.column = column
+        self._cache = (None, None, [])
+
+    def _mask(self) -> np.ndarray:
+        return self.table.placed_mask() if self.column == "xy" else self.table.access_mask()
+
+    def __getitem__(self, product_id: str) -> Tuple[int, int]:
+        row = self.table.index.get(product_id)
+        if row is None or not self._has(row):
+            raise KeyError(product_id)
+        x, y = getattr(self.table, self.column)[row].tolist()
+        return x, y
+
+    def _has(self, row: int) -> bool:
+        x, y = self.table.xy[row].tolist()
+        if x < 0 or y < 0:
+            return False
+        if self.column == "access":
+            access_x, access_y = self.table.access[row].tolist()
+            return access_x >= 0 and access_y >= 0
+        return True
+
+    def __contains__(self, product_id) -> bool:
+        row = self.table.index.get(product_id)
+        return row is not None and self._has(row)
+
+    def _items(self) -> List[Tuple[str, Tuple[int, int]]]:
+        table = self.table
+        if self._cache[:2] != (table, table.version):
+            rows = np.flatnonzero(self._mask())
+            points = getattr(table, self.column)[rows].tolist()
+            items = list(zip([table.ids[row] for row in rows.tolist()], map(tuple, points)))
+            self._cache = (table, table.version, items)
+        return self._cache[2]
+
+    def __iter__(self) -> Iterator[str]:
+        return (pid for pid, _ in self._items())
+
+    def __len__(self) -> int:
+        return len(self._items())
+
+    def items(self):
+        return list(self._items())
+
+    def values(self):
+        return [point for _, point in self.items()]
@@ -1,101 +1,236 @@
 import csv
+import heapq
 import json
+import os
 import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import tsp_solver
+from product_table import PointsView, Product, ProductsView, ProductTable
+from run_store import RunStore
+from sampling import (
+    UsageLedger,
+    changeover_matrix,
+    compute_quotas,
+    consecutive_changeovers,
+    encode_samples,
+    iter_quota_samples,
+    popcount,
+    SparseChangeovers,
+    weighted_changeover_matrix,
+)
+
+
+# Матрицы смен ночей (матрица, размеры выборок), общие для всех задач процесса пула
+_NIGHT_MATRICES = None
+
+
+def _init_night_worker(matrices):
+    global _NIGHT_MATRICES
+    _NIGHT_MATRICES = matrices
+
+
+def _night_restarts_worker(night_idx: int, seeds: List[int], deadline: float, strategy: str,
+                           exact: bool) -> Tuple[int, List[int], float, int]:
+    """Перезапуски оптимизации одной ночи в процессе пула: (ночь, порядок, смены, перезапуски)"""
+    matrix, sizes = _NIGHT_MATRICES[night_idx]
+    if exact:
+        order, cost = tsp_solver.held_karp_open_path(matrix.astype(float))
+        return night_idx, order, cost, 1
+
+    # Только функции над матрицей смен: состояние RouteOptimizer процессу не нужно
+    best_order, best_cost, done = None, None, 0
+    for k, seed in enumerate(seeds):
+        if done and time.time() > deadline:
+            break
+        rng = random.Random(seed)
+        # Чередование - по номеру перезапуска в пакете: при четном числе процессов все семена
+        # пакета одной четности, и по семени процесс делал бы только возмущения или только жадные
+        if best_order is not None and k % 2:
+            # Каждый второй перезапуск - возмущение лучшего найденного порядка
+            order = tsp_solver.double_bridge(best_order, rng)
+        else:
+            order = RouteOptimizer._greedy_optimize_group(matrix, sizes, start_idx=rng.randrange(len(matrix)))
+        order = RouteOptimizer._local_improvement_2opt(matrix, order, strategy)
+        cost = RouteOptimizer._order_score(matrix, order)
+        if best_cost is None or cost < best_cost:
+            best_order, best_cost = order, cost
+        done += 1
+    return night_idx, best_order, best_cost, done
 
 
 @dataclass
-class Product:
-    id: str
-    name: str
-    x: int = -1
-    y: int = -1
-    access_x: int = -1
-    access_y: int = -1
-    amount: int = 0  # Новое поле для количества
+class CostModel:
+    """Модель времени ночи: переезды робота и смены товаров между экспериментами
+
+    Смена товара (снять или поставить) стоит changeover_time плюс поход оператора
+    к стеллажу товара от точки старта и обратно со скоростью restock_speed.
+    """
+    robot_speed: float = 0.5  # м/с
+    changeover_time: float = 30.0  # с на одну смену товара
+    restock_speed: float = 1.0  # м/с
+    pick_time: float = 10.0  # с на взятие одного товара роботом
+    travel_weight: float = 1.0
+    changeover_weight: float = 1.0
 
 
 class RouteOptimizer:
     def __init__(self):
-        self.products = {}
-        self.placed_products = {}
-        self.access_points = {}
+        # Товары хранятся по столбцам; products, placed_products и access_points - словарные
+        # представления таблицы для совместимости
+        self.table = ProductTable()
+        self.products = ProductsView(self.table)
+        self.placed_products = PointsView(self.table, "xy")
+        self.access_points = PointsView(self.table, "access")
+        # Все варианты точек доступа товара (первый - основной из access_points)
+        self.access_candidates = {}
+        # Таблица расстояний (м) между стартом, финишем и точками доступа товаров
+        self.distance_table = None
+        self.distance_index = {}
+        # Совместная модель времени (смены + переезды); None - только число смен
+        self.cost_model = None
+        # Хранилище маршрутов текущего запуска генерации (открывается при первом обращении)
+        self.run_store = None
 
     def load_products(self, filepath: str):
-        """Загрузка товаров из CSV"""
-        self.products.clear()
-        self.placed_products.clear()
-        self.access_points.clear()
-        
-        with open(filepath, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                product = Product(
-                    id=row["ID"],
-                    name=row["Название"],
-                    x=int(row.get("X", -1)) if row.get("X") else -1,
-                    y=int(row.get("Y", -1)) if row.get("Y") else -1,
-                    access_x=int(row.get("Access_X", -1)) if row.get("Access_X") else -1,
-                    access_y=int(row.get("Access_Y", -1)) if row.get("Access_Y") else -1,
-                    amount=int(row.get("Amount", 0)) if row.get("Amount") else 0,
-                )
-                self.products[product.id] = product
-                if product.x >= 0 and product.y >= 0:
-                    self.placed_products[product.id] = (product.x, product.y)
-                    if product.access_x >= 0 and product.access_y >= 0:
-                        self.access_points[product.id] = (product.access_x, product.access_y)
+        """Загрузка товаров из CSV (столбцы целиком преобразуются в массивы)"""
+        self.access_candidates.clear()
+
+        with open(filepath, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            rows = [row for row in reader if row]
+        if any(len(row) < len(header) for row in rows):
+            rows = [row + [""] * (len(header) - len(row)) for row in rows]
+        columns = dict(zip(header, zip(*rows))) if rows else {}
+
+        def int_column(name: str, default: int) -> np.ndarray:
+            values = columns.get(name)
+            if values is None:
+                return np.full(len(rows), default, dtype=np.int64)
+            return np.fromiter((int(value) if value.strip() else default for value in values),
+                               dtype=np.int64, count=len(values))
+
+        ids = list(columns["ID"]) if rows else []
+        names = list(columns["Название"]) if rows else []
+        xy = np.stack([int_column("X", -1), int_column("Y", -1)], axis=1)
+        access = np.stack([int_column("Access_X", -1), int_column("Access_Y", -1)], axis=1)
+        self.table = ProductTable.from_columns(ids, names, xy, access, int_column("Amount", 0))
+        self.products.table = self.placed_products.table = self.access_points.table = self.table
+
+        # Дополнительные точки доступа: "x:y;x:y" (только у товаров с основной точкой доступа;
+        # у повторяющегося ID, как и остальные значения, - из последней строки)
+        self.access_candidates.update((pid, [point]) for pid, point in self.access_points.items())
+        for pid, alternates in dict(zip(ids, columns.get("Access_Alt", ()))).items():
+            if pid not in self.access_candidates:
+                continue
+            for item in alternates.split(";"):
+                if ":" in item:
+                    ax, ay = item.split(":")
+                    self.access_candidates[pid].append((int(ax), int(ay)))
 
     def save_products(self, filepath: str):
         """Сохранение товаров с координатами и точками доступа"""
+        table = self.table
+        # Проверяем, есть ли товары с amount > 0
+        has_amounts = bool((table.amount > 0).any())
+        has_alternates = any(len(c) > 1 for c in self.access_candidates.values())
+
+        # Без Amount и Access_Alt пишется старый формат
+        header = ["ID", "Название", "X", "Y", "Access_X", "Access_Y"]
+        columns = [table.ids, table.names, *table.xy.T.tolist(), *table.access.T.tolist()]
+        if has_amounts:
+            header.append("Amount")
+            columns.append(table.amount.tolist())
+        if has_alternates:
+            header.append("Access_Alt")
+            columns.append([";".join(f"{ax}:{ay}" for ax, ay in self.access_candidates.get(pid, [])[1:])
+                            for pid in table.ids])
+
         with open(filepath, "w", encoding="utf-8", newline="") as f:
             writer = csv.writer(f)
-            # Проверяем, есть ли товары с amount > 0
-            has_amounts = any(p.amount > 0 for p in self.products.values())
-            
-            if has_amounts:
-                writer.writerow(["ID", "Название", "X", "Y", "Access_X", "Access_Y", "Amount"])
-                for product in self.products.values():
-                    writer.writerow([
-                        product.id, product.name, 
-                        product.x, product.y,
-                        product.access_x, product.access_y, product.amount
-                    ])
-            else:
-                # Старый формат без Amount
-                writer.writerow(["ID", "Название", "X", "Y", "Access_X", "Access_Y"])
-                for product in self.products.values():
-                    writer.writerow([
-                        product.id, product.name, 
-                        product.x, product.y,
-                        product.access_x, product.access_y
-                    ])
-
-    def place_product(self, product_id: str, x: int, y: int, access_point: Tuple[int, int] = None):
-        """Размещение товара на карте с точкой доступа"""
-        if product_id in self.products:
-            self.products[product_id].x = x
-            self.products[product_id].y = y
-            self.placed_products[product_id] = (x, y)
+            writer.writerow(header)
+            writer.writerows(zip(*columns))
+
+    def place_product(self, product_id: str, x: int, y: int, access_point: Tuple[int, int] = None,
+                      access_candidates: List[Tuple[int, int]] = None):
+        """Размещение товара на карте с точкой доступа (и дополнительными вариантами доступа)"""
+        row = self.table.row(product_id)
+        if row is not None:
+            self.table.place(row, x, y, access_point)
             
             if access_point:
-                self.products[product_id].access_x = access_point[0]
-                self.products[product_id].access_y = access_point[1]
-                self.access_points[product_id] = access_point
+                access_point = tuple(access_point)
+                candidates = [access_point]
+                for point in access_candidates or []:
+                    if tuple(point) != access_point:
+                        candidates.append(tuple(point))
+                self.access_candidates[product_id] = candidates
+
+    def update_access_candidates(self, map_processor, max_radius: int = 50) -> int:
+        """Поиск дополнительных точек доступа для уже размещенных товаров. Возвращает число товаров,
+        получивших больше одной точки доступа"""
+        updated = 0
+        for pid, (x, y) in self.placed_products.items():
+            if pid not in self.access_points:
+                continue
+            primary = self.access_points[pid]
+            candidates = [primary]
+            for point in map_processor.find_access_candidates(x, y, max_radius=max_radius):
+                if point != primary and all(abs(point[0] - c[0]) + abs(point[1] - c[1]) > 2 * map_processor.robot_radius_pixels + 2
+                                            for c in candidates):
+                    candidates.append(point)
+            self.access_candidates[pid] = candidates
+            if len(candidates) > 1:
+                updated += 1
+        return updated
 
     def get_product_at(self, x: int, y: int, tolerance: int = 5) -> Product:
-        """Получение товара по координатам"""
-        for product in self.products.values():
-            if product.x >= 0 and product.y >= 0:
-                if abs(product.x - x) <= tolerance and abs(product.y - y) <= tolerance:
-                    return product
-        return None
+        """Получение ближайшего к координатам товара (не дальше tolerance по каждой оси)"""
+        row = self.table.nearest_in_square(x, y, tolerance)
+        return self.table.product(row) if row is not None else None
+
+    def _spatial_grid(self, access: bool):
+        return self.table.access_grid if access else self.table.grid
+
+    def nearest_product(self, x: int, y: int, max_distance: Optional[float] = None,
+                        access: bool = False) -> Optional[Product]:
+        """Ближайший размещенный товар (access=True - по точкам доступа)"""
+        row = self._spatial_grid(access).nearest(x, y, max_distance)
+        return self.table.product(row) if row is not None else None
+
+    def products_in_radius(self, x: int, y: int, radius: float, access: bool = False) -> List[str]:
+        """ID товаров в радиусе от точки, от ближних к дальним (access=True - по точкам доступа)"""
+        return [self.table.ids[row] for row in self._spatial_grid(access).in_radius(x, y, radius)]
+
+    def products_in_rect(self, x1: int, y1: int, x2: int, y2: int, access: bool = False) -> List[str]:
+        """ID товаров в прямоугольнике (access=True - по точкам доступа)"""
+        return [self.table.ids[row] for row in sorted(self._spatial_grid(access).in_rect(x1, y1, x2, y2))]
+
+    def products_on_shelf(self, shelf: Tuple[int, int, int, int], margin: int = 2) -> List[str]:
+        """ID товаров, размещенных на стеллаже (x1, y1, x2, y2) или у его границы"""
+        x1, y1, x2, y2 = shelf
+        return self.products_in_rect(min(x1, x2) - margin, min(y1, y2) - margin,
+                                     max(x1, x2) + margin, max(y1, y2) + margin)
 
     def generate_samples(
         self, num_samples: int, sample_size: int = 5
     ) -> List[List[str]]:
         """Генерация случайных выборок товаров (оригинальный метод)"""
+        return list(self.iter_samples(num_samples, sample_size))
+
+    def iter_samples(
+        self, num_samples: int, sample_size: int = 5, ledger: Optional[UsageLedger] = None
+    ) -> Iterator[List[str]]:
+        """Потоковая генерация случайных выборок (ledger - журнал для продолжения)"""
         # Используем только товары с точками доступа
         placed_ids = [id for id in self.access_points.keys()]
 
@@ -104,24 +239,49 @@ class RouteOptimizer:
                 f"Недостаточно размещенных товаров с точками доступа. Нужно минимум {sample_size}, есть {len(placed_ids)}"
             )
 
-        samples = []
-        for _ in range(num_samples):
-            sample = random.sample(placed_ids, sample_size)
-            samples.append(sample)
+        ledger = ledger or UsageLedger(num_samples, sample_size)
 
-        return samples
+        def stream():
+            while ledger.left > 0:
+                sample = random.sample(placed_ids, ledger.sample_size)
+                ledger.record(sample)
+                yield sample
+
+        return stream()
 
     def generate_samples_with_limits(
         self, num_samples: int, sample_size: int = 5
     ) -> List[List[str]]:
         """Генерация выборок товаров с учетом ограничений по количеству"""
-        available_ids = [id for id in self.access_points.keys() 
-                        if self.products[id].amount > 0]
+        return list(self.iter_samples_with_limits(num_samples, sample_size))
+
+    def iter_samples_with_limits(
+        self, num_samples: int, sample_size: int = 5, ledger: Optional[UsageLedger] = None
+    ) -> Iterator[List[str]]:
+        """Потоковая генерация выборок с учетом количества
+
+        Проверка допустимости и расчет квот выполняются сразу при вызове, выборки
+        строятся лениво. ledger - сохраненный журнал для продолжения генерации.
+        При заданной cost_model товары подбираются с учетом переезда робота и смен.
+        """
+        ledger = ledger or self.create_usage_ledger(num_samples, sample_size)
+        scorer = None
+        if self.cost_model is not None:
+            if self.distance_table is None:
+                raise ValueError("Сначала рассчитайте таблицу расстояний (build_distance_table)")
+            scorer = self._joint_scorer()
+        return iter_quota_samples(ledger, scorer=scorer)
+
+    def create_usage_ledger(self, num_samples: int, sample_size: int = 5) -> UsageLedger:
+        """Журнал расхода с квотами товаров для генерации с учетом количества"""
+        table = self.table
+        rows = np.flatnonzero(table.access_mask() & (table.amount > 0))
+        available_ids = [table.ids[row] for row in rows.tolist()]
 
         if len(available_ids) < 1:
             raise ValueError("Нет товаров с доступом и количеством > 0")
 
-        total_capacity = sum(self.products[id].amount for id in available_ids)
+        total_capacity = int(table.amount[rows].sum())
         required_total = num_samples * sample_size
         
         if total_capacity < required_total:
@@ -130,61 +290,14 @@ class RouteOptimizer:
                 f"Требуется {required_total}, доступно {total_capacity}"
             )
 
-        # Пытаемся сгенерировать выборки несколько раз
-        max_attempts = 10
-        for attempt in range(max_attempts):
-            try:
-                return self._generate_samples_attempt(num_samples, sample_size, available_ids)
-            except ValueError:
-                if attempt == max_attempts - 1:
-                    raise ValueError(f"Не удалось сгенерировать выборки за {max_attempts} попыток")
-                continue
-
-    def _generate_samples_attempt(self, num_samples: int, sample_size: int, available_ids: List[str]) -> List[List[str]]:
-        """Одна попытка генерации выборок с уникальными товарами"""
-        usage_count = {id: 0 for id in available_ids}
-        samples = []
-
-        for sample_idx in range(num_samples):
-            sample = []
-            
-            for pos in range(sample_size):
-                # Находим кандидатов с весами (исключаем уже использованные в текущей выборке)
-                candidates = []
-                weights = []
-                
-                for product_id in available_ids:
-                    # Проверяем общий лимит товара
-                    if usage_count[product_id] >= self.products[product_id].amount:
-                        continue
-                    # Проверяем уникальность в текущей выборке
-                    if product_id in sample:
-                        continue
-                    
-                    candidates.append(product_id)
-                    # Вес обратно пропорционален использованию
-                    remaining = self.products[product_id].amount - usage_count[product_id]
-                    weight = remaining * 10 + random.random()  # Добавляем случайность
-                    weights.append(weight)
-                
-                if not candidates:
-                    raise ValueError(f"Нет кандидатов для выборки {sample_idx + 1}, позиция {pos + 1}")
-                
-                # Выбираем с учетом весов (приоритет товарам с большим остатком)
-                max_weight = max(weights)
-                best_candidates = [candidates[i] for i, w in enumerate(weights) if w >= max_weight * 0.8]
-                selected_product = random.choice(best_candidates)
-                
-                sample.append(selected_product)
-                usage_count[selected_product] += 1
-            
-            samples.append(sample)
-
-        return samples
+        # Квоты гарантируют допустимость, поэтому повторные попытки не нужны
+        amounts = dict(zip(available_ids, table.amount[rows].tolist()))
+        quotas = compute_quotas(amounts, num_samples, sample_size)
+        return UsageLedger(num_samples, sample_size, quotas)
 
     def has_amount_data(self) -> bool:
         """Проверка, есть ли данные о количестве товаров"""
-        return any(p.amount > 0 for p in self.products.values())
+        return bool((self.table.amount > 0).any())
 
     def get_usage_statistics(self, samples: List[List[str]]) -> Dict[str, int]:
         """Получение статистики использования товаров в выборках"""
@@ -202,6 +315,11 @@ class RouteOptimizer:
                 coords.append(self.access_points[pid])
         return coords
 
+    def get_access_candidates(self, product_ids: List[str]) -> List[List[Tuple[int, int]]]:
+        """Получение всех вариантов точек доступа для списка товаров"""
+        return [self.access_candidates.get(pid, [self.access_points[pid]])
+                for pid in product_ids if pid in self.access_points]
+
     def get_product_coordinates(self, product_ids: List[str]) -> List[Tuple[int, int]]:
         """Получение координат для списка товаров"""
         coords = []
@@ -210,17 +328,152 @@ class RouteOptimizer:
                 coords.append(self.placed_products[pid])
         return coords
 
+    def build_distance_table(self, map_processor, start: Tuple[int, int], end: Tuple[int, int],
+                             product_ids: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Расчет таблицы расстояний (в метрах) между стартом, финишем и точками доступа
+        
+        Индексы строк хранятся в distance_index: "start", "end" и ID товаров.
+        product_ids - только эти товары (например, товары готовых выборок), иначе все
+        товары с точками доступа: таблица растет как квадрат числа точек.
+        """
+        if product_ids is None:
+            ids = list(self.access_points.keys())
+        else:
+            ids = [pid for pid in dict.fromkeys(product_ids) if pid in self.access_points]
+        points = [start, end] + [self.access_points[pid] for pid in ids]
+        self.distance_table = map_processor.compute_distance_table(points) * map_processor.scale
+        self.distance_index = {"start": 0, "end": 1}
+        for i, pid in enumerate(ids):
+            self.distance_index[pid] = i + 2
+        return self.distance_table
+
+    def _route_by_table(self, product_ids: List[str], time_budget: float = 0.02) -> Tuple[List[str], float]:
+        """Порядок обхода и длина маршрута (м) по таблице расстояний"""
+        stops = list(dict.fromkeys(product_ids))
+        idx = [self.distance_index["start"]] + [self.distance_index[pid] for pid in stops] + [self.distance_index["end"]]
+        sub = self.distance_table[np.ix_(idx, idx)]
+        order, cost = tsp_solver.solve_path(sub, 0, len(idx) - 1, time_budget)
+        return [stops[i - 1] for i in order[1:-1]], cost
+
+    def trip_drops(self, trip_samples: List[List[str]], ordered_products: List[str]) -> Dict:
+        """Отслеживание выборок в объединенном рейсе: какие выборки обслуживает каждая
+        остановка и на какой остановке выборка собрана полностью"""
+        position = {pid: i for i, pid in enumerate(ordered_products)}
+        picks = [[] for _ in ordered_products]
+        drops = []
+        for sample_idx, sample in enumerate(trip_samples):
+            for pid in sample:
+                picks[position[pid]].append(sample_idx)
+            drops.append(max(position[pid] for pid in sample))
+        return {"picks": picks, "drops": drops}
+
+    def plan_waves(self, samples: List[List[str]], max_samples_per_trip: int = 3,
+                   capacity: int = 15, neighbors: int = 6) -> Tuple[List[Dict], Dict]:
+        """Объединение выборок в рейсы робота (волновая сборка)
+        
+        Рейсы объединяются жадно по наибольшей экономии расстояния (метод сбережений)
+        среди ближайших по маршруту выборок при ограничениях на число выборок в рейсе
+        и вместимость (число единиц товара). Требует build_distance_table.
+        Возвращает список рейсов и сводку экономии.
+        """
+        if self.distance_table is None:
+            raise ValueError("Сначала рассчитайте таблицу расстояний (build_distance_table)")
+        for sample in samples:
+            for pid in sample:
+                if pid not in self.distance_index:
+                    raise ValueError(f"Товар {pid} отсутствует в таблице расстояний")
+
+        m = len(samples)
+        separate = [self._route_by_table(sample)[1] for sample in samples]
+
+        # Близость выборок: среднее расстояние от точек одной до ближайших точек другой
+        stop_idx = [[self.distance_index[pid] for pid in sample] for sample in samples]
+        width = max((len(s) for s in stop_idx), default=0)
+        padded = np.array([s + [s[-1]] * (width - len(s)) for s in stop_idx]) if m else np.zeros((0, 0), int)
+        candidates = []
+        for a in range(m):
+            nearest = self.distance_table[padded[a][:, None, None], padded[None, :, :]].min(axis=2)
+            proximity = nearest.mean(axis=0)
+            proximity[a] = np.inf
+            k = min(neighbors, m - 1)
+            candidates.append(set(np.argsort(proximity)[:k].tolist()) if k > 0 else set())
+
+        # Активные рейсы: номер -> выборки и длина маршрута
+        trips = {i: {"samples": [i], "cost": separate[i]} for i in range(m)}
+        owner = list(range(m))
+        next_id = m
+        heap = []
+
+        def merge_gain(a, b):
+            members = trips[a]["samples"] + trips[b]["samples"]
+            if len(members) > max_samples_per_trip:
+                return None
+            if sum(len(samples[i]) for i in members) > capacity:
+                return None
+            products = [pid for i in members for pid in samples[i]]
+            _, cost = self._route_by_table(products)
+            return trips[a]["cost"] + trips[b]["cost"] - cost, cost
+
+        def push_pairs(t):
+            near = {owner[i] for s in trips[t]["samples"] for i in candidates[s]}
+            for other in near - {t}:
+                if other in trips:
+                    gain = merge_gain(t, other)
+                    if gain is not None and gain[0] > 1e-9:
+                        heapq.heappush(heap, (-gain[0], t, other, gain[1]))
+
+        for t in range(m):
+            push_pairs(t)
+
+        while heap:
+            _, a, b, cost = heapq.heappop(heap)
+            if a not in trips or b not in trips:
+                continue
+            merged = trips.pop(a)["samples"] + trips.pop(b)["samples"]
+            trips[next_id] = {"samples": merged, "cost": cost}
+            for i in merged:
+                owner[i] = next_id
+            push_pairs(next_id)
+            next_id += 1
+
+        result = []
+        for trip in sorted(trips.values(), key=lambda t: min(t["samples"])):
+            members = sorted(trip["samples"])
+            trip_samples = [samples[i] for i in members]
+            ordered, cost = self._route_by_table([pid for s in trip_samples for pid in s])
+            separate_cost = sum(separate[i] for i in members)
+            info = {
+                "trip": len(result) + 1,
+                "samples": members,
+                "products": ordered,
+                "distance": round(cost, 2),
+                "separate_distance": round(separate_cost, 2),
+                "saved_distance": round(separate_cost - cost, 2),
+            }
+            info.update(self.trip_drops(trip_samples, ordered))
+            result.append(info)
+
+        total_separate = sum(separate)
+        total_merged = sum(t["distance"] for t in result)
+        report = {
+            "samples": m,
+            "trips": len(result),
+            "separate_distance": round(total_separate, 2),
+            "merged_distance": round(total_merged, 2),
+            "saved_distance": round(total_separate - total_merged, 2),
+            "saved_percent": (1 - total_merged / total_separate) * 100 if total_separate > 0 else 0.0,
+        }
+        return result, report
+
     def save_route_info(
         self,
         route_id: int,
         products: List[str],
         distance: float,
         path: List[Tuple[int, int]],
+        extra: Optional[Dict] = None,
     ):
-        """Сохранение информации о маршруте"""
-        # Убедимся, что директория существует
-        Path("output/routes").mkdir(parents=True, exist_ok=True)
-
+        """Сохранение информации о маршруте (extra - дополнительные поля, например состав рейса)"""
         info = {
             "route_id": route_id,
             "products": products,
@@ -243,80 +496,178 @@ class RouteOptimizer:
                     detail["amount"] = p.amount
                 info["product_details"].append(detail)
 
-        filepath = f"output/routes/route_{route_id}_info.json"
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(info, f, ensure_ascii=False, indent=2)
-        print(f"Информация о маршруте сохранена: {filepath}")
+        if extra:
+            info.update(extra)
+
+        self.get_run_store().save_route(info)
+
+    def get_run_store(self) -> RunStore:
+        """Хранилище маршрутов текущего запуска"""
+        if self.run_store is None:
+            self.run_store = RunStore()
+        return self.run_store
+
+    def start_run(self, generation_type: str = ""):
+        """Начало нового запуска генерации: маршруты прежнего запуска удаляются"""
+        self.get_run_store().reset(generation_type)
 
     def export_routes_to_csv(self, filepath: str = "output/routes/routes_summary.csv"):
         """Экспорт всех маршрутов в упрощенный CSV"""
-        import glob
-        import json
-        
-        route_files = glob.glob("output/routes/route_*_info.json")
-        if not route_files:
+        store = self.get_run_store()
+        if store.count() == 0:
             raise ValueError("Нет сохраненных маршрутов для экспорта")
         
-        routes_data = []
-        for file in sorted(route_files, key=lambda x: int(x.split('_')[1])):
-            with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                routes_data.append(data)
-        
-        max_products = max(len(route['products']) for route in routes_data)
+        max_products = store.max_products()
         
         # Упрощенные заголовки - только ID товаров
         headers = ["№ Выборки"]
         for i in range(1, max_products + 1):
             headers.append(f"Товар {i}")
         
+        count = 0
         with open(filepath, 'w', encoding='utf-8', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(headers)
             
-            for route in routes_data:
-                row = [route['route_id']]
-                
+            for route_id, products in store.iter_products():
                 # Только ID товаров
-                for i in range(max_products):
-                    if i < len(route['products']):
-                        row.append(route['products'][i])
-                    else:
-                        row.append("")
-                
-                writer.writerow(row)
+                writer.writerow([route_id] + products + [""] * (max_products - len(products)))
+                count += 1
         
-        return len(routes_data)
+        return count
     
-    def optimize_samples_order(self, samples: List[List[str]], group_size: int = 15) -> List[List[str]]:
-        """Улучшенная оптимизация порядка выборок"""
+    def optimize_samples_order(self, samples: List[List[str]], group_size: int = 15,
+                               strategy: str = "first", solver: str = "auto") -> List[List[str]]:
+        """Улучшенная оптимизация порядка выборок
+
+        solver: "exact" - точный порядок каждой ночи (Хелд-Карп, ночь больше
+        tsp_solver.OPEN_PATH_EXACT_LIMIT выборок - ValueError), "heuristic" - жадный алгоритм
+        с 2-opt/Or-opt (strategy - "first" или "best"), "auto" - точный, если в ночи не больше
+        tsp_solver.OPEN_PATH_EXACT_LIMIT выборок.
+        """
         if not samples:
             return samples
         
         # Разбиваем на группы (ночи) и оптимизируем каждую отдельно
-        groups = []
-        for i in range(0, len(samples), group_size):
-            group = samples[i:i + group_size]
-            groups.append(group)
-        
-        optimized_groups = []
-        for group_idx, group in enumerate(groups):
-            print(f"Оптимизирую ночь {group_idx + 1}: {len(group)} выборок...")
-            optimized_group = self._optimize_single_group(group)
-            optimized_groups.append(optimized_group)
-        
-        # Объединяем обратно
         result = []
-        for group in optimized_groups:
+        for group in self.iter_nights(samples, group_size, strategy=strategy, solver=solver):
             result.extend(group)
         
         return result
 
-    def _optimize_single_group(self, samples: List[List[str]]) -> List[List[str]]:
-        """Оптимизация одной группы (ночи)"""
+    def iter_nights(self, samples: Iterable[List[str]], group_size: int = 15,
+                    first_night: int = 1, strategy: str = "first",
+                    solver: str = "auto") -> Iterator[List[List[str]]]:
+        """Потоковая разбивка выборок на ночи с оптимизацией порядка внутри каждой
+
+        В памяти одновременно находится только одна ночь.
+        """
+        samples = iter(samples)
+        night = first_night
+        while True:
+            group = list(islice(samples, group_size))
+            if not group:
+                return
+            print(f"Оптимизирую ночь {night}: {len(group)} выборок...")
+            yield self._optimize_single_group(group, strategy, solver)
+            night += 1
+
+    def run_campaign(self, map_processor, start: Tuple[int, int], end: Tuple[int, int],
+                     num_samples: int, sample_size: int = 5, group_size: int = 15,
+                     ledger_path: str = "output/campaign/ledger.json",
+                     output: str = "output/campaign/routes.csv") -> Dict:
+        """Потоковый расчет длинной серии экспериментов
+
+        Выборки генерируются, упорядочиваются по ночам и маршрутизируются по одной ночи
+        за раз; строки маршрутов дописываются в CSV, а журнал расхода сохраняется после
+        каждой ночи. При повторном вызове с тем же журналом расчет продолжается
+        с первой незавершенной ночи.
+        """
+        ledger = UsageLedger.load(ledger_path)
+        if ledger is not None and (ledger.num_samples, ledger.sample_size) != (num_samples, sample_size):
+            raise ValueError(
+                f"Журнал {ledger_path} создан для {ledger.num_samples} выборок по {ledger.sample_size} товаров"
+            )
+
+        resumed = ledger is not None and ledger.produced > 0
+        if ledger is None:
+            if self.has_amount_data():
+                ledger = self.create_usage_ledger(num_samples, sample_size)
+            else:
+                ledger = UsageLedger(num_samples, sample_size)
+
+        if ledger.quotas is not None:
+            samples = self.iter_samples_with_limits(num_samples, sample_size, ledger)
+        else:
+            samples = self.iter_samples(num_samples, sample_size, ledger)
+
+        if resumed:
+            print(f"Продолжение серии: выполнено {ledger.produced} из {num_samples} выборок")
+
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        if not resumed:
+            with open(output, "w", encoding="utf-8", newline="") as f:
+                headers = ["Ночь", "№ Выборки", "Расстояние, м"]
+                headers += [f"Товар {i}" for i in range(1, sample_size + 1)]
+                csv.writer(f).writerow(headers)
+
+        routed = failed = 0
+        total_distance = 0.0
+        first_night = ledger.produced // group_size + 1
+        sample_no = ledger.produced
+
+        for night, group in enumerate(self.iter_nights(samples, group_size, first_night), first_night):
+            rows = []
+            for sample in group:
+                sample_no += 1
+                candidates = self.get_access_candidates(sample)
+                if any(len(options) > 1 for options in candidates):
+                    path, distance, order, _ = map_processor.find_clustered_route(start, candidates, end)
+                else:
+                    path, distance, order = map_processor.find_optimal_route_simple(
+                        start, self.get_access_coordinates(sample), end
+                    )
+                if path:
+                    ordered = [sample[idx] for idx in order] if order else sample
+                    rows.append([night, sample_no, round(distance, 2)] + ordered)
+                    total_distance += distance
+                    routed += 1
+                else:
+                    rows.append([night, sample_no, ""] + sample)
+                    failed += 1
+
+            with open(output, "a", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerows(rows)
+            ledger.save(ledger_path)
+            print(f"Ночь {night} сохранена: выполнено {ledger.produced} из {num_samples} выборок")
+
+        return {
+            "samples": ledger.produced,
+            "routed": routed,
+            "failed": failed,
+            "distance": round(float(total_distance), 2),
+            "output": output,
+            "ledger": ledger_path,
+        }
+
+    def _optimize_single_group(self, samples: List[List[str]], strategy: str = "first",
+                               solver: str = "auto") -> List[List[str]]:
+        """Оптимизация одной группы (ночи)
+
+        Выборки кодируются битовыми множествами, все этапы работают с матрицей смен
+        (при заданной cost_model - с матрицей времени смен, см. _changeover_costs).
+        """
         if len(samples) <= 1:
             return samples
+        self._check_exact_night(solver, len(samples))
         
+        matrix, sizes = self._changeover_costs(samples)
+
+        if solver == "exact" or (solver == "auto" and len(samples) <= tsp_solver.OPEN_PATH_EXACT_LIMIT):
+            # Доказуемо минимальное число смен за ночь
+            order, _ = tsp_solver.held_karp_open_path(matrix.astype(float))
+            return [samples[i] for i in order]
+
         best_order = None
         best_score = float('inf')
         
@@ -324,111 +675,502 @@ class RouteOptimizer:
         num_attempts = min(len(samples), 5)  # Не больше 5 попыток
         for attempt in range(num_attempts):
             # Жадный алгоритм с разными стартовыми точками
-            current_order = self._greedy_optimize_group(samples, start_idx=attempt)
+            current_order = self._greedy_optimize_group(matrix, sizes, start_idx=attempt)
             
-            # Локальные улучшения (2-opt)
-            improved_order = self._local_improvement_2opt(current_order)
+            # Локальные улучшения (2-opt, Or-opt)
+            improved_order = self._local_improvement_2opt(matrix, current_order, strategy)
             
             # Оцениваем качество
-            score = self._calculate_group_score(improved_order)
+            score = self._order_score(matrix, improved_order)
             
             if score < best_score:
                 best_score = score
                 best_order = improved_order
         
-        return best_order
+        return [samples[i] for i in best_order]
 
-    def _greedy_optimize_group(self, samples: List[List[str]], start_idx: int = 0) -> List[List[str]]:
-        """Жадный алгоритм для одной группы с выбором стартовой точки"""
-        if not samples:
-            return samples
-        
-        optimized = []
-        remaining = samples.copy()
+    @staticmethod
+    def _greedy_optimize_group(matrix: np.ndarray, sizes: np.ndarray, start_idx: int = 0) -> List[int]:
+        """Жадный алгоритм для одной группы с выбором стартовой точки (порядок индексов выборок)"""
+        remaining = list(range(len(matrix)))
+        if not remaining:
+            return remaining
         
         # Начинаем с лучшей стартовой точки
         if start_idx < len(remaining):
             current = remaining.pop(start_idx)
         else:
             current = remaining.pop(0)
-        optimized.append(current)
+        optimized = [current]
         
         while remaining:
-            best_next = None
-            best_overlap = -1
-            best_index = -1
-            
-            # Ищем выборку с максимальным пересечением
-            for i, candidate in enumerate(remaining):
-                overlap = len(set(current) & set(candidate))
-                if overlap > best_overlap:
-                    best_overlap = overlap
-                    best_next = candidate
-                    best_index = i
-            
-            if best_next is not None:
-                current = remaining.pop(best_index)
-                optimized.append(current)
-            else:
-                current = remaining.pop(0)
-                optimized.append(current)
+            # Ищем выборку с максимальным пересечением: |A & B| = (|A| + |B| - |A xor B|) / 2
+            overlap = sizes[current] + sizes[remaining] - matrix[current, remaining]
+            best_index = int(np.argmax(overlap))
+            current = remaining.pop(best_index)
+            optimized.append(current)
         
         return optimized
 
-    def _local_improvement_2opt(self, samples: List[List[str]]) -> List[List[str]]:
-        """Локальные улучшения методом 2-opt"""
-        improved = samples.copy()
-        n = len(improved)
-        
-        if n <= 2:
-            return improved
-        
-        improved_found = True
-        while improved_found:
-            improved_found = False
-            current_score = self._calculate_group_score(improved)
-            
-            # Пробуем все возможные обмены соседних пар
-            for i in range(n - 1):
-                for j in range(i + 2, min(i + 6, n)):  # Ограничиваем область поиска
-                    # Пробуем обратить участок от i до j
-                    new_order = improved.copy()
-                    new_order[i:j+1] = reversed(new_order[i:j+1])
-                    
-                    new_score = self._calculate_group_score(new_order)
-                    if new_score < current_score:
-                        improved = new_order
-                        current_score = new_score
-                        improved_found = True
-                        break
-                
-                if improved_found:
-                    break
-        
-        return improved
+    @staticmethod
+    def _local_improvement_2opt(matrix: np.ndarray, order: List[int], strategy: str = "first") -> List[int]:
+        """Локальные улучшения методами 2-opt и Or-opt по матрице смен
+
+        Ходы оцениваются по разности стоимости замененных ребер за O(1), окрестность полная;
+        концы последовательности свободны. strategy - "first" или "best" (см. tsp_solver.two_opt_path).
+        """
+        return tsp_solver.improve_open_path(matrix, order, strategy)
+
+    @staticmethod
+    def _order_score(matrix: np.ndarray, order: List[int]) -> float:
+        """Стоимость смен товаров при порядке выборок order по матрице смен"""
+        if len(order) <= 1:
+            return 0
+        return matrix[order[:-1], order[1:]].sum().item()
+
+    def _check_exact_night(self, solver: str, size: int):
+        """Точный порядок ночи (Хелд-Карп, экспоненциален по числу выборок) - только для небольших ночей"""
+        if solver == "exact" and size > tsp_solver.OPEN_PATH_EXACT_LIMIT:
+            raise ValueError(
+                f"Точный порядок доступен для ночей до {tsp_solver.OPEN_PATH_EXACT_LIMIT} выборок, "
+                f"в ночи {size}: используйте solver=\"heuristic\" или \"auto\""
+            )
+
+    def _changeover_costs(self, samples: List[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Матрица стоимости смен между выборками и "размеры" выборок для жадного алгоритма
+
+        Без cost_model - число смен |A xor B| и число товаров. С cost_model смена товара
+        стоит его времени смены (changeover_weights), матрица - сумма весов A xor B.
+        """
+        if self.cost_model is None:
+            bits, _ = encode_samples(samples)
+            return changeover_matrix(bits), popcount(bits)
+        costs = SparseChangeovers(samples, self.changeover_weights)
+        return costs.submatrix(list(range(len(samples)))), costs.totals
+
+    def changeover_weights(self, product_ids: List[str]) -> np.ndarray:
+        """Взвешенное время смены каждого товара (с) по cost_model
+
+        Поход оператора к стеллажу считается по таблице расстояний от точки старта,
+        если она рассчитана и содержит товар.
+        """
+        model = self.cost_model or CostModel()
+        weights = np.full(len(product_ids), model.changeover_time, dtype=float)
+        if self.distance_table is not None:
+            for i, pid in enumerate(product_ids):
+                if pid in self.distance_index:
+                    walk = self.distance_table[self.distance_index["start"], self.distance_index[pid]]
+                    weights[i] += 2 * walk / model.restock_speed
+        return weights * model.changeover_weight
+
+    def _joint_scorer(self):
+        """Стоимость добавления товара в выборку при генерации по cost_model:
+        приближенный прирост переезда робота (до ближайшей точки выборки, старта или финиша)
+        и смена товара, если его не было в предыдущей выборке"""
+        model = self.cost_model
+        index = self.distance_index
+        table = self.distance_table
+
+        def score(sample, previous, pid):
+            if pid not in index:
+                return np.inf
+            anchors = [index["start"], index["end"]] + [index[q] for q in sample if q in index]
+            travel = table[anchors, index[pid]].min() / model.robot_speed * model.travel_weight
+            change = 0.0 if previous and pid in previous else self.changeover_weights([pid])[0]
+            return travel + change
+
+        return score
+
+    def night_time_report(self, nights: List[List[List[str]]]) -> Dict:
+        """Время ночей по cost_model: переезды робота и смены товаров (с)
+
+        Нужна таблица расстояний (build_distance_table).
+        """
+        if self.distance_table is None:
+            raise ValueError("Сначала рассчитайте таблицу расстояний (build_distance_table)")
+        model = self.cost_model or CostModel()
+        report = {"nights": [], "travel_time": 0.0, "changeover_time": 0.0, "total_time": 0.0}
+        for night_idx, night in enumerate(nights):
+            travel = sum(self._route_by_table(sample)[1] for sample in night) / model.robot_speed * model.travel_weight
+            changeover = 0.0
+            if len(night) > 1:
+                bits, index = encode_samples(night)
+                matrix = weighted_changeover_matrix(bits, self.changeover_weights(list(index)))
+                changeover = self._order_score(matrix, list(range(len(night))))
+            report["nights"].append({"night": night_idx + 1, "travel_time": round(travel, 1),
+                                     "changeover_time": round(changeover, 1),
+                                     "total_time": round(travel + changeover, 1)})
+            report["travel_time"] += travel
+            report["changeover_time"] += changeover
+        report["total_time"] = report["travel_time"] + report["changeover_time"]
+        return report
 
     def _calculate_group_score(self, samples: List[List[str]]) -> float:
-        """Вычисляет общий счет группы (меньше = лучше)"""
+        """Вычисляет общий счет группы (меньше = лучше)
+
+        Количество изменений = товары которые нужно убрать + товары которые нужно добавить.
+        """
         if len(samples) <= 1:
             return 0
         
-        total_changes = 0
-        for i in range(len(samples) - 1):
-            try:
-                current_set = set(samples[i])
-                next_set = set(samples[i + 1])
-                # Количество изменений = товары которые нужно убрать + товары которые нужно добавить
-                changes = len(current_set - next_set) + len(next_set - current_set)
-                total_changes += changes
-            except TypeError as e:
-                # Если ошибка с типами, выводим отладочную информацию
-                print(f"Ошибка в _calculate_group_score: {e}")
-                print(f"samples[{i}]: {samples[i]}")
-                print(f"samples[{i+1}]: {samples[i+1]}")
-                print(f"Тип samples[{i}][0]: {type(samples[i][0]) if samples[i] else 'empty'}")
-                raise
-        
-        return total_changes
+        bits, _ = encode_samples(samples)
+        return int(consecutive_changeovers(bits).sum())
+
+    def plan_nights(self, samples: List[List[str]], group_size: int = 15, time_budget: float = 2.0,
+                    solver: str = "auto", compare: bool = True) -> Tuple[List[List[List[str]]], Dict]:
+        """Глобальное планирование ночей: разбиение всех выборок на ночи, затем порядок внутри ночи
+
+        В отличие от нарезки подряд идущих выборок, в одну ночь попадают выборки с общими
+        товарами, где бы они ни стояли в списке. Возвращает ночи и отчет: статистику
+        analyze_night_efficiency для глобального плана ("global"), для нарезки по порядку
+        ("chunked", если compare) и выигрыш ("gain").
+        """
+        partition = self._partition_nights(samples, group_size, time_budget)
+        nights = [self._optimize_single_group([samples[i] for i in night], solver=solver) for night in partition]
+
+        report = {"global": self.analyze_night_efficiency(nights)}
+        if compare:
+            chunked = self.group_samples_by_nights(self.optimize_samples_order(samples, group_size, solver=solver),
+                                                   group_size)
+            report["chunked"] = self.analyze_night_efficiency(chunked)
+            report["gain"] = self._night_plan_gain(report["chunked"], report["global"])
+            gain = report["gain"]
+            print(f"Глобальное разбиение на ночи: уникальных товаров за ночь "
+                  f"{report['chunked']['avg_products_per_night']:.1f} -> {report['global']['avg_products_per_night']:.1f}, "
+                  f"смен {gain['changes_before']} -> {gain['changes_after']} (-{gain['changes_saved_percent']:.1f}%)")
+        return nights, report
+
+    def optimize_nights_parallel(self, nights: List[List[List[str]]], restarts: int = 32,
+                                 time_budget: float = 5.0, workers: Optional[int] = None,
+                                 strategy: str = "first", solver: str = "auto") -> Tuple[List[List[List[str]]], Dict]:
+        """Параллельная оптимизация порядка в ночах: ночи и перезапуски распределяются по пулу процессов
+
+        Матрицы смен всех ночей передаются каждому процессу один раз при запуске пула.
+        Небольшие ночи решаются точно (как в _optimize_single_group), остальные - restarts
+        перезапусками жадного алгоритма из случайных выборок и возмущений лучшего порядка
+        с 2-opt/Or-opt, пока не исчерпан time_budget. Возвращает лучшие порядки и отчет:
+        статистику analyze_night_efficiency до ("before") и после ("after") и смены по ночам.
+        """
+        workers = workers or os.cpu_count() or 1
+        for night in nights:
+            self._check_exact_night(solver, len(night))
+        matrices = []
+        for night in nights:
+            matrices.append(self._changeover_costs(night))
+
+        # Исходный порядок - отправная точка, результат не может быть хуже
+        best = {idx: (list(range(len(night))), self._order_score(matrices[idx][0], list(range(len(night)))))
+                for idx, night in enumerate(nights)}
+        used = {idx: 0 for idx in range(len(nights))}
+
+        deadline = time.time() + time_budget
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_night_worker,
+                                 initargs=(matrices,)) as pool:
+            futures = []
+            for idx, night in enumerate(nights):
+                if len(night) <= 2:
+                    continue
+                exact = solver == "exact" or (solver == "auto" and len(night) <= tsp_solver.OPEN_PATH_EXACT_LIMIT)
+                if exact:
+                    futures.append(pool.submit(_night_restarts_worker, idx, [0], deadline, strategy, True))
+                    continue
+                seeds = [idx * restarts + k for k in range(restarts)]
+                for chunk in range(min(workers, restarts)):
+                    futures.append(pool.submit(_night_restarts_worker, idx, seeds[chunk::workers],
+                                               deadline, strategy, False))
+
+            for future in as_completed(futures):
+                idx, order, cost, done = future.result()
+                used[idx] += done
+                if order is not None and cost < best[idx][1]:
+                    best[idx] = (order, cost)
+
+        result = [[night[i] for i in best[idx][0]] for idx, night in enumerate(nights)]
+        report = {
+            "before": self.analyze_night_efficiency(nights),
+            "after": self.analyze_night_efficiency(result),
+        }
+        report["nights"] = [
+            {
+                "night": idx + 1,
+                "changes_before": before["total_changes"],
+                "changes_after": after["total_changes"],
+                "restarts": used[idx],
+            }
+            for idx, (before, after) in enumerate(zip(report["before"]["nights"], report["after"]["nights"]))
+        ]
+        report["gain"] = self._night_plan_gain(report["before"], report["after"])
+        print(f"Параллельная оптимизация ночей ({workers} процессов): смен "
+              f"{report['gain']['changes_before']} -> {report['gain']['changes_after']}")
+        return result, report
+
+    def _night_plan_gain(self, before: Dict, after: Dict) -> Dict:
+        """Выигрыш плана ночей after относительно before в терминах analyze_night_efficiency"""
+        changes_before = sum(n['total_changes'] for n in before['nights'])
+        changes_after = sum(n['total_changes'] for n in after['nights'])
+        return {
+            'avg_products_per_night': before['avg_products_per_night'] - after['avg_products_per_night'],
+            'efficiency_score': after['efficiency_score'] - before['efficiency_score'],
+            'changes_before': changes_before,
+            'changes_after': changes_after,
+            'changes_saved': changes_before - changes_after,
+            'changes_saved_percent': (1 - changes_after / changes_before) * 100 if changes_before > 0 else 0.0,
+        }
+
+    def _partition_nights(self, samples: List[List[str]], group_size: int,
+                          time_budget: float = 2.0) -> List[List[int]]:
+        """Сбалансированное разбиение выборок на ночи по group_size с минимумом уникальных товаров за ночь
+
+        1. Жадный рост: ночь начинается с первой свободной выборки и пополняется выборкой,
+           добавляющей меньше всего новых товаров (корзины по числу новых товаров, выбор за O(1)).
+        2. Локальный поиск: обмены выборок между ночами с общими товарами и переносы в неполную
+           ночь, пока уменьшается суммарное число уникальных товаров или не исчерпан бюджет.
+        Уникальные товары ночи определяют и нижнюю границу смен, порядок подбирается после.
+        """
+        m = len(samples)
+        sets = [set(sample) for sample in samples]
+        by_product = defaultdict(list)
+        for idx, products in enumerate(sets):
+            for pid in products:
+                by_product[pid].append(idx)
+
+        # 1. Жадный рост ночей
+        assigned = [False] * m
+        nights = []
+        next_seed = 0
+        while next_seed < m:
+            overlap = {}
+            buckets = defaultdict(dict)  # число новых товаров -> выборки (порядок вставки)
+            union = set()
+            night = []
+
+            def add(idx):
+                assigned[idx] = True
+                night.append(idx)
+                if idx in overlap:
+                    del buckets[len(sets[idx]) - overlap.pop(idx)][idx]
+                for pid in sets[idx] - union:
+                    union.add(pid)
+                    for other in by_product[pid]:
+                        if assigned[other]:
+                            continue
+                        old = overlap.get(other, 0)
+                        if old:
+                            del buckets[len(sets[other]) - old][other]
+                        overlap[other] = old + 1
+                        buckets[len(sets[other]) - old - 1][other] = None
+
+            while next_seed < m and assigned[next_seed]:
+                next_seed += 1
+            if next_seed == m:
+                break
+            add(next_seed)
+            while len(night) < group_size:
+                candidate = next((next(iter(b)) for _, b in sorted(buckets.items()) if b), None)
+                if candidate is None:
+                    while next_seed < m and assigned[next_seed]:
+                        next_seed += 1
+                    if next_seed == m:
+                        break
+                    candidate = next_seed
+                add(candidate)
+            nights.append(night)
+
+        # 2. Локальный поиск обменами и переносами
+        night_of = [0] * m
+        counts = []
+        for night_idx, night in enumerate(nights):
+            counts.append(Counter(pid for idx in night for pid in sets[idx]))
+            for idx in night:
+                night_of[idx] = night_idx
+
+        def removal_delta(counter, leaving, staying):
+            return -sum(1 for pid in leaving - staying if counter[pid] == 1)
+
+        def addition_delta(counter, coming, leaving):
+            return sum(1 for pid in coming - leaving if counter[pid] == 0)
+
+        def move(idx, src, dst):
+            nights[src].remove(idx)
+            nights[dst].append(idx)
+            counts[src].subtract(sets[idx])
+            counts[dst].update(sets[idx])
+            night_of[idx] = dst
+
+        deadline = time.perf_counter() + time_budget
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for s in range(m):
+                a = night_of[s]
+                targets = {night_of[other] for pid in sets[s] for other in by_product[pid]} - {a}
+                best_delta, best_move = 0, None
+                empty = set()
+                for b in targets:
+                    if len(nights[b]) < group_size:
+                        delta = (removal_delta(counts[a], sets[s], empty)
+                                 + addition_delta(counts[b], sets[s], empty))
+                        if delta < best_delta:
+                            best_delta, best_move = delta, (b, None)
+                    for t in nights[b]:
+                        delta = (removal_delta(counts[a], sets[s], sets[t]) + addition_delta(counts[a], sets[t], sets[s])
+                                 + removal_delta(counts[b], sets[t], sets[s]) + addition_delta(counts[b], sets[s], sets[t]))
+                        if delta < best_delta:
+                            best_delta, best_move = delta, (b, t)
+                if best_move is not None:
+                    b, t = best_move
+                    move(s, a, b)
+                    if t is not None:
+                        move(t, b, a)
+                    improved = True
+                if time.perf_counter() > deadline:
+                    break
+
+        return [sorted(night) for night in nights if night]
+
+    def pack_nights(self, samples: List[List[str]], night_budget: float = 8 * 3600,
+                    time_budget: float = 2.0, group_size: int = 15) -> Tuple[List[List[List[str]]], Dict]:
+        """Упаковка экспериментов в ночи по времени (night_budget, с) вместо group_size выборок на ночь
+
+        Длительность эксперимента - переезд по маршруту (таблица расстояний, скорость робота)
+        плюс взятие товаров, к ней добавляется время смен товаров между соседями в ночи
+        (модель cost_model или CostModel по умолчанию). First-fit decreasing вставляет
+        эксперимент в первую ночь, куда он помещается с учетом смен, на лучшее место
+        последовательности; затем локальный поиск расформировывает наименее загруженные ночи,
+        и порядок каждой ночи оптимизируется. Возвращает ночи и отчет с загрузкой ночей
+        и сравнением с нарезкой по group_size выборок подряд.
+        """
+        if self.distance_table is None:
+            raise ValueError("Сначала рассчитайте таблицу расстояний (build_distance_table)")
+        if not samples:
+            return [], {"nights": [], "num_nights": 0}
+
+        model = self.cost_model or CostModel()
+        durations = np.array([
+            self._route_by_table(sample)[1] / model.robot_speed * model.travel_weight + model.pick_time * len(sample)
+            for sample in samples
+        ])
+        too_long = int(np.argmax(durations))
+        if durations[too_long] > night_budget:
+            raise ValueError(
+                f"Выборка {too_long + 1} длится {durations[too_long]:.0f} с и не помещается в ночь ({night_budget:.0f} с)"
+            )
+        # Стоимости смен - по разреженным строкам выборок: плотная матрица m x m на масштабе
+        # кампании не помещается в память; для вставки выборки одна строка смен считается по
+        # обратному индексу, приросты по ночам берутся из нее и кэша смен между соседями ночи
+        costs = SparseChangeovers(samples, self.changeover_weights)
+
+        # Ночь - [последовательность выборок, смены между соседями, суммарное время]
+        def make_night(seq):
+            return [seq, costs.links(seq), float(durations[seq].sum()) + sum(costs.links(seq))]
+
+        def insertion(night, row):
+            """Прирост смен, позиция и смены до выборок ночи для вставки выборки со строкой смен row"""
+            seq, links, _ = night
+            if not seq:
+                return 0.0, 0, None
+            row = row[seq]
+            options = np.concatenate(([row[0]], row[:-1] + row[1:] - np.asarray(links), [row[-1]]))
+            pos = int(np.argmin(options))
+            return float(options[pos]), pos, row
+
+        def insert(night, i, delta, pos, row):
+            seq, links, _ = night
+            if seq:
+                # Смена seq[pos - 1] -> seq[pos] (если обе есть) заменяется сменами через i
+                new = ([float(row[pos - 1])] if pos > 0 else []) + ([float(row[pos])] if pos < len(seq) else [])
+                start = max(0, pos - 1)
+                links[start:pos if 0 < pos < len(seq) else start] = new
+            seq.insert(pos, i)
+            night[2] += float(durations[i]) + delta
+
+        def fits(night, i):
+            # Смены удовлетворяют неравенству треугольника, прирост не отрицателен:
+            # ночь без запаса по длительности проверять не нужно
+            return night[2] + durations[i] <= night_budget
+
+        # First-fit decreasing
+        nights = []
+        for i in np.argsort(-durations, kind="stable").tolist():
+            full = costs.full_row(i)
+            for night in nights:
+                if not fits(night, i):
+                    continue
+                delta, pos, row = insertion(night, full)
+                if night[2] + durations[i] + delta <= night_budget:
+                    insert(night, i, delta, pos, row)
+                    break
+            else:
+                nights.append(make_night([i]))
+
+        # Локальный поиск: перенос всех экспериментов наименее загруженной ночи в другие
+        deadline = time.perf_counter() + time_budget
+        improved = True
+        while improved and len(nights) > 1 and time.perf_counter() < deadline:
+            improved = False
+            for victim in sorted(range(len(nights)), key=lambda k: nights[k][2]):
+                trial = [[list(seq), list(links), total] for seq, links, total in nights]
+                moved = True
+                for i in sorted(trial[victim][0], key=lambda k: -durations[k]):
+                    full = costs.full_row(i)
+                    best = None
+                    for k, night in enumerate(trial):
+                        if k == victim or not fits(night, i):
+                            continue
+                        delta, pos, row = insertion(night, full)
+                        if night[2] + durations[i] + delta <= night_budget and (best is None or delta < best[0]):
+                            best = (delta, k, pos, row)
+                    if best is None:
+                        moved = False
+                        break
+                    insert(trial[best[1]], i, best[0], best[2], best[3])
+                if moved:
+                    nights = [night for k, night in enumerate(trial) if k != victim]
+                    improved = True
+                    break
+                if time.perf_counter() > deadline:
+                    break
+
+        # Порядок внутри ночи по времени смен (плотная матрица - только для выборок ночи)
+        for k, (seq, links, total) in enumerate(nights):
+            if len(seq) < 3:
+                continue
+            sub = costs.submatrix(seq)
+            if len(seq) <= tsp_solver.OPEN_PATH_EXACT_LIMIT:
+                order, _ = tsp_solver.held_karp_open_path(sub)
+            else:
+                order = tsp_solver.improve_open_path(sub, list(range(len(seq))))
+            if self._order_score(sub, order) < sum(links):
+                nights[k] = make_night([seq[j] for j in order])
+
+        report = {"night_budget": night_budget, "nights": []}
+        for k, (seq, _, total) in enumerate(nights):
+            report["nights"].append({
+                "night": k + 1,
+                "experiments": len(seq),
+                "work_time": round(float(durations[seq].sum()), 1),
+                "changeover_time": round(total - float(durations[seq].sum()), 1),
+                "total_time": round(total, 1),
+                "utilization": total / night_budget,
+            })
+        report["num_nights"] = len(nights)
+        # Нижняя граница: в ночи из n экспериментов n - 1 смен, каждая не дешевле
+        # самой дешевой смены эксперимента, поэтому K ночей вмещают не больше K * (бюджет + max min)
+        cheapest = costs.cheapest() if len(samples) > 1 else np.zeros(1)
+        report["lower_bound_nights"] = int(np.ceil(
+            (durations.sum() + cheapest.sum()) / (night_budget + cheapest.max()) - 1e-9
+        ))
+
+        # Сравнение с нарезкой по group_size выборок подряд
+        chunks = [list(range(i, min(i + group_size, len(samples))))
+                  for i in range(0, len(samples), group_size)]
+        report["chunked_nights"] = len(chunks)
+        report["chunked_overruns"] = sum(1 for seq in chunks if make_night(seq)[2] > night_budget)
+
+        print(f"Упаковка по времени: {len(samples)} экспериментов -> {len(nights)} ночей "
+              f"(нижняя граница {report['lower_bound_nights']}, по {group_size} подряд - {len(chunks)} ночей, "
+              f"из них с превышением {report['chunked_overruns']})")
+        return [[samples[i] for i in seq] for seq, _, _ in nights], report
 
     def group_samples_by_nights(self, samples: List[List[str]], group_size: int = 15) -> List[List[List[str]]]:
         """Разбивка выборок на группы (ночи)"""
@@ -483,16 +1225,12 @@ class RouteOptimizer:
             night_products = set()
             night_changes = 0
             
-            for sample in night_samples:
-                night_products.update(sample)
+            # Номера товаров в битовых множествах ночи - это и есть ее уникальные товары
+            bits, night_index = encode_samples(night_samples)
+            night_products.update(night_index)
             
-            # Считаем изменения между соседними выборками
-            for i in range(len(night_samples) - 1):
-                current_set = set(night_samples[i])
-                next_set = set(night_samples[i + 1])
-                # Изменения = убрать + добавить
-                changes = len(current_set - next_set) + len(next_set - current_set)
-                night_changes += changes
+            # Считаем изменения между соседними выборками (убрать + добавить)
+            night_changes = int(consecutive_changeovers(bits).sum())
             
             # Максимально возможные изменения для этой ночи
             max_changes_night = (len(night_samples) - 1) * 10  # Если бы все товары были разные
@@ -521,77 +1259,41 @@ class RouteOptimizer:
         return stats
     
     def export_distances_to_csv(self, filepath: str = "output/routes/distances_summary.csv"):
-        """Экспорт дистанций между точками маршрутов в CSV"""
-        import glob
-        import json
-        
-        route_files = glob.glob("output/routes/route_*_info.json")
-        if not route_files:
+        """Экспорт дистанций между точками маршрутов в CSV (столбцов сегментов - по самому длинному маршруту)"""
+        store = self.get_run_store()
+        if store.count() == 0:
             raise ValueError("Нет сохраненных маршрутов для экспорта")
         
-        routes_data = []
-        for file in sorted(route_files, key=lambda x: int(x.split('_')[1])):
-            with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                routes_data.append(data)
-        
         # Заголовки для дистанций между точками
-        headers = [
-            "№ Выборки",
-            "Старт→Товар1", 
-            "Товар1→Товар2",
-            "Товар2→Товар3", 
-            "Товар3→Товар4",
-            "Товар4→Товар5",
-            "Товар5→Финиш",
-            "Общая дистанция"
-        ]
+        num_products = max(store.max_products(), store.max_segments() - 1)
+        headers = ["№ Выборки", "Старт→Товар1"]
+        headers += [f"Товар{i}→Товар{i + 1}" for i in range(1, num_products)]
+        headers += [f"Товар{num_products}→Финиш", "Общая дистанция"]
+        num_segments = num_products + 1
         
+        count = 0
         with open(filepath, 'w', encoding='utf-8', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(headers)
             
-            for route in routes_data:
-                route_id = route['route_id']
-                total_distance = route['distance_meters']
-                
-                # Загружаем детальный путь из отдельного файла
-                path_file = f"output/routes/route_{route_id}_path.json"
-                segment_distances = []
+            # Маршруты вместе с сегментами - одним запросом
+            for route_id, route_products, total_distance, segment_distances in store.iter_segment_distances():
+                segment_distances = [round(distance, 2) for distance in segment_distances]
                 
-                if Path(path_file).exists():
-                    try:
-                        with open(path_file, 'r', encoding='utf-8') as pf:
-                            path_data = json.load(pf)
-                            segments = path_data.get('segments', [])
-                            
-                            # Извлекаем дистанции из сегментов
-                            for segment in segments:
-                                distance = segment.get('distance', 0)
-                                segment_distances.append(round(distance, 2))
-                            
-                            print(f"Маршрут {route_id}: загружено {len(segment_distances)} сегментов из файла")
-                            
-                    except Exception as e:
-                        print(f"Ошибка чтения файла {path_file}: {e}")
-                        segment_distances = []
-                
-                # Если не удалось загрузить детальные данные, распределяем равномерно
+                # Если сегментов нет, распределяем равномерно
                 if not segment_distances:
-                    num_products = len(route['products'])
-                    segments_count = num_products + 1  # старт→товар1, товар1→товар2, ..., товарN→финиш
+                    segments_count = route_products + 1  # старт→товар1, товар1→товар2, ..., товарN→финиш
                     avg_distance = total_distance / segments_count if segments_count > 0 else 0
                     segment_distances = [round(avg_distance, 2)] * segments_count
                     print(f"Маршрут {route_id}: используется равномерное распределение ({segments_count} сегментов)")
                 
-                # Дополняем до 6 сегментов если меньше
-                while len(segment_distances) < 6:
-                    segment_distances.append(0)
-                
-                # Обрезаем если больше 6
-                segment_distances = segment_distances[:6]
+                # Дополняем до числа столбцов, если сегментов меньше: последний сегмент
+                # (→Финиш) остается в последнем столбце
+                padding = [0] * (num_segments - len(segment_distances))
+                segment_distances = segment_distances[:-1] + padding + segment_distances[-1:]
                 
                 row = [route_id] + segment_distances + [round(total_distance, 2)]
                 writer.writerow(row)
+                count += 1
         
-        return len(routes_data)
\ No newline at end of file
+        return count
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+# Отрисовщик со статическим слоем, общий для всех задач процесса пула
+_RENDERER = None
+
+
+def _init_render_worker(renderer):
+    global _RENDERER
+    _RENDERER = renderer
+
+
+def _render_worker(job: Dict) -> int:
+    """Отрисовка и сохранение изображения одного маршрута в процессе пула"""
+    _RENDERER.save(**job)
+    return job["route_id"]
+
+
+def _wrap_text(text: str, max_length: int = 30) -> List[str]:
+    if len(text) <= max_length:
+        return [text]
+    words = text.split()
+    lines = []
+    current_line = ""
+    for word in words:
+        if len(current_line + " " + word) <= max_length:
+            current_line += " " + word if current_line else word
+        else:
+            if current_line:
+                lines.append(current_line)
+            current_line = word
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+
+class RouteRenderer:
+    """Отрисовка изображений маршрутов на кэшированном статическом слое
+
+    Статический слой (карта, разметка и все размещенные товары) рисуется и уменьшается
+    один раз на запуск. Для маршрута на копию слоя наносится только наложение: путь одной
+    ломаной по точкам поворота, товары маршрута, старт и финиш (координаты переводятся
+    в масштаб слоя). Отрисовщик не зависит от Tk и передается в процессы пула целиком.
+    """
+
+    MAP_SCALE = 0.8
+    INFO_WIDTH = 100
+    MAP_MARGIN = 20
+    MAP_TOP = 120
+
+    def __init__(self, markup_image: Image.Image, placed_products: Dict[str, Tuple[int, int]],
+                 access_points: Dict[str, Tuple[int, int]], product_names: Dict[str, str],
+                 start_point: Optional[Tuple[int, int]] = None, end_point: Optional[Tuple[int, int]] = None,
+                 output_dir: str = "output/routes", photos_dir: str = "data/photos"):
+        self.map_size = markup_image.size
+        self.placed_products = dict(placed_products)
+        self.access_points = dict(access_points)
+        self.product_names = dict(product_names)
+        self.start_point = start_point
+        self.end_point = end_point
+        self.output_dir = output_dir
+        self.photos_dir = photos_dir
+        self.base_layer = self._render_base_layer(markup_image)
+        self._fonts = None
+        self._photos = {}
+        self._version = None
+
+    @property
+    def version(self) -> str:
+        """Версия карты: хэш статического слоя, старта/финиша и названий товаров"""
+        if self._version is None:
+            digest = hashlib.sha1(self.base_layer.tobytes())
+            digest.update(json.dumps([self.start_point, self.end_point, sorted(self.product_names.items())],
+                                     ensure_ascii=False).encode("utf-8"))
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    def _render_base_layer(self, markup_image: Image.Image) -> Image.Image:
+        """Карта с разметкой и всеми товарами, уменьшенная до размера на изображении маршрута"""
+        img = markup_image.convert("RGB")
+        draw = ImageDraw.Draw(img)
+        for product_id, (x, y) in self.placed_products.items():
+            if product_id in self.access_points:
+                draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill="yellow", outline="orange")
+                access_x, access_y = self.access_points[product_id]
+                draw.ellipse([access_x - 2, access_y - 2, access_x + 2, access_y + 2], fill="lightgreen", outline="green")
+                draw.line([x, y, access_x, access_y], fill="lightblue", width=1)
+            else:
+                draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill="orange", outline="red")
+            draw.text((x + 5, y - 5), product_id, fill="blue")
+
+        map_width, map_height = self.map_size
+        return img.resize(
+            (int(map_width * self.MAP_SCALE), int(map_height * self.MAP_SCALE)), Image.Resampling.LANCZOS
+        )
+
+    def __getstate__(self):
+        # Шрифты FreeType не сериализуются: в процессе пула загружаются заново
+        state = self.__dict__.copy()
+        state["_fonts"] = None
+        state["_photos"] = {}
+        return state
+
+    def _get_fonts(self):
+        if self._fonts is None:
+            try:
+                self._fonts = (ImageFont.truetype("arial.ttf", 20), ImageFont.truetype("arial.ttf", 16),
+                               ImageFont.truetype("arial.ttf", 14))
+            except OSError:
+                default = ImageFont.load_default()
+                self._fonts = (default, default, default)
+        return self._fonts
+
+    def _get_photo(self, product_id: str) -> Optional[Image.Image]:
+        """Миниатюра фото товара (кэшируется, None - фото нет или не читается)"""
+        if product_id not in self._photos:
+            photo = None
+            for ext in ("jpg", "png"):
+                photo_path = Path(self.photos_dir) / f"{product_id}.{ext}"
+                if photo_path.exists():
+                    try:
+                        photo = Image.open(photo_path)
+                        photo.thumbnail((70, 70), Image.Resampling.LANCZOS)
+                        photo.load()
+                    except Exception:
+                        photo = None
+                    break
+            self._photos[product_id] = photo
+        return self._photos[product_id]
+
+    def render_map(self, corners: List[Tuple[int, int]], products: List[str],
+                   access_used: Optional[List[Tuple[int, int]]] = None) -> Image.Image:
+        """Копия статического слоя с наложением маршрута"""
+        img = self.base_layer.copy()
+        draw = ImageDraw.Draw(img)
+        s = self.MAP_SCALE
+
+        def scaled(x, y):
+            return x * s, y * s
+
+        def circle(x, y, r, **kwargs):
+            x, y = scaled(x, y)
+            draw.ellipse([x - r, y - r, x + r, y + r], **kwargs)
+
+        # Путь - одна ломаная по точкам поворота
+        if len(corners) > 1:
+            draw.line([scaled(x, y) for x, y in corners], fill="red", width=2, joint="curve")
+
+        # Выделение товаров в маршруте
+        for idx, product_id in enumerate(products, 1):
+            if product_id not in self.access_points:
+                continue
+            ax, ay = access_used[idx - 1] if access_used else self.access_points[product_id]
+            circle(ax, ay, 6, fill="yellow", outline="orange", width=2)
+            sx, sy = scaled(ax, ay)
+            draw.text((sx - 3, sy - 5), str(idx), fill="black")
+            if product_id in self.placed_products:
+                x, y = self.placed_products[product_id]
+                draw.line([scaled(ax, ay), scaled(x, y)], fill="orange", width=1)
+                circle(x, y, 3, fill="yellow", outline="red")
+
+        # Отметка старта и финиша
+        if self.start_point:
+            x, y = self.start_point
+            circle(x, y, 5, fill="green", outline="darkgreen", width=2)
+            sx, sy = scaled(x, y)
+            draw.text((sx + 7, sy - 7), "START", fill="green")
+        if self.end_point:
+            x, y = self.end_point
+            circle(x, y, 5, fill="red", outline="darkred", width=2)
+            sx, sy = scaled(x, y)
+            draw.text((sx + 7, sy - 7), "FINISH", fill="red")
+        return img
+
+    def render(self, route_id: int, corners: List[Tuple[int, int]], products: List[str], distance: float,
+               access_used: Optional[List[Tuple[int, int]]] = None) -> Image.Image:
+        """Полное изображение маршрута: карта с наложением, сводка и список товаров с фото"""
+        route_map = self.render_map(corners, products, access_used)
+        bordered_map = Image.new("RGB", (route_map.width + 4, route_map.height + 4), "black")
+        bordered_map.paste(route_map, (2, 2))
+
+        font_title, font_normal, font_small = self._get_fonts()
+        listed = [(product_id, self.product_names[product_id]) for product_id in products
+                  if product_id in self.product_names]
+        wrapped = [_wrap_text(name, 30) for _, name in listed]
+
+        # Высота рассчитывается заранее: блок товара - заголовок, название, фото и отступы
+        map_width, map_height = self.map_size
+        final_width = map_width + self.INFO_WIDTH
+        list_height = 40 + sum(20 + 15 * len(lines) + 5 + 75 + 15 for lines in wrapped)
+        final_height = max(map_height, 800, list_height + 100)
+        final_img = Image.new("RGB", (final_width, final_height), "white")
+        draw = ImageDraw.Draw(final_img)
+
+        # Информация о выборке
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        night_session = ((route_id - 1) // 15) + 1
+        y_pos = 10
+        draw.text((10, y_pos), f"Ночная сессия испытаний №{night_session}", fill="darkblue", font=font_normal)
+        y_pos += 18
+        draw.text((10, y_pos), f"Испытание #{route_id}", fill="black", font=font_title)
+        y_pos += 25
+        draw.text((10, y_pos), f"Расстояние: {distance:.2f} м", fill="black", font=font_normal)
+        y_pos += 18
+        draw.text((10, y_pos), f"Товаров: {len(products)}", fill="black", font=font_normal)
+        y_pos += 18
+        draw.text((10, y_pos), f"Создано: {timestamp}", fill="gray", font=font_small)
+
+        final_img.paste(bordered_map, (self.MAP_MARGIN, self.MAP_TOP))
+
+        # Список товаров справа от карты
+        info_x = self.MAP_MARGIN + bordered_map.width + 30
+        y_pos = 10
+        draw.text((info_x, y_pos), "ТОВАРЫ ДЛЯ СБОРА:", fill="black", font=font_title)
+        y_pos += 30
+        for idx, ((product_id, _), lines) in enumerate(zip(listed, wrapped), 1):
+            draw.text((info_x, y_pos), f"{idx}. ID {product_id}", fill="black", font=font_normal)
+            y_pos += 20
+            for line in lines:
+                draw.text((info_x + 20, y_pos), line, fill="gray", font=font_normal)
+                y_pos += 15
+            y_pos += 5
+
+            photo = self._get_photo(product_id)
+            if photo is not None:
+                final_img.paste(photo, (info_x + 20, y_pos))
+            else:
+                draw.rectangle([(info_x + 20, y_pos), (info_x + 90, y_pos + 70)], outline="gray", width=1)
+                draw.text((info_x + 40, y_pos + 30), "Нет\nфото", fill="gray")
+            y_pos += 75 + 15
+        return final_img
+
+    def save(self, route_id: int, corners: List[Tuple[int, int]], products: List[str], distance: float,
+             access_used: Optional[List[Tuple[int, int]]] = None) -> str:
+        """Отрисовка и сохранение output_dir/route_N.png"""
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        filepath = f"{self.output_dir}/route_{route_id}.png"
+        # Быстрое сжатие: размер файла немного больше, кодирование в разы быстрее
+        self.render(route_id, corners, products, distance, access_used).save(filepath, compress_level=1)
+        return filepath
+
+    def render_all(self, jobs: List[Dict], workers: Optional[int] = None) -> Iterator[int]:
+        """Сохранение изображений маршрутов пулом процессов, выдает номера готовых маршрутов
+
+        jobs - аргументы save (route_id, corners, products, distance, access_used).
+        Статический слой передается каждому процессу один раз при запуске пула.
+        При workers=1 или одном задании отрисовка идет в текущем процессе.
+        """
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        if workers <= 1:
+            for job in jobs:
+                self.save(**job)
+                yield job["route_id"]
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                 initargs=(self,)) as pool:
+            futures = [pool.submit(_render_worker, job) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+class RouteImageCache:
+    """Дисковый кэш изображений маршрутов, отрисовываемых по запросу
+
+    Изображение и миниатюра маршрута лежат в cache_dir под ключом из номера маршрута,
+    версии карты (RouteRenderer.version) и хэша данных маршрута: после изменения карты,
+    товаров или самого маршрута (например, добавления товаров) ключ меняется,
+    и изображение рисуется заново, а устаревшие файлы маршрута удаляются.
+    """
+
+    THUMBNAIL_SIZE = (240, 240)
+
+    def __init__(self, renderer: RouteRenderer, cache_dir: str = "output/routes/cache"):
+        self.renderer = renderer
+        self.cache_dir = Path(cache_dir)
+
+    def _key(self, route_id: int, corners, products, distance, access_used) -> str:
+        route_data = json.dumps([[list(p) for p in corners], products, round(distance, 4),
+                                 [list(p) for p in access_used] if access_used else None], ensure_ascii=False)
+        digest = hashlib.sha1(f"{self.renderer.version}:{route_id}:{route_data}".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def get(self, route_id: int, corners: List[Tuple[int, int]], products: List[str], distance: float,
+            access_used: Optional[List[Tuple[int, int]]] = None) -> Tuple[Path, Path]:
+        """Пути к изображению и миниатюре маршрута (рисуются, если их нет в кэше)"""
+        key = self._key(route_id, corners, products, distance, access_used)
+        image_path = self.cache_dir / f"route_{route_id}_{key}.png"
+        thumb_path = self.cache_dir / f"route_{route_id}_{key}_thumb.png"
+        if image_path.exists() and thumb_path.exists():
+            return image_path, thumb_path
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for stale in self.cache_dir.glob(f"route_{route_id}_*.png"):
+            stale.unlink()
+        img = self.renderer.render(route_id, corners, products, distance, access_used)
+        img.save(image_path, compress_level=1)
+        thumb = self.renderer.render_map(corners, products, access_used)
+        thumb.thumbnail(self.THUMBNAIL_SIZE, Image.Resampling.BILINEAR)
+        thumb.save(thumb_path, compress_level=1)
+        return image_path, thumb_path
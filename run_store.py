@@ -0,0 +1,196 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class RunStore:
+    """Хранилище маршрутов одного запуска генерации в SQLite
+
+    Вместо трех файлов на маршрут (info/path JSON и изображение) данные маршрутов,
+    сегменты и сжатые пути (точки поворота) лежат в одной базе. Запись буферизуется
+    и выполняется пакетами по batch_size маршрутов в одной транзакции; перед чтением
+    буфер сбрасывается автоматически.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS routes (
+            route_id INTEGER PRIMARY KEY,
+            products TEXT NOT NULL,
+            num_products INTEGER NOT NULL,
+            distance REAL NOT NULL,
+            path_length INTEGER NOT NULL,
+            info TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS paths (
+            route_id INTEGER PRIMARY KEY,
+            total_distance REAL,
+            waypoints TEXT,
+            waypoint_indices TEXT,
+            corners TEXT
+        );
+        CREATE TABLE IF NOT EXISTS segments (
+            route_id INTEGER NOT NULL,
+            segment INTEGER NOT NULL,
+            from_label TEXT,
+            to_label TEXT,
+            distance REAL,
+            path_points INTEGER,
+            start_index INTEGER,
+            end_index INTEGER,
+            PRIMARY KEY (route_id, segment)
+        );
+    """
+
+    def __init__(self, filepath: str = "output/routes/run.sqlite", batch_size: int = 500):
+        self.filepath = filepath
+        self.batch_size = batch_size
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(filepath)
+        self.conn.executescript(self.SCHEMA)
+        self._routes = []
+        self._paths = []
+        self._segments = []
+        self._cleared_segments = []
+
+    def reset(self, generation_type: str = ""):
+        """Начало нового запуска: прежние маршруты удаляются"""
+        self._routes, self._paths, self._segments, self._cleared_segments = [], [], [], []
+        with self.conn:
+            for table in ("meta", "routes", "paths", "segments"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [("generation_type", generation_type), ("created", time.strftime("%Y-%m-%d %H:%M:%S"))],
+            )
+
+    def save_route(self, info: Dict):
+        """Добавление (замена) сводки маршрута в буфер записи"""
+        self._routes.append((
+            info["route_id"], json.dumps(info["products"], ensure_ascii=False), len(info["products"]),
+            info["distance_meters"], info["path_length"], json.dumps(info, ensure_ascii=False),
+        ))
+        self._maybe_flush()
+
+    def save_path(self, path_data: Dict):
+        """Добавление (замена) сегментов и сжатого пути маршрута в буфер записи"""
+        route_id = path_data["route_id"]
+        if (route_id,) in self._cleared_segments:
+            # Повторная запись в том же буфере: прежние сегменты должны быть удалены до новых
+            self.flush()
+        self._paths.append((
+            route_id, path_data.get("total_calculated_distance"),
+            json.dumps(path_data.get("waypoints", [])), json.dumps(path_data.get("waypoint_indices", [])),
+            json.dumps(path_data.get("corners", [])),
+        ))
+        self._cleared_segments.append((route_id,))
+        for seg in path_data.get("segments", []):
+            self._segments.append((
+                route_id, seg["segment"], seg.get("from"), seg.get("to"), seg.get("distance"),
+                seg.get("path_points"), seg.get("start_index"), seg.get("end_index"),
+            ))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._routes) + len(self._paths) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Запись буфера одной транзакцией"""
+        if not (self._routes or self._paths):
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO routes (route_id, products, num_products, distance, path_length, info) "
+                "VALUES (?, ?, ?, ?, ?, ?)", self._routes,
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO paths (route_id, total_distance, waypoints, waypoint_indices, corners) "
+                "VALUES (?, ?, ?, ?, ?)", self._paths,
+            )
+            self.conn.executemany("DELETE FROM segments WHERE route_id = ?", self._cleared_segments)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO segments (route_id, segment, from_label, to_label, distance, "
+                "path_points, start_index, end_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._segments,
+            )
+        self._routes, self._paths, self._segments, self._cleared_segments = [], [], [], []
+
+    def _query(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        self.flush()
+        return self.conn.execute(sql, params)
+
+    def count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+    def summaries(self) -> List[Tuple[int, float, int]]:
+        """(номер, расстояние, число товаров) всех маршрутов по порядку"""
+        return self._query("SELECT route_id, distance, num_products FROM routes ORDER BY route_id").fetchall()
+
+    def max_products(self) -> int:
+        return self._query("SELECT COALESCE(MAX(num_products), 0) FROM routes").fetchone()[0]
+
+    def max_segments(self) -> int:
+        return self._query(
+            "SELECT COALESCE(MAX(cnt), 0) FROM (SELECT COUNT(*) AS cnt FROM segments GROUP BY route_id)"
+        ).fetchone()[0]
+
+    def iter_products(self) -> Iterator[Tuple[int, List[str]]]:
+        """(номер, товары в порядке обхода) всех маршрутов"""
+        for route_id, products in self._query("SELECT route_id, products FROM routes ORDER BY route_id"):
+            yield route_id, json.loads(products)
+
+    def load_route(self, route_id: int) -> Optional[Dict]:
+        """Сводка маршрута (как в прежнем route_N_info.json)"""
+        row = self._query("SELECT info FROM routes WHERE route_id = ?", (route_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_path(self, route_id: int) -> Optional[Dict]:
+        """Сегменты и сжатый путь маршрута (как в прежнем route_N_path.json)"""
+        row = self._query(
+            "SELECT total_distance, waypoints, waypoint_indices, corners FROM paths WHERE route_id = ?", (route_id,)
+        ).fetchone()
+        if not row:
+            return None
+        segments = [
+            {"segment": seg, "from": src, "to": dst, "distance": dist, "path_points": points,
+             "start_index": start, "end_index": end}
+            for seg, src, dst, dist, points, start, end in self._query(
+                "SELECT segment, from_label, to_label, distance, path_points, start_index, end_index "
+                "FROM segments WHERE route_id = ? ORDER BY segment", (route_id,)
+            )
+        ]
+        return {
+            "route_id": route_id,
+            "total_segments": len(segments),
+            "segments": segments,
+            "total_calculated_distance": row[0],
+            "waypoints": [tuple(point) for point in json.loads(row[1])],
+            "waypoint_indices": json.loads(row[2]),
+            "corners": json.loads(row[3]),
+        }
+
+    def iter_segment_distances(self) -> Iterator[Tuple[int, int, float, List[float]]]:
+        """(номер, число товаров, расстояние, длины сегментов) всех маршрутов одним запросом"""
+        rows = self._query(
+            "SELECT r.route_id, r.num_products, r.distance, s.distance FROM routes r "
+            "LEFT JOIN segments s ON s.route_id = r.route_id ORDER BY r.route_id, s.segment"
+        )
+        current = None
+        for route_id, num_products, distance, seg_distance in rows:
+            if current is None or current[0] != route_id:
+                if current is not None:
+                    yield current
+                current = (route_id, num_products, distance, [])
+            if seg_distance is not None:
+                current[3].append(seg_distance)
+        if current is not None:
+            yield current
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,449 @@
+import json
+import math
+import random
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class BucketSampler:
+    """Выбор товаров с приоритетом по остатку за O(log n) на выбор
+
+    Товары хранятся в корзинах по величине остатка, размеры корзин - в дереве Фенвика.
+    Корзины и узлы дерева - словари только по встречающимся остаткам, поэтому память
+    не зависит от наибольшего остатка, а операции стоят O(log наибольшего остатка).
+    Выбор равновероятен среди товаров верхнего яруса: остаток не меньше tier_ratio
+    от наибольшего (та же доля 0.8, что и в исходном отборе кандидатов по весу).
+    Выбранный товар исключается до вызова release(), так что товары внутри
+    одной выборки не повторяются.
+    """
+
+    def __init__(self, remaining: Dict[str, int], rng: Optional[random.Random] = None,
+                 tier_ratio: float = 0.8):
+        self.rng = rng or random
+        self.tier_ratio = tier_ratio
+        self.ids = list(remaining.keys())
+        self.index = {pid: idx for idx, pid in enumerate(self.ids)}
+        self.remaining = [max(0, int(remaining[pid])) for pid in self.ids]
+        self.size = max(self.remaining, default=0)
+        self.tree: Dict[int, int] = {}
+        self.buckets: Dict[int, List[int]] = {}
+        self.position = [-1] * len(self.ids)
+        self.held = []
+        self.top = 0
+
+        for idx, amount in enumerate(self.remaining):
+            if amount > 0:
+                self._insert(idx)
+
+    def _add(self, r: int, delta: int):
+        while r <= self.size:
+            self.tree[r] = self.tree.get(r, 0) + delta
+            r += r & -r
+
+    def _prefix(self, r: int) -> int:
+        total = 0
+        while r > 0:
+            total += self.tree.get(r, 0)
+            r -= r & -r
+        return total
+
+    def _find(self, k: int) -> int:
+        """Наименьший остаток r, для которого в корзинах 1..r больше k товаров"""
+        r = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = r + step
+            if nxt <= self.size and self.tree.get(nxt, 0) <= k:
+                r = nxt
+                k -= self.tree.get(nxt, 0)
+            step >>= 1
+        return r + 1
+
+    def _insert(self, idx: int):
+        r = self.remaining[idx]
+        bucket = self.buckets.setdefault(r, [])
+        self.position[idx] = len(bucket)
+        bucket.append(idx)
+        self._add(r, 1)
+        if r > self.top:
+            self.top = r
+
+    def _remove(self, idx: int):
+        r = self.remaining[idx]
+        bucket = self.buckets[r]
+        pos = self.position[idx]
+        last = bucket.pop()
+        if last != idx:
+            bucket[pos] = last
+            self.position[last] = pos
+        self.position[idx] = -1
+        self._add(r, -1)
+        if not bucket:
+            del self.buckets[r]
+            if r == self.top:
+                # Новый наибольший остаток - по дереву, а не перебором пустых уровней
+                available = self.available()
+                self.top = self._find(available - 1) if available else 0
+
+    def available(self) -> int:
+        """Количество товаров, доступных для выбора"""
+        return self._prefix(self.size)
+
+    def draw(self) -> Optional[str]:
+        """Выбор товара из верхнего яруса остатков (None, если выбирать не из чего)"""
+        if self.top == 0:
+            return None
+        low = max(1, math.ceil(self.tier_ratio * self.top - 1e-9))
+        below = self._prefix(low - 1)
+        count = self._prefix(self.top) - below
+        k = below + self.rng.randrange(count)
+        r = self._find(k)
+        idx = self.buckets[r][k - self._prefix(r - 1)]
+
+        self._remove(idx)
+        self.held.append(idx)
+        return self.ids[idx]
+
+    def release(self):
+        """Списание выбранных товаров и возврат их в корзины с уменьшенным остатком"""
+        for idx in self.held:
+            self.remaining[idx] -= 1
+            if self.remaining[idx] > 0:
+                self._insert(idx)
+        self.held = []
+
+    def sample(self, size: int) -> Optional[List[str]]:
+        """Выборка из size разных товаров (None, если товаров не хватает)"""
+        sample = []
+        for _ in range(size):
+            pid = self.draw()
+            if pid is None:
+                self.cancel()
+                return None
+            sample.append(pid)
+        self.release()
+        return sample
+
+    def take(self, pid: str):
+        """Выбор конкретного товара (как при draw)"""
+        idx = self.index[pid]
+        self._remove(idx)
+        self.held.append(idx)
+
+    def put_back(self, pid: str):
+        """Возврат выбранного товара без списания"""
+        idx = self.index[pid]
+        self.held.remove(idx)
+        self._insert(idx)
+
+    def items_with(self, amount: int) -> List[str]:
+        """Товары с заданным остатком, доступные для выбора"""
+        return [self.ids[idx] for idx in self.buckets.get(amount, [])]
+
+    def cancel(self):
+        """Возврат выбранных товаров без списания"""
+        for idx in self.held:
+            self._insert(idx)
+        self.held = []
+
+    def remaining_amounts(self) -> Dict[str, int]:
+        """Текущие остатки товаров"""
+        return dict(zip(self.ids, self.remaining))
+
+
+def max_feasible_samples(amounts: Dict[str, int], sample_size: int) -> int:
+    """Наибольшее число выборок из sample_size разных товаров при заданных остатках
+
+    Товар входит в выборку не более одного раза, поэтому в m выборках он
+    используется не более min(остаток, m) раз; m выборок собрать можно тогда
+    и только тогда, когда сумма min(остаток, m) не меньше m * sample_size.
+    """
+    if sample_size <= 0:
+        return 0
+    low, high = 0, sum(amounts.values()) // sample_size
+    while low < high:
+        mid = (low + high + 1) // 2
+        if sum(min(a, mid) for a in amounts.values()) >= mid * sample_size:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def compute_quotas(amounts: Dict[str, int], num_samples: int, sample_size: int,
+                   rng: Optional[random.Random] = None) -> Dict[str, int]:
+    """Квоты использования товаров: сумма равна num_samples * sample_size, квота не больше
+    остатка и числа выборок. Квоты выравнивают остатки сверху (товары с наибольшим
+    остатком расходуются первыми), как и отбор по наибольшему остатку."""
+    rng = rng or random
+    required = num_samples * sample_size
+    caps = {pid: min(a, num_samples) for pid, a in amounts.items() if a > 0}
+
+    if sum(caps.values()) < required:
+        possible = max_feasible_samples(amounts, sample_size)
+        raise ValueError(
+            f"Невозможно составить {num_samples} выборок по {sample_size} разных товаров: "
+            f"при текущих количествах возможно не более {possible}"
+        )
+
+    def quotas_at(level):
+        return {pid: min(cap, max(0, amounts[pid] - level)) for pid, cap in caps.items()}
+
+    # Наибольший уровень остатка, при котором квот еще хватает
+    low, high = 0, max(amounts.values(), default=0)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if sum(quotas_at(mid).values()) >= required:
+            low = mid
+        else:
+            high = mid - 1
+
+    quotas = quotas_at(low + 1)
+    upper = quotas_at(low)
+    deficit = required - sum(quotas.values())
+    # Недостающие единицы случайно распределяем между товарами на границе уровня
+    boundary = [pid for pid in caps if upper[pid] > quotas[pid]]
+    for pid in rng.sample(boundary, deficit):
+        quotas[pid] += 1
+    return quotas
+
+
+class UsageLedger:
+    """Журнал расхода для потоковой генерации: сколько выборок выдано и остатки квот
+
+    Сохраняется в JSON между ночами, по нему генерация продолжается с места остановки.
+    Для генерации без ограничений quotas = None и учитывается только число выборок.
+    """
+
+    def __init__(self, num_samples: int, sample_size: int, quotas: Optional[Dict[str, int]] = None,
+                 produced: int = 0, used: Optional[Dict[str, int]] = None):
+        self.num_samples = num_samples
+        self.sample_size = sample_size
+        self.quotas = quotas
+        self.produced = produced
+        self.used = used if used is not None else {}
+
+    @property
+    def left(self) -> int:
+        return self.num_samples - self.produced
+
+    def record(self, sample: List[str]):
+        """Учет выданной выборки"""
+        self.produced += 1
+        for pid in sample:
+            self.used[pid] = self.used.get(pid, 0) + 1
+            if self.quotas is not None:
+                self.quotas[pid] -= 1
+
+    def save(self, filepath: str):
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "num_samples": self.num_samples,
+            "sample_size": self.sample_size,
+            "produced": self.produced,
+            "quotas": self.quotas,
+            "used": self.used,
+        }
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, filepath: str) -> Optional["UsageLedger"]:
+        """Загрузка журнала (None, если файла нет)"""
+        if not Path(filepath).exists():
+            return None
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["num_samples"], data["sample_size"], data.get("quotas"),
+                   data.get("produced", 0), data.get("used"))
+
+
+def iter_quota_samples(ledger: UsageLedger, rng: Optional[random.Random] = None,
+                       scorer: Optional[Callable[[List[str], Optional[List[str]], str], float]] = None,
+                       candidates: int = 8) -> Iterator[List[str]]:
+    """Ленивое построение выборок в пределах квот журнала (память - O(число товаров))
+
+    Инвариант: перед очередной выборкой (осталось r выборок) сумма квот равна
+    r * sample_size и каждая квота не больше r. Товары с квотой r обязаны войти
+    в текущую выборку, остальные места заполняются из верхнего яруса квот.
+    Инвариант сохраняется, поэтому построение всегда завершается, а продолжение
+    по сохраненному журналу тоже допустимо.
+
+    scorer(выборка, предыдущая выборка, товар) - стоимость добавления товара: из candidates
+    товаров верхнего яруса берется самый дешевый (любой выбор сохраняет инвариант).
+    """
+    rng = rng or random
+    sampler = BucketSampler(ledger.quotas, rng=rng)
+    previous = None
+
+    while ledger.left > 0:
+        critical = sampler.items_with(ledger.left)
+        for pid in critical:
+            sampler.take(pid)
+        sample = list(critical)
+        while len(sample) < ledger.sample_size:
+            if scorer is None:
+                sample.append(sampler.draw())
+                continue
+            pool = [sampler.draw()]
+            while len(pool) < candidates and sampler.available() > 0:
+                pool.append(sampler.draw())
+            best = min(pool, key=lambda pid: scorer(sample, previous, pid))
+            for pid in pool:
+                if pid != best:
+                    sampler.put_back(pid)
+            sample.append(best)
+        sampler.release()
+        rng.shuffle(sample)
+        ledger.record(sample)
+        previous = sample
+        yield sample
+
+
+# Число единичных битов в каждом байте (для numpy без bitwise_count)
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Число единичных битов по последней оси массива uint64"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    as_bytes = words.view(np.uint8).reshape(words.shape[:-1] + (-1,))
+    return _POPCOUNT8[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def encode_samples(samples: List[List[str]], product_index: Optional[Dict[str, int]] = None
+                   ) -> Tuple[np.ndarray, Dict[str, int]]:
+    """Битовые множества выборок: товары получают плотные номера, выборка - строка слов uint64
+
+    product_index дополняется новыми товарами; по умолчанию номера выдаются заново,
+    так что ширина строки определяется числом товаров в самих выборках.
+    """
+    index = product_index if product_index is not None else {}
+    rows, cols = [], []
+    for row, sample in enumerate(samples):
+        for pid in sample:
+            rows.append(row)
+            cols.append(index.setdefault(pid, len(index)))
+
+    bits = np.zeros((len(samples), max(1, (len(index) + 63) // 64)), dtype=np.uint64)
+    if cols:
+        cols = np.array(cols, dtype=np.uint64)
+        np.bitwise_or.at(bits, (np.array(rows), (cols >> np.uint64(6)).astype(np.intp)),
+                         np.uint64(1) << (cols & np.uint64(63)))
+    return bits, index
+
+
+def changeover_matrix(bits: np.ndarray, block_elements: int = 1 << 22) -> np.ndarray:
+    """Матрица смен товаров между выборками: |A xor B| = убрать + добавить
+
+    Считается блоками строк, чтобы промежуточный массив XOR не превышал block_elements слов.
+    """
+    m, words = bits.shape
+    matrix = np.empty((m, m), dtype=np.int64)
+    step = max(1, block_elements // max(1, m * words))
+    for i in range(0, m, step):
+        matrix[i:i + step] = popcount(bits[i:i + step, None, :] ^ bits[None, :, :])
+    return matrix
+
+
+def consecutive_changeovers(bits: np.ndarray) -> np.ndarray:
+    """Смены товаров между соседними выборками"""
+    if len(bits) < 2:
+        return np.zeros(0, dtype=np.int64)
+    return popcount(bits[:-1] ^ bits[1:])
+
+
+def incidence_matrix(bits: np.ndarray, num_products: int) -> np.ndarray:
+    """Матрица принадлежности товаров выборкам (0/1) из битовых множеств"""
+    cols = np.arange(num_products, dtype=np.uint64)
+    words = bits[:, (cols >> np.uint64(6)).astype(np.intp)]
+    return ((words >> (cols & np.uint64(63))) & np.uint64(1)).astype(np.int64)
+
+
+def weighted_changeover_matrix(bits: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Стоимость смен между выборками при весе смены каждого товара: сумма весов A xor B"""
+    incidence = incidence_matrix(bits, len(weights)).astype(float)
+    totals = incidence @ weights
+    return totals[:, None] + totals[None, :] - 2 * (incidence * weights) @ incidence.T
+
+
+class SparseChangeovers:
+    """Взвешенные смены между выборками без плотной матрицы m x m
+
+    Выборка - разреженная строка номеров товаров (CSR), дополнительно хранится обратный
+    индекс товар -> выборки. Смена A -> B стоит сумму весов A xor B = вес A + вес B -
+    2 * вес (A и B); стоимости считаются по запросу только для нужных пар выборок.
+    weigh(ID товаров) возвращает веса смен товаров (None - каждая смена стоит 1).
+    """
+
+    def __init__(self, samples: List[List[str]],
+                 weigh: Optional[Callable[[List[str]], np.ndarray]] = None):
+        index: Dict[str, int] = {}
+        cols = []
+        lengths = []
+        for sample in samples:
+            unique = list(dict.fromkeys(sample))
+            cols.extend(index.setdefault(pid, len(index)) for pid in unique)
+            lengths.append(len(unique))
+        self.index = index
+        self.size = len(samples)
+        self.cols = np.array(cols, dtype=np.int64)
+        lengths = np.array(lengths, dtype=np.int64)
+        self.indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        rows = np.repeat(np.arange(self.size, dtype=np.int64), lengths)
+        self.weights = (np.ones(len(index)) if weigh is None
+                        else np.asarray(weigh(list(index)), dtype=float))
+        self.totals = np.bincount(rows, weights=self.weights[self.cols], minlength=self.size)
+
+        order = np.argsort(self.cols, kind="stable")
+        self.posting_rows = rows[order]
+        self.posting_ptr = np.searchsorted(self.cols[order], np.arange(len(index) + 1))
+        # Вес товаров текущей строки по номеру товара (после запроса снова нули)
+        self._mark = np.zeros(len(index))
+
+    @staticmethod
+    def _ranges(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Индексы всех диапазонов [start, end) подряд и номер диапазона каждого индекса"""
+        lengths = ends - starts
+        owner = np.repeat(np.arange(len(starts), dtype=np.int64), lengths)
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return offsets + np.arange(int(lengths.sum()), dtype=np.int64), owner
+
+    def row(self, i: int, others) -> np.ndarray:
+        """Стоимости смен от выборки i до выборок others (время пропорционально числу их товаров)"""
+        others = np.asarray(others, dtype=np.int64)
+        own = self.cols[self.indptr[i]:self.indptr[i + 1]]
+        self._mark[own] = self.weights[own]
+        entries, owner = self._ranges(self.indptr[others], self.indptr[others + 1])
+        shared = np.bincount(owner, weights=self._mark[self.cols[entries]], minlength=len(others))
+        self._mark[own] = 0.0
+        return self.totals[i] + self.totals[others] - 2 * shared
+
+    def full_row(self, i: int) -> np.ndarray:
+        """Стоимости смен от выборки i до всех выборок (по обратному индексу)"""
+        own = self.cols[self.indptr[i]:self.indptr[i + 1]]
+        entries, owner = self._ranges(self.posting_ptr[own], self.posting_ptr[own + 1])
+        shared = np.bincount(self.posting_rows[entries], weights=self.weights[own][owner], minlength=self.size)
+        return self.totals[i] + self.totals - 2 * shared
+
+    def submatrix(self, seq: List[int]) -> np.ndarray:
+        """Плотная матрица смен только для выборок seq (например, одной ночи)"""
+        if not seq:
+            return np.zeros((0, 0))
+        return np.array([self.row(i, seq) for i in seq])
+
+    def links(self, seq: List[int]) -> List[float]:
+        """Смены между соседними выборками последовательности"""
+        return [float(self.row(a, [b])[0]) for a, b in zip(seq, seq[1:])]
+
+    def cheapest(self) -> np.ndarray:
+        """Самая дешевая смена от каждой выборки к любой другой"""
+        result = np.zeros(self.size)
+        for i in range(self.size):
+            row = self.full_row(i)
+            row[i] = np.inf
+            result[i] = row.min()
+        return result
@@ -0,0 +1,230 @@
+import math
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class PointGrid:
+    """Равномерная сетка-хэш точек: ключ -> (x, y), ячейка cell x cell пикселей
+
+    Вставка, перемещение и удаление - O(1); запросы по радиусу и прямоугольнику
+    просматривают только пересекающиеся ячейки, ближайшая точка ищется по кольцам ячеек.
+    """
+
+    def __init__(self, cell: int = 32):
+        self.cell = cell
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[int, int]]] = defaultdict(dict)
+        self.points: Dict[Hashable, Tuple[int, int]] = {}
+        # Границы занятых ячеек (при удалении не сужаются - оценка сверху для поиска по кольцам)
+        self.bounds = None
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell), int(y // self.cell)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __contains__(self, key) -> bool:
+        return key in self.points
+
+    def clear(self):
+        self.cells.clear()
+        self.points.clear()
+        self.bounds = None
+
+    def insert(self, key: Hashable, x: int, y: int):
+        """Добавление точки (или перемещение, если ключ уже есть)"""
+        if key in self.points:
+            self.remove(key)
+        self.points[key] = (x, y)
+        cx, cy = self._cell(x, y)
+        self.cells[(cx, cy)][key] = (x, y)
+        if self.bounds is None:
+            self.bounds = (cx, cy, cx, cy)
+        else:
+            bx1, by1, bx2, by2 = self.bounds
+            self.bounds = (min(bx1, cx), min(by1, cy), max(bx2, cx), max(by2, cy))
+
+    def insert_many(self, items: Iterable[Tuple[Hashable, Tuple[int, int]]]):
+        cell = self.cell
+        for key, (x, y) in items:
+            if key in self.points:
+                self.remove(key)
+            self.points[key] = (x, y)
+            self.cells[(x // cell, y // cell)][key] = (x, y)
+        if self.cells:
+            xs = [cx for cx, _ in self.cells]
+            ys = [cy for _, cy in self.cells]
+            self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def remove(self, key: Hashable):
+        point = self.points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        bucket = self.cells[cell]
+        bucket.pop(key, None)
+        if not bucket:
+            del self.cells[cell]
+
+    def _cells_in(self, x1: float, y1: float, x2: float, y2: float):
+        cx1, cy1 = self._cell(min(x1, x2), min(y1, y2))
+        cx2, cy2 = self._cell(max(x1, x2), max(y1, y2))
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+            # Прямоугольник больше занятой области - дешевле перебрать непустые ячейки
+            for (cx, cy), bucket in self.cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    yield bucket
+            return
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    yield bucket
+
+    def in_rect(self, x1: float, y1: float, x2: float, y2: float) -> List[Hashable]:
+        """Ключи точек в прямоугольнике (границы включительно)"""
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        return [key for bucket in self._cells_in(x1, y1, x2, y2)
+                for key, (x, y) in bucket.items() if x1 <= x <= x2 and y1 <= y <= y2]
+
+    def in_radius(self, x: float, y: float, radius: float) -> List[Hashable]:
+        """Ключи точек на расстоянии не больше radius, от ближних к дальним"""
+        found = []
+        for bucket in self._cells_in(x - radius, y - radius, x + radius, y + radius):
+            for key, (px, py) in bucket.items():
+                d2 = (px - x) ** 2 + (py - y) ** 2
+                if d2 <= radius * radius:
+                    found.append((d2, key))
+        found.sort(key=lambda item: item[0])
+        return [key for _, key in found]
+
+    def nearest(self, x: float, y: float, max_distance: Optional[float] = None) -> Optional[Hashable]:
+        """Ключ ближайшей точки (None - точек нет или все дальше max_distance)"""
+        if not self.points:
+            return None
+        cx, cy = self._cell(x, y)
+        # Кольца ячеек дальше самой удаленной занятой ячейки не нужны
+        bx1, by1, bx2, by2 = self.bounds
+        max_ring = max(cx - bx1, bx2 - cx, cy - by1, by2 - cy, 0)
+        if max_distance is not None:
+            max_ring = min(max_ring, int(max_distance // self.cell) + 1)
+        best_key, best_d2 = None, math.inf
+        for ring in range(max_ring + 1):
+            # Точки кольца ring не ближе (ring - 1) * cell: дальше искать бессмысленно
+            if best_key is not None and ((ring - 1) * self.cell) ** 2 > best_d2:
+                break
+            for ox in range(cx - ring, cx + ring + 1):
+                for oy in (range(cy - ring, cy + ring + 1) if ox in (cx - ring, cx + ring) else (cy - ring, cy + ring)):
+                    for key, (px, py) in self.cells.get((ox, oy), {}).items():
+                        d2 = (px - x) ** 2 + (py - y) ** 2
+                        if d2 < best_d2:
+                            best_key, best_d2 = key, d2
+        if max_distance is not None and best_d2 > max_distance * max_distance:
+            return None
+        return best_key
+
+
+class RectGrid:
+    """Равномерная сетка-хэш прямоугольников: ключ -> (x1, y1, x2, y2) с x1 <= x2, y1 <= y2
+
+    Прямоугольник регистрируется во всех ячейках, которые покрывает. Одинаковые ключи
+    допускаются: хранится число вставок, ключ удаляется вместе с последней копией.
+    Запросы возвращают ключи без повторов.
+    """
+
+    def __init__(self, cell: int = 64):
+        self.cell = cell
+        self.cells: Dict[Tuple[int, int], set] = defaultdict(set)
+        self.rects: Dict[Hashable, Tuple[int, int, int, int]] = {}
+        self.counts: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    def __contains__(self, key) -> bool:
+        return key in self.rects
+
+    def clear(self):
+        self.cells.clear()
+        self.rects.clear()
+        self.counts.clear()
+
+    def _cell_range(self, x1: float, y1: float, x2: float, y2: float):
+        c = self.cell
+        return int(x1 // c), int(y1 // c), int(x2 // c), int(y2 // c)
+
+    def insert(self, key: Hashable, rect: Tuple[int, int, int, int]):
+        if key in self.rects:
+            self.counts[key] += 1
+            return
+        x1, y1, x2, y2 = rect
+        rect = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.rects[key] = rect
+        self.counts[key] = 1
+        cx1, cy1, cx2, cy2 = self._cell_range(*rect)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                self.cells[(cx, cy)].add(key)
+
+    def remove(self, key: Hashable):
+        if key not in self.rects:
+            return
+        self.counts[key] -= 1
+        if self.counts[key] > 0:
+            return
+        del self.counts[key]
+        cx1, cy1, cx2, cy2 = self._cell_range(*self.rects.pop(key))
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self.cells[(cx, cy)]
+
+    def at_point(self, x: float, y: float) -> List[Hashable]:
+        """Ключи прямоугольников, содержащих точку (границы включительно)"""
+        bucket = self.cells.get((int(x // self.cell), int(y // self.cell)), ())
+        return [key for key in bucket
+                if self.rects[key][0] <= x <= self.rects[key][2] and self.rects[key][1] <= y <= self.rects[key][3]]
+
+    def in_box(self, x1: float, y1: float, x2: float, y2: float) -> List[Hashable]:
+        """Ключи прямоугольников, пересекающих прямоугольник запроса"""
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        cx1, cy1, cx2, cy2 = self._cell_range(x1, y1, x2, y2)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+            candidates = self.rects.keys()
+        else:
+            candidates = set()
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    candidates.update(self.cells.get((cx, cy), ()))
+        found = []
+        for key in candidates:
+            rx1, ry1, rx2, ry2 = self.rects[key]
+            if rx1 <= x2 and x1 <= rx2 and ry1 <= y2 and y1 <= ry2:
+                found.append(key)
+        return found
+
+    def along_segment(self, x1: float, y1: float, x2: float, y2: float) -> List[Hashable]:
+        """Ключи прямоугольников из ячеек, через которые проходит отрезок (кандидаты для
+        точной проверки пересечения)"""
+        c = self.cell
+        length = max(abs(x2 - x1), abs(y2 - y1))
+        # Шаг вдоль отрезка в пол-ячейки не пропускает ни одной пересекаемой ячейки
+        steps = max(1, int(math.ceil(2 * length / c)))
+        visited = set()
+        found = set()
+        for i in range(steps + 1):
+            t = i / steps
+            x, y = x1 + (x2 - x1) * t, y1 + (y2 - y1) * t
+            cx, cy = int(x // c), int(y // c)
+            # Соседние ячейки - на случай прохода отрезка через угол ячейки
+            for ox in (cx - 1, cx, cx + 1):
+                for oy in (cy - 1, cy, cy + 1):
+                    if (ox, oy) not in visited:
+                        visited.add((ox, oy))
+                        found.update(self.cells.get((ox, oy), ()))
+        return list(found)
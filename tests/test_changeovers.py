@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+import pytest
+
+from sampling import (
+    SparseChangeovers,
+    changeover_matrix,
+    consecutive_changeovers,
+    encode_samples,
+    weighted_changeover_matrix,
+)
+
+
+def random_samples(rng, m, products, size):
+    ids = [f"P{i}" for i in range(products)]
+    return [rng.sample(ids, size) for _ in range(m)]
+
+
+@pytest.mark.parametrize("products", [5, 64, 150])
+def test_changeover_matrix_matches_sets(products):
+    """|A xor B| по битовым множествам совпадает с симметрической разностью множеств"""
+    rng = random.Random(products)
+    samples = random_samples(rng, 30, products, 5)
+    bits, index = encode_samples(samples)
+    assert len(index) == len({pid for sample in samples for pid in sample})
+
+    expected = np.array([[len(set(a) ^ set(b)) for b in samples] for a in samples])
+    # Маленький блок - проверка расчета по частям
+    assert (changeover_matrix(bits, block_elements=64) == expected).all()
+    assert (consecutive_changeovers(bits) == np.diag(expected, 1)).all()
+
+
+def test_weighted_changeovers_sparse_matches_dense():
+    """Разреженные смены совпадают с плотной матрицей весов A xor B"""
+    rng = random.Random(4)
+    samples = random_samples(rng, 25, 40, 4)
+    weights = {f"P{i}": rng.uniform(1, 10) for i in range(40)}
+
+    def weigh(ids):
+        return np.array([weights[pid] for pid in ids])
+
+    bits, index = encode_samples(samples)
+    dense = weighted_changeover_matrix(bits, weigh(list(index)))
+    expected = np.array([[sum(weights[pid] for pid in set(a) ^ set(b)) for b in samples] for a in samples])
+    assert dense == pytest.approx(expected)
+
+    costs = SparseChangeovers(samples, weigh)
+    seq = list(range(len(samples)))
+    assert costs.submatrix(seq) == pytest.approx(expected)
+    assert costs.full_row(3) == pytest.approx(expected[3])
+    assert costs.links([4, 0, 7]) == pytest.approx([expected[4, 0], expected[0, 7]])
+    cheapest = expected + np.diag(np.full(len(samples), np.inf))
+    assert costs.cheapest() == pytest.approx(cheapest.min(axis=1))
@@ -0,0 +1,30 @@
+import random
+
+from PIL import Image
+
+from map_processor import MapProcessor
+
+
+def test_incremental_grid_matches_rebuild(tmp_path):
+    """Стеллажи за границей карты не рисуются, правки сетки совпадают с полным пересчетом"""
+    filepath = tmp_path / "map.png"
+    Image.new("RGB", (120, 80), "white").save(filepath)
+    processor = MapProcessor()
+    processor.load_map(str(filepath))
+
+    processor.add_shelf_rect(-30, -20, -5, -4)
+    processor.add_shelf_rect(130, 10, 150, 20)
+    assert not processor.original_grid.any()
+
+    rng = random.Random(1)
+    for _ in range(30):
+        x, y = rng.randint(-60, 160), rng.randint(-60, 120)
+        processor.add_shelf_rect(x, y, x + rng.randint(0, 40), y + rng.randint(0, 30))
+    processor.add_wall_line(-10, 5, 200, 60)
+    for _ in range(10):
+        processor.remove_shelf_at(rng.randint(0, 119), rng.randint(0, 79))
+
+    original, expanded = processor.original_grid.copy(), processor.grid.copy()
+    processor._rebuild_grid()
+    assert (processor.original_grid == original).all()
+    assert (processor.grid == expanded).all()
@@ -0,0 +1,67 @@
+import csv
+
+import pytest
+
+from route_optimizer import RouteOptimizer
+
+OLD_FORMAT = [
+    ["ID", "Название", "X", "Y", "Access_X", "Access_Y"],
+    ["P1", "Болт М6", "10", "20", "12", "20"],
+    ["P2", "Гайка", "-1", "-1", "-1", "-1"],
+    ["P3", "Шайба, 8 мм", "30", "5", "30", "7"],
+]
+FULL_FORMAT = [
+    ["ID", "Название", "X", "Y", "Access_X", "Access_Y", "Amount", "Access_Alt"],
+    ["P1", "Болт М6", "10", "20", "12", "20", "5", "8:20;10:23"],
+    ["P2", "Гайка", "-1", "-1", "-1", "-1", "0", ""],
+    ["P3", "Шайба, 8 мм", "30", "5", "30", "7", "12", ""],
+    ["P4", "Винт \"DIN\"", "40", "40", "-1", "-1", "3", ""],
+]
+
+
+def write_csv(filepath, rows):
+    with open(filepath, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+
+@pytest.mark.parametrize("rows", [OLD_FORMAT, FULL_FORMAT], ids=["old", "full"])
+def test_load_save_round_trip(tmp_path, rows):
+    """Загрузка и сохранение без изменений дают тот же файл"""
+    source, saved = tmp_path / "products.csv", tmp_path / "saved.csv"
+    write_csv(source, rows)
+    optimizer = RouteOptimizer()
+    optimizer.load_products(str(source))
+    optimizer.save_products(str(saved))
+    assert saved.read_bytes() == source.read_bytes()
+
+
+def test_views_follow_columns(tmp_path):
+    """Словарные представления согласованы со столбцами таблицы"""
+    source = tmp_path / "products.csv"
+    write_csv(source, FULL_FORMAT)
+    optimizer = RouteOptimizer()
+    optimizer.load_products(str(source))
+
+    assert list(optimizer.products) == ["P1", "P2", "P3", "P4"]
+    assert set(optimizer.placed_products) == {"P1", "P3", "P4"}
+    assert dict(optimizer.access_points) == {"P1": (12, 20), "P3": (30, 7)}
+    assert optimizer.products["P3"].amount == 12
+    assert optimizer.access_candidates["P1"] == [(12, 20), (8, 20), (10, 23)]
+    assert int(optimizer.table.amount.sum()) == 20
+
+    optimizer.place_product("P2", 50, 50, (51, 50))
+    assert optimizer.access_points["P2"] == (51, 50)
+    assert optimizer.products["P2"].x == 50
+
+
+def test_duplicate_id_keeps_first_place_and_last_values(tmp_path):
+    """Повторяющийся ID: место первой строки, значения и Access_Alt - последней"""
+    source = tmp_path / "products.csv"
+    write_csv(source, FULL_FORMAT[:2] + [["P1", "Болт М8", "11", "21", "13", "21", "7", "9:21"]] + FULL_FORMAT[2:])
+    optimizer = RouteOptimizer()
+    optimizer.load_products(str(source))
+
+    assert list(optimizer.products) == ["P1", "P2", "P3", "P4"]
+    product = optimizer.products["P1"]
+    assert (product.name, product.x, product.amount) == ("Болт М8", 11, 7)
+    assert optimizer.access_candidates["P1"] == [(13, 21), (9, 21)]
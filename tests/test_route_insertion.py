@@ -0,0 +1,57 @@
+import pytest
+from PIL import Image
+
+from map_processor import MapProcessor
+
+
+@pytest.fixture
+def processor(tmp_path):
+    """Пустая карта 60 x 40 со стеллажом посередине"""
+    filepath = tmp_path / "map.png"
+    Image.new("RGB", (60, 40), "white").save(filepath)
+    processor = MapProcessor()
+    processor.load_map(str(filepath))
+    processor.add_shelf_rect(25, 10, 30, 30)
+    return processor
+
+
+START, END = (2, 2), (57, 37)
+POINTS = [(10, 5), (40, 8), (50, 30), (15, 35)]
+
+
+def route_length(processor, waypoints):
+    return sum(processor.grid_distances(a, [b])[0] for a, b in zip(waypoints, waypoints[1:]))
+
+
+@pytest.mark.parametrize("mode", ["lengths", "grid", "path", "reoptimize"])
+def test_insert_into_route_cheapest_position_and_legs(processor, mode):
+    """Новая точка встает на место с наименьшим приростом, границы участков - в legs"""
+    new_point = (45, 20)
+    bounds = []
+    path, _, order = processor.find_optimal_route_simple(START, POINTS, END, strategy="greedy", legs=bounds)
+    planned = [POINTS[i] for i in order]
+
+    kwargs = {}
+    if mode == "lengths":
+        kwargs["leg_distances"] = [bounds[k + 1] - bounds[k] for k in range(len(bounds) - 1)]
+    elif mode == "path":
+        kwargs.update(path=path, leg_bounds=bounds)
+    elif mode == "reoptimize":
+        kwargs["reoptimize"] = True
+
+    legs = []
+    new_path, distance, route = processor.insert_into_route(START, planned, END, [new_point], legs=legs, **kwargs)
+    all_points = planned + [new_point]
+    waypoints = [START] + [all_points[i] for i in route] + [END]
+
+    assert sorted(route) == list(range(len(all_points)))
+    assert distance == pytest.approx((len(new_path) - 1) * processor.scale)
+    assert len(legs) == len(waypoints)
+    assert all(tuple(new_path[b]) == tuple(w) for b, w in zip(legs, waypoints))
+
+    best = min(route_length(processor, [START] + planned[:k] + [new_point] + planned[k:] + [END])
+               for k in range(len(planned) + 1))
+    if mode == "reoptimize":
+        assert len(new_path) - 1 <= best
+    else:
+        assert len(new_path) - 1 == best
@@ -0,0 +1,147 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from sampling import BucketSampler, UsageLedger, compute_quotas, iter_quota_samples, max_feasible_samples
+
+
+def check_sampler(sampler, remaining, held):
+    """Дерево и корзины согласованы с остатками: доступны товары с остатком > 0 вне выборки"""
+    available = {pid for pid, amount in remaining.items() if amount > 0 and pid not in held}
+    assert sampler.available() == len(available)
+    assert sampler.top == max((remaining[pid] for pid in available), default=0)
+    for amount in set(remaining.values()):
+        expected = {pid for pid in available if remaining[pid] == amount}
+        assert set(sampler.items_with(amount)) == expected
+
+
+def test_bucket_sampler_matches_amounts():
+    """Выбор - только из верхнего яруса, списание уменьшает остаток на единицу"""
+    rng = random.Random(7)
+    remaining = {f"P{i}": rng.choice([0, 1, 2, 3, 5, 8, 40, 10 ** 9]) for i in range(60)}
+    sampler = BucketSampler(remaining, rng=rng)
+    remaining = dict(remaining)
+    check_sampler(sampler, remaining, set())
+
+    for _ in range(300):
+        held = []
+        for _ in range(rng.randint(1, 6)):
+            top = sampler.top
+            pid = sampler.draw()
+            if pid is None:
+                assert sampler.available() == 0
+                break
+            assert pid not in held
+            assert remaining[pid] >= math.ceil(0.8 * top - 1e-9)
+            held.append(pid)
+            check_sampler(sampler, remaining, set(held))
+        if held and rng.random() < 0.3:
+            sampler.put_back(held.pop())
+        if rng.random() < 0.2:
+            sampler.cancel()
+        else:
+            sampler.release()
+            for pid in held:
+                remaining[pid] -= 1
+        check_sampler(sampler, remaining, set())
+        assert sampler.remaining_amounts() == remaining
+
+
+def test_bucket_sampler_sample_exhausts_amounts():
+    """Выборки без повторов, пока хватает товаров; затем None без списания"""
+    remaining = {"A": 3, "B": 2, "C": 2, "D": 1}
+    sampler = BucketSampler(remaining, rng=random.Random(1))
+    samples = []
+    while True:
+        sample = sampler.sample(2)
+        if sample is None:
+            break
+        assert len(set(sample)) == 2
+        samples.append(sample)
+    used = {pid: sum(pid in sample for sample in samples) for pid in remaining}
+    assert all(used[pid] <= remaining[pid] for pid in remaining)
+    assert sum(sampler.remaining_amounts().values()) == sum(remaining.values()) - 2 * len(samples)
+    assert sampler.available() <= 1
+
+
+@pytest.mark.parametrize("amount", [1, 10 ** 9])
+def test_bucket_sampler_single_item(amount):
+    sampler = BucketSampler({"A": amount, "B": 0})
+    assert sampler.draw() == "A"
+    assert sampler.draw() is None
+    sampler.release()
+    assert sampler.remaining_amounts() == {"A": amount - 1, "B": 0}
+
+AMOUNTS = {"A": 9, "B": 6, "C": 4, "D": 4, "E": 2, "F": 1, "G": 1, "H": 0}
+
+
+def collect(ledger, rng, limit=None):
+    samples = []
+    for sample in iter_quota_samples(ledger, rng=rng):
+        samples.append(sample)
+        if limit is not None and len(samples) == limit:
+            break
+    return samples
+
+
+def check_samples(samples, amounts, sample_size):
+    used = Counter(pid for sample in samples for pid in sample)
+    assert all(len(sample) == len(set(sample)) == sample_size for sample in samples)
+    assert all(used[pid] <= amounts.get(pid, 0) for pid in used)
+
+
+@pytest.mark.parametrize("sample_size", [1, 2, 3, 4])
+def test_quota_samples_respect_amounts(sample_size):
+    """Квоты в сумме дают все места выборок, выборки не выходят за остатки"""
+    num_samples = max_feasible_samples(AMOUNTS, sample_size)
+    quotas = compute_quotas(AMOUNTS, num_samples, sample_size, rng=random.Random(3))
+    assert sum(quotas.values()) == num_samples * sample_size
+    assert all(0 <= quota <= min(AMOUNTS[pid], num_samples) for pid, quota in quotas.items())
+
+    ledger = UsageLedger(num_samples, sample_size, dict(quotas))
+    samples = collect(ledger, random.Random(5))
+    assert len(samples) == num_samples
+    check_samples(samples, AMOUNTS, sample_size)
+    assert Counter(pid for sample in samples for pid in sample) == Counter(
+        {pid: quota for pid, quota in quotas.items() if quota})
+
+
+@pytest.mark.parametrize("sample_size", [2, 3, 4])
+def test_quotas_report_infeasible(sample_size):
+    """На одну выборку больше допустимого - ValueError с допустимым числом"""
+    possible = max_feasible_samples(AMOUNTS, sample_size)
+    with pytest.raises(ValueError, match=f"не более {possible}"):
+        compute_quotas(AMOUNTS, possible + 1, sample_size)
+
+
+def test_max_feasible_samples_brute_force():
+    """Граница совпадает с перебором: выборки из разных товаров жадно по наибольшему остатку"""
+    rng = random.Random(11)
+    for _ in range(50):
+        amounts = {f"P{i}": rng.randint(0, 6) for i in range(rng.randint(1, 7))}
+        sample_size = rng.randint(1, 4)
+        left, count = dict(amounts), 0
+        while True:
+            top = sorted((pid for pid in left if left[pid] > 0), key=lambda pid: -left[pid])[:sample_size]
+            if len(top) < sample_size:
+                break
+            for pid in top:
+                left[pid] -= 1
+            count += 1
+        assert max_feasible_samples(amounts, sample_size) == count
+
+
+def test_quota_samples_resume_from_ledger(tmp_path):
+    """Продолжение по сохраненному журналу остается в пределах остатков"""
+    quotas = compute_quotas(AMOUNTS, 6, 3, rng=random.Random(2))
+    ledger = UsageLedger(6, 3, dict(quotas))
+    first = collect(ledger, random.Random(1), limit=2)
+    ledger.save(str(tmp_path / "ledger.json"))
+
+    resumed = UsageLedger.load(str(tmp_path / "ledger.json"))
+    rest = collect(resumed, random.Random(9))
+    assert len(first) + len(rest) == 6
+    check_samples(first + rest, AMOUNTS, 3)
+    assert all(quota == 0 for quota in resumed.quotas.values())
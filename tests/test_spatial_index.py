@@ -0,0 +1,103 @@
+import math
+import random
+
+import pytest
+
+from map_processor import _segment_hits_rect
+from spatial_index import PointGrid, RectGrid
+
+
+def random_points(rng, count, low=-200, high=600):
+    return {f"K{i}": (rng.randint(low, high), rng.randint(low, high)) for i in range(count)}
+
+
+def build_point_grid(rng, cell):
+    """Сетка после вставок, перемещений и удалений и те же точки словарем"""
+    points = random_points(rng, 300)
+    grid = PointGrid(cell)
+    grid.insert_many(points.items())
+    for key in rng.sample(sorted(points), 60):
+        if rng.random() < 0.5:
+            grid.remove(key)
+            del points[key]
+        else:
+            points[key] = (rng.randint(-300, 700), rng.randint(-300, 700))
+            grid.insert(key, *points[key])
+    return grid, points
+
+
+@pytest.mark.parametrize("cell", [8, 32, 100])
+def test_point_grid_queries_match_linear_scan(cell):
+    """nearest, in_radius и in_rect совпадают с перебором всех точек"""
+    rng = random.Random(cell)
+    grid, points = build_point_grid(rng, cell)
+    assert len(grid) == len(points)
+
+    for _ in range(200):
+        x, y = rng.uniform(-400, 800), rng.uniform(-400, 800)
+        dist = {key: math.hypot(px - x, py - y) for key, (px, py) in points.items()}
+
+        nearest = grid.nearest(x, y)
+        assert dist[nearest] == pytest.approx(min(dist.values()))
+
+        limit = rng.uniform(0, 120)
+        key = grid.nearest(x, y, max_distance=limit)
+        if min(dist.values()) <= limit:
+            assert dist[key] == pytest.approx(min(dist.values()))
+        else:
+            assert key is None
+
+        radius = rng.uniform(0, 150)
+        found = grid.in_radius(x, y, radius)
+        assert set(found) == {key for key, d in dist.items() if d <= radius}
+        assert [dist[key] for key in found] == sorted(dist[key] for key in found)
+
+        x2, y2 = x + rng.uniform(-300, 300), y + rng.uniform(-300, 300)
+        assert set(grid.in_rect(x, y, x2, y2)) == {
+            key for key, (px, py) in points.items()
+            if min(x, x2) <= px <= max(x, x2) and min(y, y2) <= py <= max(y, y2)}
+
+
+def test_point_grid_empty():
+    grid = PointGrid()
+    assert grid.nearest(0, 0) is None
+    grid.insert("A", 5, 5)
+    grid.remove("A")
+    assert grid.nearest(0, 0) is None
+
+
+def random_rect(rng):
+    x, y = rng.randint(-100, 500), rng.randint(-100, 500)
+    return (x, y, x + rng.randint(0, 150), y + rng.randint(0, 150))
+
+
+@pytest.mark.parametrize("cell", [16, 64, 256])
+def test_rect_grid_queries_match_linear_scan(cell):
+    """in_box и at_point совпадают с перебором, along_segment не теряет пересекаемых"""
+    rng = random.Random(cell)
+    grid = RectGrid(cell)
+    rects = {}
+    for i in range(200):
+        rect = random_rect(rng)
+        rects[rect] = rects.get(rect, 0) + 1
+        grid.insert(rect, rect)
+    # Повторная вставка того же ключа: удаляется вместе с последней копией
+    for rect in rng.sample(sorted(rects), 20):
+        grid.insert(rect, rect)
+        rects[rect] += 1
+    for rect in rng.sample(sorted(rects), 80):
+        grid.remove(rect)
+        rects[rect] -= 1
+        if not rects[rect]:
+            del rects[rect]
+    assert set(grid.rects) == set(rects)
+
+    for _ in range(200):
+        x1, y1, x2, y2 = (rng.uniform(-200, 700) for _ in range(4))
+        assert set(grid.in_box(x1, y1, x2, y2)) == {
+            (rx1, ry1, rx2, ry2) for rx1, ry1, rx2, ry2 in rects
+            if rx1 <= max(x1, x2) and min(x1, x2) <= rx2 and ry1 <= max(y1, y2) and min(y1, y2) <= ry2}
+        assert set(grid.at_point(x1, y1)) == {
+            rect for rect in rects if rect[0] <= x1 <= rect[2] and rect[1] <= y1 <= rect[3]}
+        hit = {rect for rect in rects if _segment_hits_rect((x1, y1, x2, y2), rect)}
+        assert hit <= set(grid.along_segment(x1, y1, x2, y2))
@@ -0,0 +1,78 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import tsp_solver
+
+
+def random_matrix(n, seed, symmetric=False):
+    rng = np.random.default_rng(seed)
+    dist = rng.integers(1, 50, size=(n, n)).astype(float)
+    if symmetric:
+        dist = np.minimum(dist, dist.T)
+    np.fill_diagonal(dist, 0)
+    return dist
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("symmetric", [False, True])
+def test_held_karp_open_path_brute_force(seed, symmetric):
+    """Путь со свободными концами: длина равна минимуму по всем перестановкам"""
+    dist = random_matrix(7, seed, symmetric)
+    order, cost = tsp_solver.held_karp_open_path(dist)
+    best = min(tsp_solver.path_cost(dist, list(p)) for p in itertools.permutations(range(7)))
+    assert sorted(order) == list(range(7))
+    assert cost == pytest.approx(best)
+    assert tsp_solver.path_cost(dist, order) == pytest.approx(cost)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_held_karp_clustered_brute_force(seed):
+    """Путь через один узел каждого кластера: минимум по выбору узлов и порядкам"""
+    dist = random_matrix(9, seed)
+    start, end = 0, 8
+    clusters = [[1, 2], [3], [4, 5, 6], [7]]
+    order, cost = tsp_solver.held_karp_clustered(dist, start, end, clusters)
+
+    best = min(
+        tsp_solver.path_cost(dist, [start] + [choice[j] for j in perm] + [end])
+        for choice in itertools.product(*clusters)
+        for perm in itertools.permutations(range(len(clusters)))
+    )
+    assert cost == pytest.approx(best)
+    assert order[0] == start and order[-1] == end
+    assert sorted(next(j for j, c in enumerate(clusters) if v in c) for v in order[1:-1]) == list(range(len(clusters)))
+    assert tsp_solver.path_cost(dist, order) == pytest.approx(cost)
+
+
+def brute_force_vrp(dist, start, end, nodes, num_routes, capacity, objective):
+    best = None
+    for assignment in itertools.product(range(num_routes), repeat=len(nodes)):
+        groups = [[v for v, r in zip(nodes, assignment) if r == k] for k in range(num_routes)]
+        if any(len(group) > capacity for group in groups):
+            continue
+        costs = [min(tsp_solver._route_cost(dist, start, end, list(p)) for p in itertools.permutations(group))
+                 for group in groups]
+        value = tsp_solver._vrp_objective(costs, objective)
+        if best is None or value < best:
+            best = value
+    return best
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("objective", ["makespan", "total"])
+@pytest.mark.parametrize("num_routes, capacity", [(2, 3), (3, 2), (2, 5)])
+def test_solve_vrp_exact_brute_force(seed, objective, num_routes, capacity):
+    """Разбиение между роботами: цель равна перебору всех назначений и порядков"""
+    dist = random_matrix(7, seed)
+    start, end = 0, 6
+    nodes = list(range(1, 6))
+    routes, costs = tsp_solver.solve_vrp_exact(dist, start, end, num_routes, capacity, objective)
+
+    assert len(routes) == num_routes
+    assert sorted(v for route in routes for v in route) == nodes
+    assert all(len(route) <= capacity for route in routes)
+    assert costs == pytest.approx([tsp_solver._route_cost(dist, start, end, route) for route in routes])
+    expected = brute_force_vrp(dist, start, end, nodes, num_routes, capacity, objective)
+    assert tsp_solver._vrp_objective(costs, objective) == pytest.approx(expected)
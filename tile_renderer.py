@@ -0,0 +1,76 @@
+import math
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+
+class TileRenderer:
+    """Тайловая отрисовка карты по пирамиде масштабов
+
+    Уровень 0 пирамиды - изображение карты, каждый следующий уменьшен вдвое. Тайл
+    TILE x TILE пикселей экрана при масштабе zoom вырезается из ближайшего уровня не
+    меньше нужного разрешения, поэтому пересэмплируется не больше чем вдвое, а стоимость
+    тайла не зависит от размера карты. Готовые тайлы хранятся в LRU-кэше; при смене
+    изображения карты создается новый TileRenderer.
+    """
+
+    TILE = 256
+
+    def __init__(self, image: Image.Image, max_tiles: int = 1024):
+        self.width, self.height = image.size
+        self.max_tiles = max_tiles
+        self.levels = [image.convert("RGB")]
+        while max(self.levels[-1].size) > self.TILE:
+            self.levels.append(self.levels[-1].reduce(2))
+        self.cache: "OrderedDict[Tuple, Image.Image]" = OrderedDict()
+
+    def display_size(self, zoom: float) -> Tuple[int, int]:
+        return max(1, int(self.width * zoom)), max(1, int(self.height * zoom))
+
+    def level_for(self, zoom: float) -> int:
+        """Самый мелкий уровень, разрешение которого не меньше нужного для zoom"""
+        if zoom >= 1:
+            return 0
+        return min(len(self.levels) - 1, int(math.floor(math.log2(1 / zoom) + 1e-9)))
+
+    def tiles_in_view(self, zoom: float, x1: float, y1: float, x2: float, y2: float) -> List[Tuple[int, int]]:
+        """Тайлы, пересекающие видимую область (координаты экрана при масштабе zoom)"""
+        width, height = self.display_size(zoom)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x1 >= x2 or y1 >= y2:
+            return []
+        return [(tx, ty)
+                for ty in range(int(y1 // self.TILE), int((y2 - 1) // self.TILE) + 1)
+                for tx in range(int(x1 // self.TILE), int((x2 - 1) // self.TILE) + 1)]
+
+    def tile_box(self, zoom: float, tx: int, ty: int) -> Tuple[int, int, int, int]:
+        """Прямоугольник тайла в координатах экрана"""
+        width, height = self.display_size(zoom)
+        return (tx * self.TILE, ty * self.TILE,
+                min((tx + 1) * self.TILE, width), min((ty + 1) * self.TILE, height))
+
+    def cached(self, zoom: float, tx: int, ty: int, resample) -> Optional[Image.Image]:
+        key = (zoom, tx, ty, resample)
+        tile = self.cache.get(key)
+        if tile is not None:
+            self.cache.move_to_end(key)
+        return tile
+
+    def render(self, zoom: float, tx: int, ty: int, resample) -> Image.Image:
+        """Отрисовка тайла без кэша (только читает пирамиду - можно вызывать из фонового потока)"""
+        level = self.level_for(zoom)
+        source = self.levels[level]
+        factor = 2 ** level
+        x1, y1, x2, y2 = self.tile_box(zoom, tx, ty)
+        # Координаты тайла на уровне пирамиды (дробные - resize учитывает их точно)
+        box = (x1 / zoom / factor, y1 / zoom / factor,
+               min(source.width, x2 / zoom / factor), min(source.height, y2 / zoom / factor))
+        return source.resize((x2 - x1, y2 - y1), resample, box=box)
+
+    def store(self, zoom: float, tx: int, ty: int, resample, tile: Image.Image):
+        self.cache[(zoom, tx, ty, resample)] = tile
+        self.cache.move_to_end((zoom, tx, ty, resample))
+        if len(self.cache) > self.max_tiles:
+            self.cache.popitem(last=False)
@@ -0,0 +1,649 @@
+import random
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Порядок обхода хранится как список индексов узлов матрицы расстояний,
+# первый и последний элементы - закрепленные старт и финиш.
+# Все функции рассчитаны на симметричную матрицу расстояний.
+
+EPS = 1e-9
+
+
+def path_cost(dist: np.ndarray, order: List[int]) -> float:
+    """Длина пути по матрице расстояний"""
+    if len(order) < 2:
+        return 0.0
+    idx = np.asarray(order)
+    return float(dist[idx[:-1], idx[1:]].sum())
+
+
+def nearest_neighbor_path(dist: np.ndarray, start: int, end: int) -> List[int]:
+    """Построение пути жадным алгоритмом ближайшего соседа"""
+    n = dist.shape[0]
+    remaining = np.ones(n, dtype=bool)
+    remaining[start] = False
+    remaining[end] = False
+
+    order = [start]
+    current = start
+    for _ in range(int(remaining.sum())):
+        candidates = np.where(remaining, dist[current], np.inf)
+        current = int(np.argmin(candidates))
+        remaining[current] = False
+        order.append(current)
+
+    if n > 1 or end != start:
+        order.append(end)
+    return order
+
+
+def two_opt_path(dist: np.ndarray, order: List[int], deadline: Optional[float] = None,
+                 strategy: str = "first") -> List[int]:
+    """Улучшение пути методом 2-opt (разворот участков)
+
+    strategy="first" - применяется лучший разворот для первой вершины, где он найден,
+    strategy="best" - за проход применяется лучший разворот по всей окрестности.
+    """
+    order = list(order)
+    n = len(order)
+    if n < 4:
+        return order
+
+    improved = True
+    while improved:
+        improved = False
+        arr = np.asarray(order)
+        edges = dist[arr[:-1], arr[1:]]
+        best_move = None
+        best_delta = -EPS
+
+        for i in range(1, n - 2):
+            if deadline is not None and time.perf_counter() > deadline:
+                return order
+
+            # Разворот order[i..j]: ребра (i-1, i) и (j, j+1) заменяются на (i-1, j) и (i, j+1)
+            a, b = arr[i - 1], arr[i]
+            js = arr[i + 1:n - 1]
+            nexts = arr[i + 2:n]
+            deltas = dist[a, js] + dist[b, nexts] - edges[i - 1] - edges[i + 1:n - 1]
+
+            k = int(np.argmin(deltas))
+            if deltas[k] < best_delta:
+                best_delta = deltas[k]
+                best_move = (i, i + 1 + k)
+                if strategy == "first":
+                    break
+
+        if best_move is not None:
+            i, j = best_move
+            order[i:j + 1] = order[i:j + 1][::-1]
+            improved = True
+
+    return order
+
+
+def or_opt_path(dist: np.ndarray, order: List[int], deadline: Optional[float] = None,
+                max_segment: int = 3) -> List[int]:
+    """Улучшение пути методом Or-opt (перенос участков из 1-3 вершин)
+
+    Для каждой длины участка приросты всех пар (участок, ребро вставки) считаются
+    одной матрицей; применяется первый улучшающий участок с лучшим местом вставки.
+    """
+    order = list(order)
+    n = len(order)
+    if n < 4:
+        return order
+
+    improved = True
+    while improved:
+        improved = False
+        if deadline is not None and time.perf_counter() > deadline:
+            return order
+
+        arr = np.asarray(order)
+        left, right = arr[:-1], arr[1:]
+        base = dist[left, right]
+        edge_idx = np.arange(n - 1)
+
+        for seg_len in range(1, max_segment + 1):
+            starts = np.arange(1, n - seg_len)
+            if len(starts) == 0:
+                break
+            first, last = arr[starts], arr[starts + seg_len - 1]
+            prev_node, next_node = arr[starts - 1], arr[starts + seg_len]
+            gain = dist[prev_node, first] + dist[last, next_node] - dist[prev_node, next_node]
+
+            forward = dist[left[None, :], first[:, None]] + dist[last[:, None], right[None, :]] - base
+            backward = dist[left[None, :], last[:, None]] + dist[first[:, None], right[None, :]] - base
+            # Ребра, касающиеся участка, и вставка на прежнее место не являются ходами
+            touching = (edge_idx[None, :] >= starts[:, None] - 1) & (edge_idx[None, :] < starts[:, None] + seg_len)
+            forward[touching] = np.inf
+            backward[touching] = np.inf
+
+            k_fwd = np.argmin(forward, axis=1)
+            k_bwd = np.argmin(backward, axis=1)
+            rows = np.arange(len(starts))
+            best_fwd = forward[rows, k_fwd]
+            best_bwd = backward[rows, k_bwd]
+            add = np.minimum(best_fwd, best_bwd)
+            candidates = np.flatnonzero(add - gain < -EPS)
+            if len(candidates) == 0:
+                continue
+
+            row = int(candidates[0])
+            i = int(starts[row])
+            reverse = best_fwd[row] > best_bwd[row]
+            k = int(k_bwd[row] if reverse else k_fwd[row])
+            segment = order[i:i + seg_len]
+            moved = segment[::-1] if reverse else segment
+            # Вставка после order[k]: k вне участка, так что индексы до участка не сдвигаются
+            if k < i:
+                order = order[:k + 1] + moved + order[k + 1:i] + order[i + seg_len:]
+            else:
+                order = order[:i] + order[i + seg_len:k + 1] + moved + order[k + 1:]
+            improved = True
+            break
+
+    return order
+
+
+def improve_open_path(dist: np.ndarray, order: List[int], strategy: str = "first",
+                      deadline: Optional[float] = None) -> List[int]:
+    """2-opt и Or-opt для пути со свободными концами до локального минимума
+
+    Добавляется фиктивная вершина на нулевом расстоянии от всех остальных; путь
+    от нее к ней же содержит все концы исходного пути, поэтому ходы могут менять
+    и первую, и последнюю вершину.
+    """
+    n = len(order)
+    if n < 3:
+        return list(order)
+
+    padded = np.zeros((len(dist) + 1, len(dist) + 1))
+    padded[:-1, :-1] = dist
+    dummy = len(dist)
+    route = [dummy] + list(order) + [dummy]
+
+    while True:
+        cost = path_cost(padded, route)
+        route = two_opt_path(padded, route, deadline, strategy)
+        route = or_opt_path(padded, route, deadline)
+        if path_cost(padded, route) >= cost - EPS:
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+
+    return route[1:-1]
+
+
+def double_bridge(order: List[int], rng: random.Random) -> List[int]:
+    """Возмущение double-bridge: участки A B C D переставляются в A C B D"""
+    n = len(order)
+    if n < 5:
+        return list(order)
+    a, b, c = sorted(rng.sample(range(1, n - 1), 3))
+    return order[:a] + order[b:c] + order[a:b] + order[c:]
+
+
+def solve_path_anytime(dist: np.ndarray, start: int, end: int, time_budget: float,
+                       seed: Optional[int] = None,
+                       trace: Optional[List[Tuple[float, float]]] = None) -> Tuple[List[int], float]:
+    """Anytime-решатель: построение, 2-opt/Or-opt, затем итеративный локальный поиск
+    с возмущениями double-bridge до исчерпания бюджета времени
+
+    Возвращает лучший найденный порядок и его длину. Если передан список trace,
+    в него добавляются пары (прошедшее время, длина) при каждом улучшении.
+    """
+    begin = time.perf_counter()
+    deadline = begin + max(time_budget, 0.0)
+    rng = random.Random(seed)
+
+    def record(cost):
+        if trace is not None:
+            trace.append((time.perf_counter() - begin, cost))
+
+    best = nearest_neighbor_path(dist, start, end)
+    best_cost = path_cost(dist, best)
+    record(best_cost)
+
+    def polish(order):
+        order = two_opt_path(dist, order, deadline)
+        return or_opt_path(dist, order, deadline)
+
+    candidate = polish(best)
+    candidate_cost = path_cost(dist, candidate)
+    if candidate_cost < best_cost - EPS:
+        best, best_cost = candidate, candidate_cost
+        record(best_cost)
+
+    # Итеративный локальный поиск: возмущение лучшего решения и доводка
+    while time.perf_counter() < deadline and len(best) >= 5:
+        candidate = polish(double_bridge(best, rng))
+        candidate_cost = path_cost(dist, candidate)
+        if candidate_cost < best_cost - EPS:
+            best, best_cost = candidate, candidate_cost
+            record(best_cost)
+
+    return best, best_cost
+
+
+def _held_karp_dp(dist: np.ndarray, start: Optional[int], nodes: List[int]) -> np.ndarray:
+    """Таблица динамики Хелда-Карпа: dp[mask, j] - кратчайший путь из start
+    через узлы mask с окончанием в nodes[j] (без start - путь начинается в любом узле)"""
+    n = len(nodes)
+    idx = np.asarray(nodes)
+    inner = dist[np.ix_(idx, idx)]
+    dp = np.full((1 << n, n), np.inf)
+    for j in range(n):
+        dp[1 << j, j] = dist[start, nodes[j]] if start is not None else 0.0
+
+    masks = np.arange(1 << n)
+    popcount = np.zeros(1 << n, dtype=int)
+    for j in range(n):
+        popcount += (masks >> j) & 1
+
+    for size in range(2, n + 1):
+        level = masks[popcount == size]
+        for j in range(n):
+            sel = level[(level >> j) & 1 == 1]
+            prev = sel ^ (1 << j)
+            dp[sel, j] = (dp[prev] + inner[:, j]).min(axis=1)
+    return dp
+
+
+def _held_karp_backtrack(dp: np.ndarray, dist: np.ndarray, nodes: List[int],
+                         mask: int, last: int) -> List[int]:
+    """Восстановление порядка узлов по таблице Хелда-Карпа"""
+    idx = np.asarray(nodes)
+    order = []
+    while True:
+        order.append(nodes[last])
+        prev_mask = mask ^ (1 << last)
+        if prev_mask == 0:
+            break
+        candidates = dp[prev_mask] + dist[idx, nodes[last]]
+        last = int(np.argmin(candidates))
+        mask = prev_mask
+    return order[::-1]
+
+
+def subset_path_costs(dist: np.ndarray, start: int, end: int,
+                      nodes: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Длины оптимальных путей start -> подмножество nodes -> end для всех подмножеств"""
+    n = len(nodes)
+    costs = np.zeros(1 << n)
+    if n == 0:
+        return costs, np.zeros((1, 0))
+    dp = _held_karp_dp(dist, start, nodes)
+    costs[1:] = (dp[1:] + dist[np.asarray(nodes), end]).min(axis=1)
+    return costs, dp
+
+
+def held_karp_path(dist: np.ndarray, start: int, end: int) -> Tuple[List[int], float]:
+    """Точное решение задачи о пути start -> все узлы -> end динамикой Хелда-Карпа"""
+    nodes = [i for i in range(dist.shape[0]) if i not in (start, end)]
+    if not nodes:
+        order = [start, end] if end != start else [start]
+        return order, path_cost(dist, order)
+
+    full = (1 << len(nodes)) - 1
+    dp = _held_karp_dp(dist, start, nodes)
+    totals = dp[full] + dist[np.asarray(nodes), end]
+    last = int(np.argmin(totals))
+    order = [start] + _held_karp_backtrack(dp, dist, nodes, full, last) + [end]
+    return order, float(totals[last])
+
+
+HELD_KARP_LIMIT = 12
+# Путь без фиксированных концов: 2^16 * 16 состояний считаются за доли секунды
+OPEN_PATH_EXACT_LIMIT = 16
+
+
+def held_karp_open_path(dist: np.ndarray) -> Tuple[List[int], float]:
+    """Точный кратчайший путь через все узлы со свободными началом и концом"""
+    nodes = list(range(dist.shape[0]))
+    if len(nodes) <= 1:
+        return nodes, 0.0
+
+    full = (1 << len(nodes)) - 1
+    dp = _held_karp_dp(dist, None, nodes)
+    last = int(np.argmin(dp[full]))
+    return _held_karp_backtrack(dp, dist, nodes, full, last), float(dp[full, last])
+
+
+def solve_path(dist: np.ndarray, start: int, end: int, time_budget: float = 0.1,
+               seed: Optional[int] = None) -> Tuple[List[int], float]:
+    """Точное решение для небольшого числа узлов, иначе anytime-решатель"""
+    if dist.shape[0] - 2 <= HELD_KARP_LIMIT:
+        return held_karp_path(dist, start, end)
+    return solve_path_anytime(dist, start, end, time_budget, seed=seed)
+
+
+# Многороботная маршрутизация (VRP): маршрут задается списком узлов без старта и финиша,
+# пустой маршрут означает, что робот не выезжает, и стоит 0.
+
+VRP_EXACT_LIMIT = HELD_KARP_LIMIT
+
+
+def _route_cost(dist: np.ndarray, start: int, end: int, route: List[int]) -> float:
+    if not route:
+        return 0.0
+    return path_cost(dist, [start] + list(route) + [end])
+
+
+def _vrp_objective(costs: List[float], objective: str) -> Tuple[float, float]:
+    """Значение цели: makespan сравнивается по максимуму, затем по сумме"""
+    total = float(sum(costs))
+    if objective == "makespan":
+        return (max(costs) if costs else 0.0, total)
+    return (total, max(costs) if costs else 0.0)
+
+
+def solve_vrp_exact(dist: np.ndarray, start: int, end: int, num_routes: int, capacity: int,
+                    objective: str = "makespan") -> Tuple[List[List[int]], List[float]]:
+    """Точное разбиение узлов между роботами: Хелд-Карп по подмножествам + динамика по разбиениям"""
+    nodes = [i for i in range(dist.shape[0]) if i not in (start, end)]
+    n = len(nodes)
+    costs, dp = subset_path_costs(dist, start, end, nodes)
+    full = (1 << n) - 1
+
+    sizes = np.zeros(1 << n, dtype=int)
+    for j in range(n):
+        sizes += (np.arange(1 << n) >> j) & 1
+    costs = costs.tolist()
+    fits = (sizes <= capacity).tolist()
+
+    def combine(value, cost):
+        # Значения - пары в порядке сравнения _vrp_objective
+        if objective == "makespan":
+            return (max(value[0], cost), value[1] + cost)
+        return (value[0] + cost, max(value[1], cost))
+
+    inf = (float('inf'), float('inf'))
+    # best[k][mask] - лучшее покрытие mask не более чем k маршрутами
+    best = [[(0.0, 0.0)] + [inf] * full]
+    choice = [[0] * (full + 1)]
+    for k in range(1, num_routes + 1):
+        prev = best[-1]
+        current = prev[:]
+        chosen = [0] * (full + 1)
+        for mask in range(1, full + 1):
+            low = mask & -mask
+            rest = mask ^ low
+            sub = rest
+            # Перебираем подмножества mask, содержащие младший бит
+            while True:
+                part = sub | low
+                if fits[part] and prev[mask ^ part] != inf:
+                    value = combine(prev[mask ^ part], costs[part])
+                    if value < current[mask]:
+                        current[mask] = value
+                        chosen[mask] = part
+                if sub == 0:
+                    break
+                sub = (sub - 1) & rest
+        best.append(current)
+        choice.append(chosen)
+
+    if best[num_routes][full] == inf:
+        raise ValueError("Нет допустимого разбиения при заданной вместимости")
+
+    routes = []
+    mask, k = full, num_routes
+    while mask:
+        part = choice[k][mask]
+        if part == 0:
+            k -= 1
+            continue
+        # dp общей динамики годится и для подмножеств: старт тот же
+        members = [j for j in range(n) if part >> j & 1]
+        last = min(members, key=lambda j: dp[part, j] + dist[nodes[j], end])
+        routes.append(_held_karp_backtrack(dp, dist, nodes, part, last))
+        mask ^= part
+        k -= 1
+
+    while len(routes) < num_routes:
+        routes.append([])
+    return routes, [_route_cost(dist, start, end, r) for r in routes]
+
+
+def split_path(dist: np.ndarray, start: int, end: int, giant: List[int], num_routes: int,
+               capacity: int, objective: str = "makespan") -> List[List[int]]:
+    """Оптимальная нарезка общего порядка обхода на не более чем num_routes маршрутов (split Принса)"""
+    n = len(giant)
+    if n == 0:
+        return [[] for _ in range(num_routes)]
+
+    idx = np.asarray(giant)
+    legs = np.concatenate([[0.0], np.cumsum(dist[idx[:-1], idx[1:]])])
+    from_start = dist[start, idx]
+    to_end = dist[idx, end]
+
+    def chunk_cost(i, j):
+        # Маршрут из узлов giant[i:j]
+        return from_start[i] + legs[j - 1] - legs[i] + to_end[j - 1]
+
+    def combine(a, b):
+        return max(a, b) if objective == "makespan" else a + b
+
+    inf = float('inf')
+    best = [[inf] * (n + 1) for _ in range(num_routes + 1)]
+    cut = [[0] * (n + 1) for _ in range(num_routes + 1)]
+    best[0][0] = 0.0
+    for k in range(1, num_routes + 1):
+        best[k][0] = 0.0
+        for j in range(1, n + 1):
+            for i in range(max(0, j - capacity), j):
+                if best[k - 1][i] == inf:
+                    continue
+                value = combine(best[k - 1][i], chunk_cost(i, j))
+                if value < best[k][j]:
+                    best[k][j] = value
+                    cut[k][j] = i
+
+    if best[num_routes][n] == inf:
+        raise ValueError("Нет допустимого разбиения при заданной вместимости")
+
+    routes = []
+    j, k = n, num_routes
+    while j > 0:
+        i = cut[k][j]
+        routes.append(list(giant[i:j]))
+        j, k = i, k - 1
+    routes.reverse()
+    while len(routes) < num_routes:
+        routes.append([])
+    return routes
+
+
+def _improve_route(dist: np.ndarray, start: int, end: int, route: List[int],
+                   deadline: Optional[float]) -> List[int]:
+    if len(route) < 2:
+        return route
+    order = [start] + route + [end]
+    order = or_opt_path(dist, two_opt_path(dist, order, deadline), deadline)
+    return order[1:-1]
+
+
+def _relocate_pass(dist: np.ndarray, start: int, end: int, routes: List[List[int]],
+                   capacity: int, objective: str, deadline: float) -> Optional[Tuple[int, int]]:
+    """Один лучший перенос узла в другой маршрут (с дешевейшей вставкой).
+    Возвращает номера измененных маршрутов или None"""
+    costs = [_route_cost(dist, start, end, r) for r in routes]
+    current = _vrp_objective(costs, objective)
+    best_value, best_move = current, None
+
+    for a, route_a in enumerate(routes):
+        if objective == "makespan" and costs[a] < current[0] and len(routes) > 1:
+            # Для makespan имеет смысл разгружать только самый длинный маршрут
+            continue
+        full_a = [start] + route_a + [end]
+        for pos in range(1, len(full_a) - 1):
+            if time.perf_counter() > deadline:
+                return None
+            node = full_a[pos]
+            removed = costs[a] - (dist[full_a[pos - 1], node] + dist[node, full_a[pos + 1]]
+                                  - dist[full_a[pos - 1], full_a[pos + 1]])
+            if len(route_a) == 1:
+                removed = 0.0
+            for b, route_b in enumerate(routes):
+                if b == a or len(route_b) >= capacity:
+                    continue
+                full_b = np.asarray([start] + route_b + [end])
+                if route_b:
+                    inserts = dist[full_b[:-1], node] + dist[node, full_b[1:]] - dist[full_b[:-1], full_b[1:]]
+                    k = int(np.argmin(inserts))
+                    added = costs[b] + inserts[k]
+                else:
+                    k, added = 0, dist[start, node] + dist[node, end]
+                trial = costs[:]
+                trial[a], trial[b] = removed, added
+                value = _vrp_objective(trial, objective)
+                if value < best_value:
+                    best_value, best_move = value, (a, pos - 1, b, k)
+
+    if best_move is None:
+        return None
+    a, pos, b, k = best_move
+    node = routes[a].pop(pos)
+    routes[b].insert(k, node)
+    return a, b
+
+
+def solve_vrp_heuristic(dist: np.ndarray, start: int, end: int, num_routes: int, capacity: int,
+                        objective: str = "makespan", time_budget: float = 2.0,
+                        seed: Optional[int] = None) -> Tuple[List[List[int]], List[float]]:
+    """Эвристика VRP: общий маршрут anytime-решателем, оптимальная нарезка,
+    переносы узлов между маршрутами с доводкой каждого маршрута;
+    оставшееся время - перезапуски от возмущенного общего маршрута"""
+    begin = time.perf_counter()
+    deadline = begin + max(time_budget, 0.0)
+    rng = random.Random(seed)
+
+    giant, _ = solve_path_anytime(dist, start, end, time_budget * 0.3, seed=seed)
+    best_routes, best_value = None, None
+
+    while best_routes is None or time.perf_counter() < deadline:
+        candidate = giant if best_routes is None else double_bridge(giant, rng)
+        routes = split_path(dist, start, end, candidate[1:-1], num_routes, capacity, objective)
+        routes = [_improve_route(dist, start, end, r, deadline) for r in routes]
+
+        while time.perf_counter() < deadline:
+            changed = _relocate_pass(dist, start, end, routes, capacity, objective, deadline)
+            if changed is None:
+                break
+            for r in changed:
+                routes[r] = _improve_route(dist, start, end, routes[r], deadline)
+
+        value = _vrp_objective([_route_cost(dist, start, end, r) for r in routes], objective)
+        if best_value is None or value < best_value:
+            best_routes, best_value = routes, value
+
+    return best_routes, [_route_cost(dist, start, end, r) for r in best_routes]
+
+
+# Обобщенная задача (GTSP): узлы сгруппированы в кластеры (варианты точки доступа
+# одного товара), из каждого кластера посещается ровно один узел.
+
+def held_karp_clustered(dist: np.ndarray, start: int, end: int,
+                        clusters: List[List[int]]) -> Tuple[List[int], float]:
+    """Точное решение GTSP-пути динамикой Хелда-Карпа по маскам кластеров"""
+    n = len(clusters)
+    if n == 0:
+        return [start, end], float(dist[start, end])
+
+    nodes = [v for cluster in clusters for v in cluster]
+    owner = [j for j, cluster in enumerate(clusters) for _ in cluster]
+    idx = np.asarray(nodes)
+    inner = dist[np.ix_(idx, idx)]
+
+    dp = np.full((1 << n, len(nodes)), np.inf)
+    for k, v in enumerate(nodes):
+        dp[1 << owner[k], k] = dist[start, v]
+
+    masks = np.arange(1 << n)
+    popcount = np.zeros(1 << n, dtype=int)
+    for j in range(n):
+        popcount += (masks >> j) & 1
+
+    for size in range(2, n + 1):
+        level = masks[popcount == size]
+        for k in range(len(nodes)):
+            j = owner[k]
+            sel = level[(level >> j) & 1 == 1]
+            prev = sel ^ (1 << j)
+            dp[sel, k] = (dp[prev] + inner[:, k]).min(axis=1)
+
+    full = (1 << n) - 1
+    totals = dp[full] + dist[idx, end]
+    k = int(np.argmin(totals))
+    cost = float(totals[k])
+
+    order = []
+    mask = full
+    while True:
+        order.append(nodes[k])
+        prev_mask = mask ^ (1 << owner[k])
+        if prev_mask == 0:
+            break
+        k = int(np.argmin(dp[prev_mask] + inner[:, k]))
+        mask = prev_mask
+    return [start] + order[::-1] + [end], cost
+
+
+def choose_cluster_nodes(dist: np.ndarray, start: int, end: int,
+                         clusters: List[List[int]]) -> Tuple[List[int], float]:
+    """Оптимальный выбор узла в каждом кластере при фиксированном порядке кластеров"""
+    if not clusters:
+        return [start, end], float(dist[start, end])
+
+    cost = dist[start, np.asarray(clusters[0])]
+    back = []
+    for prev_cluster, cluster in zip(clusters, clusters[1:]):
+        trans = cost[:, None] + dist[np.ix_(prev_cluster, cluster)]
+        back.append(trans.argmin(axis=0))
+        cost = trans.min(axis=0)
+
+    totals = cost + dist[np.asarray(clusters[-1]), end]
+    k = int(np.argmin(totals))
+    chosen = [clusters[-1][k]]
+    for step in range(len(back) - 1, -1, -1):
+        k = int(back[step][k])
+        chosen.append(clusters[step][k])
+    return [start] + chosen[::-1] + [end], float(totals.min())
+
+
+def solve_clustered_path(dist: np.ndarray, start: int, end: int, clusters: List[List[int]],
+                         time_budget: float = 1.0,
+                         seed: Optional[int] = None) -> Tuple[List[int], float]:
+    """GTSP-путь: точно для небольшого числа кластеров, иначе чередование
+    оптимизации порядка (anytime) и выбора узлов в кластерах"""
+    if len(clusters) <= HELD_KARP_LIMIT:
+        return held_karp_clustered(dist, start, end, clusters)
+
+    deadline = time.perf_counter() + max(time_budget, 0.0)
+    node_cluster = {v: j for j, cluster in enumerate(clusters) for v in cluster}
+    chosen = [cluster[0] for cluster in clusters]
+    best_order, best_cost = None, float('inf')
+
+    while True:
+        sub_nodes = [start] + chosen + [end]
+        sub = dist[np.ix_(sub_nodes, sub_nodes)]
+        remaining = deadline - time.perf_counter()
+        sub_order, _ = solve_path_anytime(sub, 0, len(sub_nodes) - 1, remaining / 2, seed=seed)
+        cluster_order = [clusters[i - 1] for i in sub_order[1:-1]]
+
+        order, cost = choose_cluster_nodes(dist, start, end, cluster_order)
+        if cost >= best_cost - EPS:
+            break
+        best_order, best_cost = order, cost
+
+        chosen = [None] * len(clusters)
+        for v in order[1:-1]:
+            chosen[node_cluster[v]] = v
+        if time.perf_counter() >= deadline:
+            break
+
+    return best_order, best_cost